@@ -0,0 +1,248 @@
+"""
+Per-column statistics computed while an upload is written.
+Each record batch is fed to a TableProfiler before it is discarded, so the
+profile (null counts, min/max, approximate distinct counts and quantiles)
+costs no extra pass over the data. The sketches are mergeable and small,
+and are stored alongside the upload so a profile is served without
+touching the Parquet file.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Quantiles reported for numeric columns
+PROFILE_QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+_GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads integer bit patterns over all 64 bits."""
+    z = values.astype(np.uint64, copy=True)
+    z += _GOLDEN_GAMMA
+    z = (z ^ (z >> np.uint64(30))) * _MIX_1
+    z = (z ^ (z >> np.uint64(27))) * _MIX_2
+    return z ^ (z >> np.uint64(31))
+
+
+def hash_array(array: pa.Array) -> np.ndarray:
+    """
+    64-bit hashes of the non-null values of an Arrow array.
+    Fixed-width values are hashed from their bit patterns without leaving
+    numpy; anything else goes through pandas' vectorized object hashing.
+    """
+    array = array.drop_null()
+    if len(array) == 0:
+        return np.empty(0, dtype=np.uint64)
+
+    if pa.types.is_dictionary(array.type):
+        array = array.dictionary_decode()
+
+    if pa.types.is_floating(array.type):
+        values = array.cast(pa.float64()).to_numpy()
+        # +0.0 and -0.0 are the same value
+        return _mix64((values + 0.0).view(np.uint64))
+
+    if pa.types.is_boolean(array.type):
+        return _mix64(array.to_numpy(zero_copy_only=False).astype(np.uint64))
+
+    if (pa.types.is_integer(array.type) or pa.types.is_temporal(array.type)) and array.type.bit_width <= 64:
+        values = array.to_numpy(zero_copy_only=False)
+        if values.dtype.kind in "mM":
+            values = values.view(np.int64)
+        return _mix64(values.astype(np.int64).view(np.uint64))
+
+    objects = np.asarray(array.to_pylist(), dtype=object)
+    return pd.util.hash_array(objects, categorize=False)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct-count sketch over 64-bit hashes.
+    2^precision one-byte registers; relative error is about
+    1.04 / sqrt(2^precision) (1.6% at the default precision of 12).
+    """
+
+    def __init__(self, precision: int = 12, registers: bytes = None):
+        self.precision = precision
+        self.m = 1 << precision
+        if registers is None:
+            self.registers = np.zeros(self.m, dtype=np.uint8)
+        else:
+            self.registers = np.frombuffer(registers, dtype=np.uint8).copy()
+
+    def add_hashes(self, hashes: np.ndarray):
+        if len(hashes) == 0:
+            return
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.intp)
+        # Remaining bits, with a sentinel so the rank is bounded
+        rest = (hashes << p) | (np.uint64(1) << (p - np.uint64(1)))
+        rank = (64 - np.floor(np.log2(rest.astype(np.float64)))).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = self.m
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int32)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction (linear counting)
+            return int(round(m * math.log(m / zeros)))
+        return int(round(raw))
+
+    def to_bytes(self) -> bytes:
+        return self.registers.tobytes()
+
+
+class QuantileSketch:
+    """
+    KLL-style quantile sketch for numeric values.
+    Level i holds items of weight 2^i; a level that grows past k is sorted
+    and every other item (from a random offset) is promoted to the next
+    level. Memory stays around k * log2(n / k) items.
+    """
+
+    def __init__(self, k: int = 256, seed: int = 0):
+        self.k = k
+        self.count = 0
+        self._levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, values: np.ndarray):
+        if len(values) == 0:
+            return
+        self.count += len(values)
+        self._levels[0] = np.concatenate([self._levels[0], values])
+        self._compact()
+
+    def _compact(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) > self.k:
+                items = np.sort(items)
+                # Keep one item of an odd tail at this level
+                carry, items = items[len(items) - len(items) % 2:], items[:len(items) - len(items) % 2]
+                promoted = items[self._rng.integers(2)::2]
+                self._levels[level] = carry
+                if level + 1 == len(self._levels):
+                    self._levels.append(np.empty(0))
+                self._levels[level + 1] = np.concatenate([self._levels[level + 1], promoted])
+            level += 1
+
+    def quantiles(self, fractions) -> list:
+        """Approximate values at each fraction in [0, 1], or Nones if empty."""
+        if self.count == 0:
+            return [None] * len(fractions)
+        items = np.concatenate(self._levels)
+        weights = np.concatenate([
+            np.full(len(level), 2.0 ** i) for i, level in enumerate(self._levels)
+        ])
+        order = np.argsort(items, kind="stable")
+        items, cumulative = items[order], np.cumsum(weights[order])
+        positions = np.searchsorted(cumulative, np.asarray(fractions) * cumulative[-1], side="left")
+        return [float(items[min(i, len(items) - 1)]) for i in positions]
+
+
+def _scalar(value: pa.Scalar):
+    """JSON-friendly Python value of an Arrow scalar."""
+    value = value.as_py()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return value.decode("latin-1")
+    return str(value)
+
+
+class ColumnProfiler:
+    """Accumulates the statistics of one column across record batches."""
+
+    def __init__(self, name: str, data_type: pa.DataType):
+        self.name = name
+        self.data_type = data_type
+        self.numeric = pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+        self.row_count = 0
+        self.null_count = 0
+        self.min = None
+        self.max = None
+        self.distinct = HyperLogLog()
+        self.quantiles = QuantileSketch() if self.numeric else None
+
+    def update(self, array):
+        if isinstance(array, pa.ChunkedArray):
+            array = array.combine_chunks()
+        if pa.types.is_dictionary(array.type):
+            # min_max works on the values, not the indices
+            array = array.dictionary_decode()
+        self.row_count += len(array)
+        self.null_count += array.null_count
+        if pa.types.is_null(array.type) or array.null_count == len(array):
+            return
+
+        extremes = pc.min_max(array)
+        low, high = extremes["min"], extremes["max"]
+        if low.is_valid:
+            self.min = low if self.min is None or pc.less(low, self.min).as_py() else self.min
+        if high.is_valid:
+            self.max = high if self.max is None or pc.greater(high, self.max).as_py() else self.max
+
+        self.distinct.add_hashes(hash_array(array))
+
+        if self.quantiles is not None:
+            values = array.drop_null().cast(pa.float64()).to_numpy()
+            self.quantiles.add(values[~np.isnan(values)])
+
+    def result(self) -> dict:
+        quantiles = None
+        if self.quantiles is not None and self.quantiles.count:
+            quantiles = {
+                f"p{round(q * 100):02d}": value
+                for q, value in zip(PROFILE_QUANTILES, self.quantiles.quantiles(PROFILE_QUANTILES))
+            }
+        distinct = 0 if self.null_count == self.row_count else self.distinct.estimate()
+        return {
+            "name": self.name,
+            "dtype": str(self.data_type),
+            "null_count": self.null_count,
+            "min": None if self.min is None else _scalar(self.min),
+            "max": None if self.max is None else _scalar(self.max),
+            # The sketch overestimates slightly at times; never report
+            # more distinct values than non-null rows
+            "distinct_count": min(distinct, self.row_count - self.null_count),
+            "distinct_sketch": self.distinct.to_bytes(),
+            "quantiles": quantiles,
+        }
+
+
+class TableProfiler:
+    """
+    Profiles every column of a stream of record batches.
+
+    Usage:
+        profiler = TableProfiler(schema)
+        for batch in batches:
+            profiler.update(batch)
+        stats = profiler.result()
+    """
+
+    def __init__(self, schema: pa.Schema):
+        self.columns = [ColumnProfiler(field.name, field.type) for field in schema]
+
+    def update(self, batch: pa.RecordBatch):
+        for profiler, array in zip(self.columns, batch.columns):
+            profiler.update(array)
+
+    def result(self) -> list:
+        """Per-column statistics, in schema order."""
+        return [profiler.result() for profiler in self.columns]
@@ -0,0 +1,484 @@
+"""
+CSV parsing engines for ingest.
+The encoding and column types are worked out once, from a sample at the
+start of the file; an engine then streams the whole file as Arrow record
+batches with those types. Types inferred from the sample are only hints:
+those columns are read as text and converted batch by batch, and a value
+that doesn't fit its column's type widens the column from that batch on
+(widen_type) instead of failing the parse. Bytes that aren't valid UTF-8
+in a file sampled as UTF-8 are decoded as latin-1 where they occur.
+
+Engines:
+    pyarrow: pyarrow's multithreaded streaming CSV reader (default)
+    duckdb: DuckDB's parallel read_csv; reads from a path
+"""
+
+import codecs
+import io
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+from upload_queries import duckdb_type, quote_identifier, record_batch_reader
+
+# Bytes read from the start (and end) of a file to sniff it
+DEFAULT_SAMPLE_BYTES = 1024 * 1024
+# Sampled string columns with at most this share of distinct values are
+# dictionary-encoded
+DICTIONARY_MAX_RATIO = 0.5
+
+ENGINES = ("pyarrow", "duckdb")
+
+# Text read as null in columns converted from text, as pyarrow's reader does
+_NULL_VALUES = pa.array(pacsv.ConvertOptions().null_values)
+
+# Codec error handler decoding bytes that aren't valid UTF-8 as latin-1
+_LATIN1_FALLBACK = "latin-1-fallback"
+codecs.register_error(
+    _LATIN1_FALLBACK,
+    lambda error: (error.object[error.start:error.end].decode("latin-1"), error.end),
+)
+
+# Extra names accepted in dtype overrides, besides pyarrow's type aliases
+_TYPE_ALIASES = {
+    "dictionary": pa.dictionary(pa.int32(), pa.string()),
+    "category": pa.dictionary(pa.int32(), pa.string()),
+    "int": pa.int64(),
+    "float": pa.float64(),
+    "str": pa.string(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("us"),
+    "datetime": pa.timestamp("us"),
+}
+
+
+class EmptyCSVError(ValueError):
+    """Raised when the uploaded CSV has no header or data."""
+
+
+class CSVParseError(ValueError):
+    """Raised when the CSV cannot be parsed or converted."""
+
+
+class Utf8Fallback(io.RawIOBase):
+    """
+    Read-only view of a binary stream as valid UTF-8: bytes that aren't
+    valid UTF-8 are decoded as latin-1 on the way through, so a stray
+    latin-1 byte the sample missed doesn't fail the parse. Valid input
+    passes through as it is.
+    """
+
+    def __init__(self, source, chunk_size: int = 1024 * 1024):
+        self._source = source
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+        # Bytes of a character cut off at the end of the last read
+        self._partial = b""
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self._buffer) < len(buffer) and not self._eof:
+            chunk = self._source.read(max(self._chunk_size, len(buffer)))
+            self._eof = not chunk
+            data = self._partial + chunk
+            if data.isascii():
+                self._buffer += data
+                self._partial = b""
+                continue
+            try:
+                _, consumed = codecs.utf_8_decode(data, "strict", self._eof)
+                self._buffer += memoryview(data)[:consumed]
+            except UnicodeDecodeError:
+                text, consumed = codecs.utf_8_decode(data, _LATIN1_FALLBACK, self._eof)
+                self._buffer += text.encode()
+            self._partial = data[consumed:]
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        del self._buffer[:size]
+        return size
+
+
+def normalize_column_names(names):
+    """
+    Give blank and duplicate headers unique names, the same way pandas does
+    ("Unnamed: 3", "price.1"), so existing schemas keep their shape.
+    """
+    normalized = []
+    seen = {}
+    for i, name in enumerate(names):
+        name = name if name.strip() else f"Unnamed: {i}"
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen.setdefault(name, 0)
+        normalized.append(name)
+    return normalized
+
+
+def parse_column_types(dtypes: dict) -> dict:
+    """
+    Turn dtype overrides ({"column": "int64"}) into Arrow types.
+    Accepts pyarrow type aliases (int32, float64, string, bool, date32,
+    timestamp[ms], ...) plus int, float, str, date, timestamp and
+    dictionary/category (dictionary-encoded strings).
+
+    Raises:
+        ValueError: For an unknown type name
+    """
+    column_types = {}
+    for name, alias in (dtypes or {}).items():
+        if alias in _TYPE_ALIASES:
+            column_types[name] = _TYPE_ALIASES[alias]
+            continue
+        try:
+            column_types[name] = pa.type_for_alias(alias)
+        except (ValueError, TypeError):
+            raise ValueError(f"Unknown dtype '{alias}' for column '{name}'")
+    return column_types
+
+
+def _is_text(data_type: pa.DataType) -> bool:
+    return pa.types.is_string(data_type) or pa.types.is_dictionary(data_type)
+
+
+def _is_utf8(chunk: bytes, at_start: bool) -> bool:
+    if not at_start:
+        # A chunk cut from the middle may start inside a character
+        skip = 0
+        while skip < min(3, len(chunk)) and chunk[skip] & 0xC0 == 0x80:
+            skip += 1
+        chunk = chunk[skip:]
+    try:
+        # final=False: the chunk may also end inside a character
+        codecs.getincrementaldecoder("utf-8")().decode(chunk, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def detect_encoding(source, sample_bytes: int = DEFAULT_SAMPLE_BYTES) -> str:
+    """
+    Pick utf8 or latin-1 from the first and last sample_bytes of a
+    seekable source, leaving it at the start.
+    """
+    head = source.read(sample_bytes)
+    encoding = "utf8" if _is_utf8(head, at_start=True) else "latin-1"
+
+    if encoding == "utf8":
+        size = source.seek(0, io.SEEK_END)
+        if size > 2 * sample_bytes:
+            source.seek(size - sample_bytes)
+            if not _is_utf8(source.read(sample_bytes), at_start=False):
+                encoding = "latin-1"
+
+    source.seek(0)
+    return encoding
+
+
+def sniff_csv(source, sample_bytes: int = DEFAULT_SAMPLE_BYTES, dtypes: dict = None) -> dict:
+    """
+    Work out how to parse a CSV from a sample of it.
+
+    Args:
+        source: Seekable binary file object; left at the start
+        sample_bytes: Size of the sample
+        dtypes: Optional {column: type name} overrides (see parse_column_types)
+
+    Returns:
+        dict with encoding, names (the header, made unique with
+        normalize_column_names), column_types ({name: Arrow type}; the
+        overrides, and types inferred from the sample for the rest),
+        hints (the inferred columns that aren't text, read as text and
+        converted; see convert_hints) and bytes_per_row (average in the
+        sample)
+
+    Raises:
+        EmptyCSVError: If the CSV is empty
+        CSVParseError: If the sample cannot be parsed or an override names
+            an unknown column
+    """
+    overrides = parse_column_types(dtypes)
+    encoding = detect_encoding(source, sample_bytes)
+
+    sample = source.read(sample_bytes)
+    truncated = bool(source.read(1))
+    source.seek(0)
+    if truncated and b"\n" in sample:
+        # Only whole rows
+        sample = sample[:sample.rindex(b"\n") + 1]
+
+    try:
+        table = pacsv.read_csv(
+            io.BytesIO(sample),
+            read_options=pacsv.ReadOptions(encoding=encoding, use_threads=False),
+        )
+    except pa.ArrowInvalid as e:
+        if "Empty CSV file" in str(e):
+            raise EmptyCSVError("CSV file is empty") from e
+        raise CSVParseError(str(e)) from e
+
+    names = normalize_column_names(table.column_names)
+    unknown = set(overrides) - set(names)
+    if unknown:
+        raise CSVParseError(f"Unknown column(s) in dtypes: {', '.join(sorted(unknown))}")
+
+    column_types = {}
+    for name, column in zip(names, table.columns):
+        if name in overrides:
+            column_types[name] = overrides[name]
+        elif pa.types.is_null(column.type):
+            # Empty in the sample; values later in the file are kept as text
+            column_types[name] = pa.string()
+        elif pa.types.is_string(column.type) and table.num_rows:
+            distinct = pc.count_distinct(column).as_py()
+            if distinct <= DICTIONARY_MAX_RATIO * table.num_rows:
+                column_types[name] = pa.dictionary(pa.int32(), pa.string())
+            else:
+                column_types[name] = pa.string()
+        else:
+            column_types[name] = column.type
+
+    return {
+        "encoding": encoding,
+        "names": names,
+        "column_types": column_types,
+        "hints": [
+            name for name in names
+            if name not in overrides and not _is_text(column_types[name])
+        ],
+        "bytes_per_row": len(sample) / max(table.num_rows, 1),
+    }
+
+
+def widen_type(data_type: pa.DataType) -> pa.DataType:
+    """Next type tried for a column whose values don't fit data_type."""
+    if pa.types.is_integer(data_type):
+        return pa.float64()
+    return pa.string()
+
+
+def _parse_text(array, data_type: pa.DataType):
+    if pa.types.is_time(data_type):
+        # pyarrow can't cast text to a time of day; "10:00" is 10:00:00,
+        # as in pyarrow's reader
+        array = pc.if_else(pc.match_substring_regex(array, r"^\d+:\d+$"), pc.binary_join_element_wise(array, ":00", ""), array)
+        return pc.strptime(array, "%H:%M:%S", "s").cast(data_type)
+    return array.cast(data_type)
+
+
+def _convert_text(array, data_type: pa.DataType):
+    if _is_text(data_type):
+        return array.cast(data_type)
+    try:
+        converted = _parse_text(array, data_type)
+        # "NaN" casts to a float NaN, where pyarrow's reader reads null
+        if not (pa.types.is_floating(data_type) and pc.any(pc.is_nan(converted)).as_py()):
+            return converted
+    except pa.ArrowInvalid:
+        pass
+    # Null markers ("", "NA", ...), as pyarrow's reader reads them
+    array = pc.if_else(pc.is_in(array, value_set=_NULL_VALUES), pa.scalar(None, array.type), array)
+    return _parse_text(array, data_type)
+
+
+def convert_hints(batch: pa.RecordBatch, sniffed: dict):
+    """
+    Convert the columns of a batch that were read as text
+    (sniffed["hints"]) to their types, widening a column whose values
+    don't fit its type (widen_type) until they do.
+
+    Returns:
+        (converted batch, sniffed with the widened types; the same dict
+        if none was widened)
+    """
+    column_types = sniffed["column_types"]
+    widened = {}
+    for name in sniffed["hints"]:
+        i = batch.schema.get_field_index(name)
+        data_type = column_types[name]
+        while True:
+            try:
+                array = _convert_text(batch.column(i), data_type)
+                break
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                data_type = widen_type(data_type)
+        if data_type != column_types[name]:
+            widened[name] = data_type
+        batch = batch.set_column(i, pa.field(name, data_type), array)
+    if widened:
+        sniffed = {**sniffed, "column_types": {**column_types, **widened}}
+    return batch, sniffed
+
+
+def _pyarrow_batches(source, sniffed: dict, block_size: int):
+    encoding = sniffed["encoding"]
+    if encoding == "utf8":
+        source = Utf8Fallback(source)
+    return pacsv.open_csv(
+        source,
+        read_options=pacsv.ReadOptions(
+            block_size=block_size,
+            encoding=encoding,
+            # The header was read by sniff_csv
+            column_names=sniffed["names"],
+            skip_rows=1,
+        ),
+        convert_options=pacsv.ConvertOptions(column_types={
+            name: pa.string() if name in sniffed["hints"] else data_type
+            for name, data_type in sniffed["column_types"].items()
+        }),
+    )
+
+
+def _redecode_latin1(array):
+    """
+    Decode text DuckDB read as latin-1 the way Utf8Fallback does: valid
+    UTF-8 sequences as UTF-8, any other bytes as latin-1.
+    """
+    if pc.all(pc.string_is_ascii(array)).as_py() is not False:
+        return array
+    return pa.array([
+        value if value is None or value.isascii()
+        else value.encode("latin-1").decode("utf-8", _LATIN1_FALLBACK)
+        for value in array.to_pylist()
+    ], array.type)
+
+
+def _duckdb_batches(source, sniffed: dict, block_size: int):
+    path = getattr(source, "name", None)
+    if not isinstance(path, str):
+        raise ValueError("The duckdb engine reads from a file on disk")
+
+    names = sniffed["names"]
+    # The sampled types; the hints are read as text and converted like
+    # the pyarrow engine's, since DuckDB would round a late 1.5 into a
+    # BIGINT column rather than fail
+    columns_sql = ", ".join(
+        "{}: '{}'".format(
+            quote_identifier(name),
+            "VARCHAR" if name in sniffed["hints"] else duckdb_type(sniffed["column_types"][name]),
+        )
+        for name in names
+    )
+    sql = f"""
+        SELECT * FROM read_csv(
+            ?,
+            header = true,
+            auto_detect = false,
+            delim = ',',
+            quote = '"',
+            escape = '"',
+            columns = {{{columns_sql}}},
+            encoding = ?
+        )
+        OFFSET ?
+    """
+    # Roughly one pyarrow block's worth of rows per batch
+    rows_per_batch = max(1024, int(block_size / sniffed["bytes_per_row"]))
+
+    conn = duckdb.connect()
+
+    def read(encoding, offset):
+        result = conn.execute(sql, [path, encoding, offset])
+        return record_batch_reader(result, rows_per_batch)
+
+    encoding = "latin-1" if sniffed["encoding"] == "latin-1" else "utf-8"
+    # Set once DuckDB finds invalid UTF-8 the sample missed
+    redecode = False
+    try:
+        try:
+            reader = read(encoding, 0)
+        except duckdb.Error as e:
+            if encoding != "utf-8" or "Invalid unicode" not in str(e):
+                raise
+            reader, redecode = read("latin-1", 0), True
+    except BaseException:
+        conn.close()
+        raise
+
+    # DuckDB returns plain strings; encode the columns the sample found
+    # to be low-cardinality, as the pyarrow engine does
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+    strings = [i for i, field in enumerate(reader.schema) if pa.types.is_string(field.type)]
+    encode = [
+        i for i in strings
+        if sniffed["column_types"].get(names[i]) == dictionary
+    ]
+    schema = reader.schema
+    for i in encode:
+        schema = schema.set(i, schema.field(i).with_type(dictionary))
+
+    def batches():
+        nonlocal reader, redecode
+        # Keeps the connection open until the last batch is read
+        rows = 0
+        try:
+            while True:
+                try:
+                    for batch in reader:
+                        rows += batch.num_rows
+                        if redecode:
+                            for i in strings:
+                                batch = batch.set_column(i, batch.schema.field(i), _redecode_latin1(batch.column(i)))
+                        for i in encode:
+                            batch = batch.set_column(i, schema.field(i), pc.dictionary_encode(batch.column(i)))
+                        yield batch
+                    return
+                except (duckdb.Error, OSError) as e:
+                    if redecode or "Invalid unicode" not in str(e):
+                        raise
+                # Keep the rows already read and continue after them,
+                # reading the rest as latin-1 and redecoding it
+                reader, redecode = read("latin-1", rows), True
+        finally:
+            conn.close()
+
+    return pa.RecordBatchReader.from_batches(schema, batches())
+
+
+class CSVBatches:
+    """
+    A sniffed CSV's record batches, with the hint columns converted (see
+    convert_hints). A column widened in one batch stays widened in every
+    later one, so batch schemas only ever get wider than schema, which
+    is the schema with the sampled types.
+    """
+
+    def __init__(self, reader: pa.RecordBatchReader, sniffed: dict):
+        self._reader = reader
+        self._sniffed = sniffed
+        self.schema = reader.schema
+        for name in sniffed["hints"]:
+            i = self.schema.get_field_index(name)
+            self.schema = self.schema.set(i, pa.field(name, sniffed["column_types"][name]))
+
+    def __iter__(self):
+        sniffed = self._sniffed
+        for batch in self._reader:
+            batch, sniffed = convert_hints(batch, sniffed)
+            yield batch
+
+
+def open_batches(engine: str, source, sniffed: dict, block_size: int) -> CSVBatches:
+    """
+    Stream a sniffed CSV as Arrow record batches.
+
+    Args:
+        engine: "pyarrow" or "duckdb"
+        source: Binary file object at the start of the CSV (the duckdb
+            engine reads source.name instead)
+        sniffed: Result of sniff_csv()
+        block_size: Approximate bytes of CSV per batch
+
+    Returns:
+        CSVBatches
+    """
+    if engine == "pyarrow":
+        return CSVBatches(_pyarrow_batches(source, sniffed, block_size), sniffed)
+    if engine == "duckdb":
+        return CSVBatches(_duckdb_batches(source, sniffed, block_size), sniffed)
+    raise ValueError(f"Unknown CSV engine '{engine}', expected one of {', '.join(ENGINES)}")
@@ -1,25 +1,518 @@
+import asyncio
 import duckdb
-import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from functools import lru_cache
 from pathlib import Path
+from storage import UPLOADS_DIR, get_storage
 
 # Database file path
 DB_PATH = Path(__file__).parent / "database" / "app.db"
-UPLOADS_DIR = Path(__file__).parent / "data" / "uploads"
+SPOOL_DIR = Path(__file__).parent / "data" / "spool"
+RESULT_CACHE_DIR = Path(__file__).parent / "data" / "result_cache"
+TRASH_DIR = Path(__file__).parent / "data" / "trash"
 
-def get_db_connection():
+
+class DatabaseBusyError(TimeoutError):
+    """Raised when a cursor cannot be acquired within the acquire timeout."""
+
+
+class _WaitStats:
+    """Running acquire-wait statistics for one access mode."""
+
+    def __init__(self):
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 3) if self.acquired else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+def metadata_dialect(url: str = None) -> str:
+    """
+    Which database a METADATA_URL points at: "postgres" for a
+    postgresql:// URL, "duckdb" (the local DB_PATH file) when it is empty.
+    
+    Raises:
+        ValueError: For any other URL
+    """
+    if not url:
+        return "duckdb"
+    if url.startswith(("postgresql://", "postgres://")):
+        return "postgres"
+    raise ValueError(f"Unsupported METADATA_URL '{url}', expected a postgresql:// URL")
+
+
+class _AsyncDuckDBCursor:
+    """A DuckDB cursor whose calls run on a worker thread."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, query: str, params=None):
+        await asyncio.to_thread(self._cursor.execute, query, params)
+        return self
+
+    async def fetchone(self):
+        return await asyncio.to_thread(self._cursor.fetchone)
+
+    async def fetchall(self):
+        return await asyncio.to_thread(self._cursor.fetchall)
+
+
+class ConnectionManager:
+    """
+    Process-wide DuckDB handle, holding the metadata tables in DB_PATH.
+    Opens the database once and hands out cursors, which are cheap
+    connections to the same in-process database instance. Reads run
+    concurrently up to max_readers; writes are serialized and each runs
+    in its own transaction, so concurrent writers never conflict. Only
+    one process can open the file, so the API runs as a single worker;
+    see PostgresConnectionManager for more.
+    
+    Never await while holding a cursor from read() or write(): the limits
+    are thread locks. aread() waits for its slot on a worker thread.
+    """
+
+    dialect = "duckdb"
+
+    def __init__(self, db_path: Path = DB_PATH, max_readers: int = 8, acquire_timeout: float = 30):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = duckdb.connect(str(db_path))
+        # Cursors share the instance, and with it the storage credentials
+        get_storage().configure_duckdb(self._conn)
+        self._read_slots = threading.BoundedSemaphore(max_readers)
+        self._write_lock = threading.Lock()
+        self._acquire_timeout = acquire_timeout
+        self._stats = {"read": _WaitStats(), "write": _WaitStats()}
+        self._stats_lock = threading.Lock()
+
+    def _acquire(self, lock, mode: str):
+        started = time.perf_counter()
+        acquired = lock.acquire(timeout=self._acquire_timeout)
+        waited = time.perf_counter() - started
+
+        with self._stats_lock:
+            stats = self._stats[mode]
+            if not acquired:
+                stats.timeouts += 1
+            else:
+                stats.acquired += 1
+                stats.total_wait += waited
+                stats.max_wait = max(stats.max_wait, waited)
+
+        if not acquired:
+            raise DatabaseBusyError(
+                f"Timed out after {self._acquire_timeout:g}s waiting for a {mode} cursor"
+            )
+
+    async def _aacquire(self, lock, mode: str):
+        # On a worker thread; if the caller is cancelled meanwhile, a slot
+        # acquired afterwards is handed straight back
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire, lock, mode))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or lock.release()
+            )
+            raise
+
+    @contextmanager
+    def read(self):
+        """Yield a cursor for read-only queries."""
+        self._acquire(self._read_slots, "read")
+        try:
+            cursor = self._conn.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        finally:
+            self._read_slots.release()
+
+    @asynccontextmanager
+    async def aread(self):
+        """
+        Yield a cursor for read-only queries from the event loop; its
+        execute(), fetchone() and fetchall() are awaited.
+        """
+        await self._aacquire(self._read_slots, "read")
+        try:
+            cursor = self._conn.cursor()
+            try:
+                yield _AsyncDuckDBCursor(cursor)
+            finally:
+                cursor.close()
+        finally:
+            self._read_slots.release()
+
+    @contextmanager
+    def write(self):
+        """
+        Yield a cursor inside a transaction.
+        Commits when the block exits normally and rolls back on error.
+        """
+        self._acquire(self._write_lock, "write")
+        try:
+            cursor = self._conn.cursor()
+            try:
+                cursor.begin()
+                try:
+                    yield cursor
+                except BaseException:
+                    cursor.rollback()
+                    raise
+                cursor.commit()
+            finally:
+                cursor.close()
+        finally:
+            self._write_lock.release()
+
+    def scan_cursor(self):
+        """
+        Open a cursor for long-running scans over Parquet files, such as
+        streamed responses; the caller must close it. Takes no read slot,
+        so a slow stream never holds up metadata queries; callers bound
+        their own concurrency.
+        """
+        return self._conn.cursor()
+
+    def notify(self, conn, channel: str, payload: str):
+        """No-op: with a single process there is nobody else to tell."""
+
+    async def listen(self, channel: str, callback, reset=None):
+        """No-op: see notify()."""
+
+    def stats(self) -> dict:
+        """Acquire counts and wait times per access mode."""
+        with self._stats_lock:
+            waits = {mode: stats.to_dict() for mode, stats in self._stats.items()}
+        return {"backend": self.dialect, **waits}
+
+    async def aclose(self):
+        """Nothing to do; close() releases everything."""
+
+    def close(self):
+        self._conn.close()
+
+
+# String literals pass through; ? becomes %s and a literal % is escaped
+_QUERY_TOKENS = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+
+@lru_cache(maxsize=1024)
+def _pyformat(query: str) -> str:
+    """Rewrite a query's DuckDB-style ? parameters as psycopg's %s."""
+    return _QUERY_TOKENS.sub(
+        lambda m: {"?": "%s", "%": "%%"}.get(m.group(0), m.group(0)), query
+    )
+
+
+def _json_text(data) -> str:
+    # JSON columns come back as text, as they do from DuckDB
+    return data.decode() if isinstance(data, (bytes, bytearray)) else str(data)
+
+
+def _configure_postgres(conn):
+    from psycopg.types.json import set_json_loads
+    set_json_loads(_json_text, conn)
+
+
+async def _aconfigure_postgres(conn):
+    _configure_postgres(conn)
+
+
+class _PostgresCursor:
+    """
+    A psycopg cursor taking the same queries as a DuckDB one: ?
+    parameters, and execute() returning the cursor so calls chain.
+    """
+
+    def __init__(self, cursor, connection=None):
+        self._cursor = cursor
+        # Closed with the cursor (standalone connections)
+        self._connection = connection
+
+    def execute(self, query: str, params=None):
+        self._cursor.execute(query if params is None else _pyformat(query), params)
+        return self
+
+    def executemany(self, query: str, params):
+        self._cursor.executemany(_pyformat(query), params)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def close(self):
+        self._cursor.close()
+        if self._connection is not None:
+            self._connection.close()
+
+
+class _AsyncPostgresCursor:
+    """An async psycopg cursor taking ? parameters, as _PostgresCursor."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, query: str, params=None):
+        await self._cursor.execute(query if params is None else _pyformat(query), params)
+        return self
+
+    async def fetchone(self):
+        return await self._cursor.fetchone()
+
+    async def fetchall(self):
+        return await self._cursor.fetchall()
+
+
+class PostgresConnectionManager:
+    """
+    Metadata tables in PostgreSQL, shared by every worker and node, so the
+    API can run as many processes as needed.
+    Each process keeps two pools of up to max_readers connections: one for
+    read() and write(), used from worker threads, and an asyncio one for
+    aread() on the event loop. Writes are READ COMMITTED transactions that
+    run concurrently, across nodes too: statements that change shared rows
+    claim them (UPDATE/DELETE ... RETURNING, ON CONFLICT) instead of
+    relying on a lock in this process. Cursors take the same queries as
+    DuckDB ones.
+    
+    DuckDB stays the engine for the uploads themselves: scan_cursor()
+    comes from an in-memory instance that reads the Parquet files.
+    """
+
+    dialect = "postgres"
+
+    def __init__(self, url: str, max_readers: int = 8, acquire_timeout: float = 30):
+        import psycopg_pool
+        self._url = url
+        self._acquire_timeout = acquire_timeout
+        self._pool_timeout = psycopg_pool.PoolTimeout
+        self._pool = psycopg_pool.ConnectionPool(
+            url,
+            min_size=1,
+            max_size=max_readers,
+            kwargs={"autocommit": True},
+            configure=_configure_postgres,
+            open=True,
+            name="metadata",
+        )
+        # Opened on first use, inside the event loop
+        self._async_pool = psycopg_pool.AsyncConnectionPool(
+            url,
+            min_size=1,
+            max_size=max_readers,
+            kwargs={"autocommit": True},
+            configure=_aconfigure_postgres,
+            open=False,
+            name="metadata-async",
+        )
+        self._async_pool_open = False
+        self._analytics = duckdb.connect()
+        get_storage().configure_duckdb(self._analytics)
+
+    def _busy(self) -> DatabaseBusyError:
+        return DatabaseBusyError(
+            f"Timed out after {self._acquire_timeout:g}s waiting for a database connection"
+        )
+
+    @contextmanager
+    def _connection(self):
+        try:
+            conn = self._pool.getconn(timeout=self._acquire_timeout)
+        except self._pool_timeout:
+            raise self._busy()
+        try:
+            yield conn
+        finally:
+            self._pool.putconn(conn)
+
+    @contextmanager
+    def read(self):
+        """Yield a cursor for read-only queries."""
+        with self._connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield _PostgresCursor(cursor)
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def write(self):
+        """
+        Yield a cursor inside a transaction.
+        Commits when the block exits normally and rolls back on error.
+        """
+        with self._connection() as conn:
+            with conn.transaction():
+                cursor = conn.cursor()
+                try:
+                    yield _PostgresCursor(cursor)
+                finally:
+                    cursor.close()
+
+    @asynccontextmanager
+    async def aread(self):
+        """
+        Yield a cursor for read-only queries from the event loop; its
+        execute(), fetchone() and fetchall() are awaited.
+        """
+        if not self._async_pool_open:
+            await self._async_pool.open()
+            self._async_pool_open = True
+        try:
+            conn = await self._async_pool.getconn(timeout=self._acquire_timeout)
+        except self._pool_timeout:
+            raise self._busy()
+        try:
+            cursor = conn.cursor()
+            try:
+                yield _AsyncPostgresCursor(cursor)
+            finally:
+                await cursor.close()
+        finally:
+            await self._async_pool.putconn(conn)
+
+    def scan_cursor(self):
+        """
+        Open a DuckDB cursor for long-running scans over Parquet files;
+        the caller must close it. See ConnectionManager.scan_cursor.
+        """
+        return self._analytics.cursor()
+
+    def notify(self, conn, channel: str, payload: str):
+        """
+        Send payload to every listen()er on channel, in every process,
+        when the write transaction of conn commits.
+        """
+        conn.execute("SELECT pg_notify(?, ?)", [channel, payload])
+
+    async def listen(self, channel: str, callback, reset=None):
+        """
+        Call callback(payload) for each notification on channel until
+        cancelled, on a connection of its own. Reconnects if the
+        connection is lost or fails; notifications sent meanwhile are
+        missed, so reset() (if given) is called each time listening
+        (re)starts, before the first notification.
+        """
+        import psycopg
+        while True:
+            try:
+                conn = await psycopg.AsyncConnection.connect(self._url, autocommit=True)
+                async with conn:
+                    await conn.execute(f"LISTEN {channel}")
+                    if reset is not None:
+                        reset()
+                    async for notification in conn.notifies():
+                        try:
+                            callback(notification.payload)
+                        except Exception as e:
+                            print(f"Failed to handle a {channel} notification: {e}")
+            except Exception as e:
+                print(f"Lost the {channel} notification connection ({e}), reconnecting")
+                await asyncio.sleep(1)
+
+    def stats(self) -> dict:
+        """Connection pool counters (see psycopg_pool's get_stats())."""
+        return {
+            "backend": self.dialect,
+            "pool": self._pool.get_stats(),
+            "async_pool": self._async_pool.get_stats(),
+        }
+
+    async def aclose(self):
+        """Close the asyncio pool; call from the event loop it was used on."""
+        await self._async_pool.close()
+
+    def close(self):
+        self._pool.close()
+        self._analytics.close()
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def open_connection_manager(url: str = None, **limits):
+    """
+    Create the process-wide connection manager.
+    Called from the FastAPI lifespan, after storage.open_storage().
+    
+    Args:
+        url: METADATA_URL; a postgresql:// URL for PostgreSQL, otherwise
+            the DuckDB file at DB_PATH
+        **limits: max_readers and acquire_timeout
+    
+    Returns:
+        ConnectionManager or PostgresConnectionManager
+    """
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            if metadata_dialect(url) == "postgres":
+                _manager = PostgresConnectionManager(url, **limits)
+            else:
+                _manager = ConnectionManager(**limits)
+        return _manager
+
+
+def close_connection_manager():
+    """Close the process-wide connection manager, if open."""
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.close()
+            _manager = None
+
+
+def get_connection_manager():
+    """
+    Get the process-wide connection manager.
+    Opens a DuckDB one with default limits if the app lifespan has not
+    (e.g. in command-line scripts).
     """
-    Get a DuckDB connection.
+    return _manager or open_connection_manager()
+
+
+def get_db_connection(url: str = None):
+    """
+    Get a standalone connection to the metadata database.
     Creates database directory if it doesn't exist.
+    Only for one-off scripts; the API uses get_connection_manager().
+    
+    Args:
+        url: METADATA_URL; for a postgresql:// URL, a PostgreSQL connection
+            in autocommit mode that takes DuckDB-style ? parameters
     """
+    if metadata_dialect(url) == "postgres":
+        import psycopg
+        conn = psycopg.connect(url, autocommit=True)
+        _configure_postgres(conn)
+        return _PostgresCursor(conn.cursor(), conn)
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     return duckdb.connect(str(DB_PATH))
 
 def ensure_uploads_directory():
     """
     Ensure the uploads directory exists.
+    Blocking only the first time; see storage.Storage.ensure_directory.
     """
-    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
-    return UPLOADS_DIR
+    return get_storage().ensure_directory(UPLOADS_DIR)
 
 def get_user_upload_directory(user_id: str) -> Path:
     """
@@ -31,6 +524,20 @@ def get_user_upload_directory(user_id: str) -> Path:
     Returns:
         Path to the user's upload directory
     """
-    user_dir = UPLOADS_DIR / user_id
-    user_dir.mkdir(parents=True, exist_ok=True)
-    return user_dir
\ No newline at end of file
+    return get_storage().ensure_directory(UPLOADS_DIR / user_id)
+
+
+def get_spool_directory() -> Path:
+    """
+    Get or create the directory where uploads are spooled before conversion.
+    """
+    return get_storage().ensure_directory(SPOOL_DIR)
+
+
+def get_trash_directory() -> Path:
+    """
+    Get or create the directory deleted upload files wait in until the
+    storage collector removes them. On the same volume as UPLOADS_DIR, so
+    moving a file there is a rename.
+    """
+    return get_storage().ensure_directory(TRASH_DIR)
@@ -0,0 +1,302 @@
+"""
+Partitioned Parquet datasets.
+Large uploads can be stored as a directory of Parquet files instead of one
+file: Hive-style by the values of a chosen column (city=Paris/part-00000.parquet),
+split into files of bounded size, or both. The directory takes the place
+of the single file, at the same <upload_id>.parquet path, and readers scan
+it with DuckDB's read_parquet(..., hive_partitioning = true) so filters on
+the partition column skip whole files.
+
+A _common_metadata file at the root holds the full schema, including the
+partition column that the data files leave out, so readers can restore its
+type and position.
+
+Functions taking a filesystem (a pyarrow.fs.FileSystem) work on a storage
+backend other than local disk (see storage.Storage.locate); paths are then
+paths within it, such as bucket/key for S3.
+"""
+
+import json
+import shutil
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import quote
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from parquet_profiles import RowGroupWriter
+
+# Distinct partition values allowed per upload
+DEFAULT_MAX_PARTITIONS = 1024
+
+# Data files open for writing at once; the least recently written is
+# closed to open another, and its partition continues in a new file
+DEFAULT_MAX_OPEN_FILES = 128
+
+# Directory name for rows whose partition value is null (read back as NULL)
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+_METADATA_FILE = "_common_metadata"
+_PARTITION_BY_KEY = b"partition_by"
+
+
+class PartitionError(ValueError):
+    """Raised when an upload can't be partitioned as asked."""
+
+
+def is_dataset(path, filesystem=None) -> bool:
+    """Whether an upload's parquet_path is a dataset directory."""
+    if filesystem is None:
+        return Path(path).is_dir()
+    return filesystem.get_file_info(str(path)).type == pafs.FileType.Directory
+
+
+def remove_parquet(path, filesystem=None):
+    """Delete an upload's Parquet file or dataset directory, if present."""
+    if filesystem is not None:
+        info = filesystem.get_file_info(str(path))
+        if info.type == pafs.FileType.Directory:
+            filesystem.delete_dir(str(path))
+        elif info.type == pafs.FileType.File:
+            filesystem.delete_file(str(path))
+        return
+    path = Path(path)
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def dataset_schema(root, filesystem=None):
+    """
+    Full schema of a dataset and its partition columns.
+
+    Returns:
+        (pyarrow.Schema in the original column order, list of partition columns)
+    """
+    schema = pq.read_schema(str(Path(root) / _METADATA_FILE), filesystem=filesystem)
+    partition_by = json.loads((schema.metadata or {}).get(_PARTITION_BY_KEY, b"[]"))
+    return schema.remove_metadata(), partition_by
+
+
+def dataset_glob(root) -> str:
+    """Glob matching every data file of a dataset (a path or URI)."""
+    return str(root).rstrip("/") + "/**/*.parquet"
+
+
+def _partition_directory(column: str, value) -> str:
+    value = NULL_PARTITION if value is None else quote(value, safe="")
+    return f"{quote(column, safe='')}={value}"
+
+
+class DatasetWriter:
+    """
+    Writes record batches to a dataset directory, with the same interface
+    as parquet_profiles.RowGroupWriter.
+
+    Memory stays close to that of writing one file: at most max_open_files
+    files are open, and the rows buffered across all of them are kept to
+    one row group's worth (row_group_rows) by writing out the largest
+    buffers early, as shorter row groups.
+
+    Args:
+        root: Dataset directory to create
+        schema: Schema of the batches
+        settings: Parquet settings (parquet_profiles.resolve_profile)
+        partition_by: Optional column to partition by
+        file_rows: Optional maximum rows per data file
+        max_partitions: Distinct partition values allowed
+        max_open_files: Data files open for writing at once
+        filesystem: Optional pyarrow filesystem to write to
+
+    Raises:
+        PartitionError: From write_batch, for too many partition values
+    """
+
+    def __init__(
+        self,
+        root,
+        schema: pa.Schema,
+        settings: dict,
+        partition_by: str = None,
+        file_rows: int = None,
+        max_partitions: int = DEFAULT_MAX_PARTITIONS,
+        max_open_files: int = DEFAULT_MAX_OPEN_FILES,
+        filesystem=None,
+    ):
+        self.root = Path(root)
+        self.filesystem = filesystem
+        self.schema = schema
+        self.partition_by = partition_by
+        self.file_rows = file_rows
+        self.max_partitions = max_partitions
+        self.max_open_files = max_open_files
+        self._file_schema = schema
+        self._settings = settings
+        if partition_by is not None:
+            self._file_schema = schema.remove(schema.get_field_index(partition_by))
+            # The partition column isn't stored in the files
+            self._settings = {
+                **settings,
+                "sort_by": [k for k in settings["sort_by"] if k.lstrip("-") != partition_by],
+                "bloom_filter_columns": [c for c in settings["bloom_filter_columns"] if c != partition_by],
+            }
+            if settings["dictionary_columns"] is not None:
+                self._settings["dictionary_columns"] = [
+                    c for c in settings["dictionary_columns"] if c != partition_by
+                ]
+        # Partition directory -> [writer, rows in its current file, file
+        # number, partition value], least recently written first
+        self._open = OrderedDict()
+        # Partition directory -> number of its next file
+        self._next_file = {}
+        # (writer, partition value) of each file already closed
+        self._closed = []
+        self._closed_row_groups = 0
+        self._mkdir(self.root, exist_ok=False)
+
+    @property
+    def row_groups(self) -> int:
+        return self._closed_row_groups + sum(state[0].row_groups for state in self._open.values())
+
+    def write_batch(self, batch: pa.RecordBatch):
+        if self.partition_by is None:
+            self._write_to(self.root, None, batch)
+            return
+
+        column = batch.column(self.partition_by)
+        if pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        encoded = pc.dictionary_encode(pc.cast(column, pa.string()))
+        codes = pc.fill_null(encoded.indices, -1).to_numpy(zero_copy_only=False)
+        values = encoded.dictionary.to_pylist()
+
+        # Group the batch's rows by partition value
+        order = np.argsort(codes, kind="stable")
+        grouped = batch.drop_columns([self.partition_by]).take(pa.array(order))
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.diff(sorted_codes)) + 1
+        for start, end in zip(np.r_[0, starts], np.r_[starts, len(codes)]):
+            code = sorted_codes[start]
+            value = None if code < 0 else values[code]
+            directory = self.root / _partition_directory(self.partition_by, value)
+            self._write_to(directory, value, grouped.slice(start, end - start))
+        self._limit_buffered_rows()
+
+    def _limit_buffered_rows(self):
+        limit = self._settings["row_group_rows"]
+        if not limit:
+            # Every batch is written straight out
+            return
+        writers = [state[0] for state in self._open.values()]
+        buffered = sum(writer.pending_rows for writer in writers)
+        for writer in sorted(writers, key=lambda writer: writer.pending_rows, reverse=True):
+            if buffered <= limit:
+                break
+            buffered -= writer.pending_rows
+            writer.flush()
+
+    def _mkdir(self, directory: Path, exist_ok: bool = True):
+        if self.filesystem is None:
+            directory.mkdir(parents=True, exist_ok=exist_ok)
+        else:
+            self.filesystem.create_dir(str(directory))
+
+    def _write_to(self, directory: Path, value, batch: pa.RecordBatch):
+        while batch.num_rows:
+            state = self._open.get(directory)
+            if state is None:
+                state = self._open_file(directory, value)
+            elif self.file_rows and state[1] >= self.file_rows:
+                # Roll over to the directory's next file
+                self._close_file(self._open.pop(directory))
+                state = self._open_file(directory, value)
+            else:
+                self._open.move_to_end(directory)
+
+            take = batch.num_rows
+            if self.file_rows:
+                take = min(take, self.file_rows - state[1])
+            state[0].write_batch(batch.slice(0, take))
+            state[1] += take
+            batch = batch.slice(take)
+
+    def _open_file(self, directory: Path, value) -> list:
+        number = self._next_file.get(directory)
+        if number is None:
+            if len(self._next_file) >= self.max_partitions:
+                raise PartitionError(
+                    f"Column '{self.partition_by}' has more than {self.max_partitions} distinct values to partition by"
+                )
+            self._mkdir(directory)
+            number = 0
+        if len(self._open) >= self.max_open_files:
+            self._close_file(self._open.popitem(last=False)[1])
+        self._next_file[directory] = number + 1
+        writer = RowGroupWriter(
+            directory / f"part-{number:05d}.parquet", self._file_schema, self._settings, self.filesystem
+        )
+        state = self._open[directory] = [writer, 0, number, value]
+        return state
+
+    def _close_file(self, state: list):
+        state[0].close()
+        self._closed.append((state[0], state[3]))
+        self._closed_row_groups += state[0].row_groups
+
+    def retype(self, schema: pa.Schema, observe=None):
+        """
+        Switch to a schema with some columns widened, rewriting every file
+        written so far (see RowGroupWriter.retype).
+
+        Args:
+            schema: The new schema, with the same columns
+            observe: Optional callback receiving the rewritten data as
+                pyarrow.Tables with the full schema
+        """
+        self.schema = schema
+        self._file_schema = schema
+        if self.partition_by is not None:
+            self._file_schema = schema.remove(schema.get_field_index(self.partition_by))
+
+        def observer(value):
+            if observe is None or self.partition_by is None:
+                return observe
+            # The files leave the partition column out; it is the
+            # directory's value throughout
+            field = schema.field(self.partition_by)
+            index = schema.get_field_index(self.partition_by)
+            return lambda table: observe(table.add_column(
+                index, field, pa.repeat(value, table.num_rows).cast(field.type)
+                if value is not None else pa.nulls(table.num_rows, field.type)
+            ))
+
+        for writer, value in self._closed:
+            writer.retype(self._file_schema, observer(value))
+            writer.close()
+        for state in self._open.values():
+            state[0].retype(self._file_schema, observer(state[3]))
+
+    def close(self):
+        for state in self._open.values():
+            self._close_file(state)
+        self._open = OrderedDict()
+        partition_by = [self.partition_by] if self.partition_by else []
+        pq.write_metadata(
+            self.schema.with_metadata({_PARTITION_BY_KEY: json.dumps(partition_by).encode()}),
+            str(self.root / _METADATA_FILE),
+            filesystem=self.filesystem,
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The caller removes the partial dataset
+            for state in self._open.values():
+                state[0].__exit__(exc_type, exc, tb)
@@ -1,43 +1,189 @@
-from fastapi import Request
+from fastapi import Request, HTTPException
 from fastapi.responses import RedirectResponse
-from config import workos, WORKOS_COOKIE_PASSWORD
+from config import (
+    workos,
+    WORKOS_COOKIE_PASSWORD,
+    ADMIN_USER_IDS,
+    SESSION_CACHE_SIZE,
+    SESSION_CACHE_TTL,
+    REFRESH_RESULT_TTL,
+    REFRESH_MAX_IN_FLIGHT,
+)
+from sessions import SessionCache, SingleFlight, session_key, token_expiry
+
+# Verified sessions shared by every request in this worker
+session_cache = SessionCache(max_entries=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+# Concurrent refreshes of the same session share one WorkOS round trip
+refresh_flight = SingleFlight(max_keys=REFRESH_MAX_IN_FLIGHT)
+
+# Marks request.state.user as not yet resolved (None means "not logged in")
+_UNRESOLVED = object()
+
+
+def load_session(request: Request):
+    """Load the WorkOS session from the request's session cookie."""
+    return workos.user_management.load_sealed_session(
+        sealed_session=request.cookies.get("wos_session"),
+        cookie_password=WORKOS_COOKIE_PASSWORD,
+    )
+
+
+def get_authenticated_user(request: Request):
+    """
+    Resolve the session cookie to a user without refreshing.
+    The result is cached across requests and stored on request.state, so a
+    request is verified at most once however many dependencies ask.
+
+    Returns:
+        The user, or None if there is no valid, unexpired session
+    """
+    user = getattr(request.state, "user", _UNRESOLVED)
+    if user is not _UNRESOLVED:
+        return user
+
+    user = None
+    sealed_session = request.cookies.get("wos_session")
+    if sealed_session:
+        key = session_key(sealed_session)
+        user = session_cache.get(key)
+        if user is None:
+            auth_response = load_session(request).authenticate()
+            if auth_response.authenticated:
+                user = auth_response.user
+                session_cache.put(key, user, token_expiry(sealed_session, WORKOS_COOKIE_PASSWORD))
+
+    request.state.user = user
+    return user
+
+
+def _refresh_once(request: Request, key: str):
+    # Runs once per in-flight key. A refresh that finished just before this
+    # one started has already cached the user, so check again first.
+    user = session_cache.get(key)
+    if user is not None:
+        return user, None
+
+    result = load_session(request).refresh()
+    if not result.authenticated:
+        return None, None
+
+    # Requests still carrying the old cookie reuse this for a short while
+    session_cache.put(
+        key,
+        result.user,
+        token_expiry(result.sealed_session, WORKOS_COOKIE_PASSWORD),
+        ttl=REFRESH_RESULT_TTL,
+    )
+    return result.user, result.sealed_session
+
+
+def refresh_session(request: Request):
+    """
+    Refresh the request's expired session.
+    Concurrent calls for the same cookie are coalesced into one refresh
+    whose result they all share.
+
+    Returns:
+        (user, sealed_session): user is None if the refresh was denied;
+        sealed_session is the new cookie value, or None if the user came
+        from a refresh another request just completed
+    """
+    key = session_key(request.cookies.get("wos_session"))
+    user, sealed_session = refresh_flight.do(key, lambda: _refresh_once(request, key))
+    if user is not None:
+        request.state.user = user
+        request.state.refreshed_session = sealed_session
+    return user, sealed_session
+
+
+def require_user(request: Request):
+    """
+    Dependency for API routes that need an authenticated user.
+    Attempts a session refresh when the access token has expired.
+
+    Returns:
+        The authenticated user
+
+    Raises:
+        HTTPException: 401 if the session is missing or cannot be refreshed
+    """
+    if not request.cookies.get("wos_session"):
+        raise HTTPException(status_code=401, detail="No session cookie")
+
+    try:
+        user = get_authenticated_user(request)
+        if user is not None:
+            return user
+
+        # Try to refresh the session
+        try:
+            user, _ = refresh_session(request)
+        except Exception as refresh_error:
+            raise HTTPException(status_code=401, detail="Session expired")
+
+        if user is None:
+            raise HTTPException(status_code=401, detail="Session refresh failed")
+
+        # Session refreshed successfully - use the new user
+        return user
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=401, detail="Authentication failed")
+
+
+def require_admin(request: Request):
+    """
+    Dependency for admin API routes: an authenticated user listed in
+    ADMIN_USER_IDS.
+
+    Returns:
+        The authenticated user
+
+    Raises:
+        HTTPException: 401 as for require_user, 403 if the user isn't an admin
+    """
+    user = require_user(request)
+    if user.id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
 
 
 def with_auth(request: Request):
     """
     Dependency to check if the user is authenticated.
     If not, redirect to login or attempt session refresh.
-    
+
     Returns:
         dict: {"session": session, "user": user} if authenticated
         RedirectResponse: Redirect to signin if not authenticated
     """
-    session = workos.user_management.load_sealed_session(
-        sealed_session=request.cookies.get("wos_session"),
-        cookie_password=WORKOS_COOKIE_PASSWORD,
-    )
-    auth_response = session.authenticate()
-    
-    if auth_response.authenticated:
-        return {"session": session, "user": auth_response.user}
-
-    if (
-        auth_response.authenticated is False
-        and auth_response.reason == "no_session_cookie_provided"
-    ):
+    session = load_session(request)
+    user = get_authenticated_user(request)
+
+    if user is not None:
+        return {"session": session, "user": user}
+
+    if not request.cookies.get("wos_session"):
         return RedirectResponse(url="/signin")
 
     # If no session, attempt a refresh
     try:
         print("Refreshing session")
-        result = session.refresh()
-        if result.authenticated is False:
+        user, sealed_session = refresh_session(request)
+        if user is None:
             return RedirectResponse(url="/signin")
 
+        if sealed_session is None:
+            # Another request refreshed this session a moment ago
+            return {"session": session, "user": user}
+
         response = RedirectResponse(url=str(request.url))
         response.set_cookie(
             key="wos_session",
-            value=result.sealed_session,
+            value=sealed_session,
             secure=True,
             httponly=True,
             samesite="lax",
@@ -47,4 +193,4 @@ def with_auth(request: Request):
         print("Error refreshing session", e)
         response = RedirectResponse(url="/signin")
         response.delete_cookie("wos_session")
-        return response
\ No newline at end of file
+        return response
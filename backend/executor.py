@@ -0,0 +1,246 @@
+"""
+Conversion executor.
+Runs CPU-bound CSV → Parquet conversions in a process pool so a large file
+never stalls the event loop. The pool is created and torn down by the app
+lifespan in main.py and is reachable as request.app.state.converter.
+
+A job's timeout counts from when a worker picks it up. A job that runs past
+it has its worker killed, which breaks the pool; a new pool takes its place
+and the other jobs caught in the old one are run again there.
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ExecutorSaturatedError(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class ConversionTimeoutError(Exception):
+    """Raised when a job does not finish within the per-job timeout."""
+
+
+# Progress channel back to the parent, set in each worker by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+class _ProgressReporter:
+    """Callable handed to jobs inside a worker; forwards events to the parent."""
+
+    def __init__(self, token: int):
+        self.token = token
+
+    def __call__(self, event: dict):
+        _progress_queue.put((self.token, "progress", event))
+
+
+def _run_job(token, fn, args, with_progress):
+    # Tell the parent which worker picked the job up, which starts its timeout
+    _progress_queue.put((token, "started", os.getpid()))
+    if with_progress:
+        return fn(*args, progress=_ProgressReporter(token))
+    return fn(*args)
+
+
+def available_cores() -> int:
+    """Number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class ConversionExecutor:
+    """
+    Process pool with a bounded queue and per-job timeouts.
+
+    At most max_workers jobs run at once and at most max_queue more wait for
+    a worker; anything beyond that is rejected immediately so the caller can
+    answer 503 instead of piling up work.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None, timeout: float = 300):
+        self.max_workers = max_workers or available_cores()
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        self.timeout = timeout
+        self._context = None
+        self._pool = None
+        self._loop = None
+        self._pending = 0
+        self._progress_queue = None
+        self._progress_thread = None
+        self._jobs = {}
+        self._tokens = itertools.count()
+
+    @property
+    def pending(self) -> int:
+        """Jobs running or waiting for a worker."""
+        return self._pending
+
+    @property
+    def saturated(self) -> bool:
+        """True when a new job would be rejected."""
+        return self._pending >= self.max_workers + self.max_queue
+
+    def start(self):
+        """Start the worker processes."""
+        self._loop = asyncio.get_running_loop()
+        # spawn rather than fork: forking a process that already runs
+        # pyarrow and server threads can deadlock the child
+        self._context = multiprocessing.get_context("spawn")
+        self._progress_queue = self._context.Queue()
+        self._pool = self._new_pool()
+        self._progress_thread = threading.Thread(
+            target=self._drain_progress, name="conversion-progress", daemon=True
+        )
+        self._progress_thread.start()
+
+    async def shutdown(self):
+        """Cancel queued jobs and wait for running ones to finish."""
+        if self._pool is None:
+            return
+        pool, self._pool = self._pool, None
+        await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+        self._progress_queue.put(None)
+        await asyncio.to_thread(self._progress_thread.join)
+        self._progress_queue.close()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._progress_queue,),
+        )
+
+    def _recycle(self, pool, pid=None):
+        """Replace a pool, killing its worker pid if given."""
+        if pool is self._pool:
+            self._pool = self._new_pool()
+            # Doesn't wait: the old pool's jobs fail with BrokenProcessPool
+            # once the killed worker is noticed
+            pool.shutdown(wait=False)
+        if pid is not None:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def _drain_progress(self):
+        # Runs in a thread: hop each worker event back onto the loop
+        while True:
+            item = self._progress_queue.get()
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._dispatch_progress, *item)
+
+    def _dispatch_progress(self, token, kind, payload):
+        job = self._jobs.get(token)
+        if job is None:
+            return
+        started, on_progress = job
+        if kind == "started":
+            if not started.done():
+                started.set_result(payload)
+        elif on_progress is not None:
+            on_progress(payload)
+
+    def _job_finished(self, _future):
+        self._loop.call_soon_threadsafe(self._release)
+
+    def _release(self):
+        self._pending -= 1
+
+    def _abandon(self, future, on_abandon):
+        future.cancel()
+        if on_abandon is not None:
+            future.add_done_callback(lambda _: on_abandon())
+
+    async def run(self, fn, *args, on_progress=None, on_abandon=None):
+        """
+        Run fn(*args) in a worker process and return its result.
+
+        Args:
+            fn: Module-level (picklable) function to run
+            *args: Picklable arguments for fn
+            on_progress: Optional callback run on the event loop for each
+                event the job reports; fn is then called with a progress=
+                keyword it can invoke with a dict
+            on_abandon: Optional callback invoked once a job we stopped
+                waiting for (timeout or client gone) finally finishes or
+                is killed, e.g. to remove its output
+
+        Raises:
+            ExecutorSaturatedError: If the queue is full
+            ConversionTimeoutError: If the job runs longer than the timeout
+                once a worker has picked it up
+        """
+        if self._pool is None:
+            raise RuntimeError("Conversion executor is not running")
+
+        if self.saturated:
+            raise ExecutorSaturatedError("Conversion queue is full")
+
+        # A job caught in a pool recycled for another job's timeout is
+        # run again, once
+        for attempt in range(2):
+            pool = self._pool
+            try:
+                return await self._run_once(pool, fn, args, on_progress, on_abandon)
+            except BrokenProcessPool:
+                if pool is self._pool:
+                    # A worker died by itself; start a fresh pool for the
+                    # jobs that come after
+                    self._recycle(pool)
+                    raise
+                if attempt:
+                    raise
+
+    async def _run_once(self, pool, fn, args, on_progress, on_abandon):
+        token = next(self._tokens)
+        started = self._loop.create_future()
+        self._jobs[token] = (started, on_progress)
+        future = pool.submit(_run_job, token, fn, args, on_progress is not None)
+
+        self._pending += 1
+        # The slot is released when the worker is done, not when we stop
+        # waiting, so timed-out jobs still count against capacity
+        future.add_done_callback(self._job_finished)
+
+        result = asyncio.wrap_future(future)
+        try:
+            # Queued: no timeout until a worker picks the job up (or it
+            # finishes before its start event arrives)
+            await asyncio.wait([started, result], return_when=asyncio.FIRST_COMPLETED)
+            if result.done():
+                return result.result()
+            pid = started.result()
+            try:
+                return await asyncio.wait_for(asyncio.shield(result), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                # cancel() can't stop a running job; kill its worker
+                self._recycle(pool, pid)
+                self._abandon(future, on_abandon)
+                raise ConversionTimeoutError(
+                    f"Conversion did not finish within {self.timeout:g}s"
+                )
+        except asyncio.CancelledError:
+            self._abandon(future, on_abandon)
+            raise
+        finally:
+            self._jobs.pop(token, None)
+            if not result.done():
+                # Nothing else awaits it; don't log its eventual error
+                result.add_done_callback(lambda f: f.cancelled() or f.exception())
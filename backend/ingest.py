@@ -0,0 +1,316 @@
+"""
+CSV to Parquet conversion.
+Streams a CSV source through a parser engine (see csv_parsers) one block at
+a time and writes the blocks out as Parquet row groups with the layout of a
+writer profile (see parquet_profiles), so peak memory is bounded by the
+block or row-group size rather than by the size of the file. Large uploads
+can be written as a partitioned dataset directory instead (see datasets).
+The encoding and column types are worked out up front from a sample;
+when a later block has a value that doesn't fit a sampled type, the parser
+widens that column and what has been written so far is rewritten from the
+Parquet output with the wider type, so the CSV is only ever parsed once.
+Column statistics and the preview sample are accumulated from the same
+batches on the way through.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import duckdb
+import pyarrow as pa
+from column_stats import TableProfiler
+from csv_parsers import CSVParseError, DEFAULT_SAMPLE_BYTES, open_batches, sniff_csv
+from datasets import DatasetWriter, remove_parquet
+from parquet_profiles import RowGroupWriter, resolve_profile, unknown_columns
+from previews import PreviewSampler, preview_path_for, DEFAULT_HEAD_ROWS, DEFAULT_SAMPLE_ROWS
+
+# Bytes of CSV decoded per batch (pyarrow's default is 1 MB)
+DEFAULT_BLOCK_SIZE = 16 * 1024 * 1024
+
+
+def _widen_output(writer, profiler, sampler, schema, widened):
+    """Bring the output so far up to a batch's widened schema."""
+    names = [field.name for field, wider in zip(schema, widened) if field.type != wider.type]
+    # The widened columns' statistics are rebuilt from the rewritten data
+    rebuilt = TableProfiler(pa.schema([widened.field(name) for name in names]))
+    writer.retype(widened, lambda table: rebuilt.update(table.select(names)))
+    for column in rebuilt.columns:
+        profiler.columns[widened.get_field_index(column.name)] = column
+    if sampler is not None:
+        sampler.retype(widened)
+
+
+def _stream_to_parquet(source, parquet_path, block_size, engine, sniffed, parquet_settings, layout, progress, preview, filesystem):
+    try:
+        reader = open_batches(engine, source, sniffed, block_size)
+    # DuckDB's errors reach here as duckdb.Error, or OSError through pyarrow
+    except (pa.ArrowInvalid, duckdb.Error, OSError) as e:
+        raise CSVParseError(str(e)) from e
+
+    schema = reader.schema
+    unknown = unknown_columns(parquet_settings, schema.names)
+    if unknown:
+        raise CSVParseError(f"Unknown column(s) in Parquet settings: {', '.join(unknown)}")
+
+    if layout is None:
+        writer = RowGroupWriter(parquet_path, schema, parquet_settings, filesystem)
+    else:
+        partition_by = layout.get("partition_by")
+        if partition_by is not None and partition_by not in schema.names:
+            raise CSVParseError(f"Unknown partition_by column: {partition_by}")
+        file_rows = None
+        if layout.get("file_bytes"):
+            # Rows per file from the sampled row width
+            file_rows = max(1, int(layout["file_bytes"] / sniffed["bytes_per_row"]))
+        writer = DatasetWriter(parquet_path, schema, parquet_settings, partition_by, file_rows, filesystem=filesystem)
+
+    profiler = TableProfiler(schema)
+    sampler = None
+    if preview is not None:
+        preview_path, head_rows, sample_rows = preview
+        sampler = PreviewSampler(schema, head_rows, sample_rows)
+    row_count = 0
+    blocks = 0
+    with writer:
+        try:
+            for batch in reader:
+                if batch.schema != schema:
+                    _widen_output(writer, profiler, sampler, schema, batch.schema)
+                    schema = batch.schema
+                writer.write_batch(batch)
+                profiler.update(batch)
+                if sampler is not None:
+                    sampler.update(batch)
+                row_count += batch.num_rows
+                blocks += 1
+                if progress is not None:
+                    if engine == "duckdb":
+                        # DuckDB reads the file itself; estimate from the
+                        # sampled row width
+                        bytes_parsed = int(row_count * sniffed["bytes_per_row"])
+                    else:
+                        # Each batch is one block; tell() alone overshoots
+                        # because pyarrow reads ahead
+                        bytes_parsed = min(source.tell(), blocks * block_size)
+                    progress({
+                        "bytes_parsed": bytes_parsed,
+                        "rows_written": row_count,
+                        "row_groups": writer.row_groups,
+                    })
+        except (pa.ArrowInvalid, duckdb.Error, OSError) as e:
+            raise CSVParseError(str(e)) from e
+
+    if sampler is not None:
+        sampler.write(preview_path, filesystem)
+
+    return {
+        "row_count": row_count,
+        "column_count": len(schema),
+        "schema": {
+            "columns": schema.names,
+            "dtypes": {f.name: str(f.type) for f in schema},
+        },
+        "column_stats": profiler.result(),
+    }
+
+
+def convert_csv_to_parquet(
+    source,
+    parquet_path,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    progress=None,
+    preview_path=None,
+    head_rows: int = DEFAULT_HEAD_ROWS,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    engine: str = "pyarrow",
+    dtypes: dict = None,
+    sample_bytes: int = DEFAULT_SAMPLE_BYTES,
+    parquet_settings: dict = None,
+    layout: dict = None,
+    filesystem=None,
+) -> dict:
+    """
+    Convert a CSV stream to a Parquet file without loading it into memory.
+
+    Args:
+        source: Seekable binary file object positioned at the start of the CSV
+        parquet_path: Destination path for the Parquet file (or dataset
+            directory, with layout)
+        block_size: Bytes of CSV decoded per batch; with the row-group size,
+            bounds peak memory
+        progress: Optional callback receiving {"bytes_parsed", "rows_written",
+            "row_groups"} after each block is parsed; row_groups counts
+            the row groups written so far
+        preview_path: Optional destination for a preview artifact (see
+            previews.PreviewSampler)
+        head_rows: Leading rows kept in the preview
+        sample_rows: Randomly sampled rows kept in the preview
+        engine: Parser engine, "pyarrow" or "duckdb" (see csv_parsers)
+        dtypes: Optional {column: type name} overrides for inferred types
+        sample_bytes: Bytes sampled to detect the encoding and column types
+            (the inferred types only as hints; see csv_parsers.convert_hints)
+        parquet_settings: Parquet layout (parquet_profiles.resolve_profile);
+            the default profile if None
+        layout: Optional {"partition_by": column or None, "file_bytes":
+            approximate CSV bytes per data file or None} to write a
+            dataset directory (see datasets.DatasetWriter) instead of one file
+        filesystem: Optional pyarrow filesystem that parquet_path and
+            preview_path are in (default: local disk)
+
+    Returns:
+        dict with row_count, column_count, schema ({"columns", "dtypes"})
+        and column_stats (see column_stats.ColumnProfiler.result)
+
+    Raises:
+        EmptyCSVError: If the CSV is empty
+        CSVParseError: If the CSV is malformed, or dtypes, parquet_settings
+            or layout name an unknown column
+        PartitionError: If the partition column has too many values
+        ValueError: For an unknown engine or dtype
+    """
+    preview = (preview_path, head_rows, sample_rows) if preview_path else None
+    parquet_settings = parquet_settings or resolve_profile()
+    try:
+        sniffed = sniff_csv(source, sample_bytes, dtypes)
+        return _stream_to_parquet(source, parquet_path, block_size, engine, sniffed, parquet_settings, layout, progress, preview, filesystem)
+    except BaseException:
+        # Never leave a half-written Parquet file (or preview) behind
+        remove_parquet(parquet_path, filesystem)
+        if preview_path:
+            remove_parquet(preview_path, filesystem)
+        raise
+
+
+def convert_csv_file(
+    csv_path,
+    parquet_path,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    head_rows: int = DEFAULT_HEAD_ROWS,
+    sample_rows: int = DEFAULT_SAMPLE_ROWS,
+    engine: str = "pyarrow",
+    dtypes: dict = None,
+    sample_bytes: int = DEFAULT_SAMPLE_BYTES,
+    parquet_settings: dict = None,
+    layout: dict = None,
+    filesystem=None,
+    progress=None,
+) -> dict:
+    """
+    Convert a spooled CSV file on disk to Parquet, with its preview.
+    Entry point for the conversion process pool: takes plain paths so the
+    job pickles cheaply, and only publishes the Parquet file and preview
+    (previews.preview_path_for) once both are complete.
+
+    With a filesystem (an object store), the files are streamed to their
+    final keys instead: an object only appears once its upload completes,
+    and the upload isn't recorded until conversion has finished.
+
+    Args:
+        csv_path: Path to the spooled CSV file
+        parquet_path: Final destination of the Parquet file
+        block_size: Bytes of CSV decoded per batch
+        head_rows: Leading rows kept in the preview
+        sample_rows: Randomly sampled rows kept in the preview
+        engine: Parser engine, "pyarrow" or "duckdb"
+        dtypes: Optional {column: type name} overrides
+        sample_bytes: Bytes sampled to detect the encoding and column types
+        parquet_settings: Parquet layout; the default profile if None
+        layout: Optional dataset layout (see convert_csv_to_parquet)
+        filesystem: Optional pyarrow filesystem parquet_path is in
+        progress: Optional per-block progress callback
+
+    Returns:
+        dict with row_count, column_count, schema and column_stats
+    """
+    if filesystem is not None:
+        with open(csv_path, "rb") as source:
+            return convert_csv_to_parquet(
+                source,
+                parquet_path,
+                block_size,
+                progress,
+                preview_path=preview_path_for(parquet_path),
+                head_rows=head_rows,
+                sample_rows=sample_rows,
+                engine=engine,
+                dtypes=dtypes,
+                sample_bytes=sample_bytes,
+                parquet_settings=parquet_settings,
+                layout=layout,
+                filesystem=filesystem,
+            )
+
+    parquet_path = Path(parquet_path)
+    partial_path = parquet_path.with_name(parquet_path.name + ".part")
+    final_preview_path = preview_path_for(parquet_path)
+    partial_preview_path = final_preview_path.with_name(final_preview_path.name + ".part")
+
+    with open(csv_path, "rb") as source:
+        result = convert_csv_to_parquet(
+            source,
+            partial_path,
+            block_size,
+            progress,
+            preview_path=partial_preview_path,
+            head_rows=head_rows,
+            sample_rows=sample_rows,
+            engine=engine,
+            dtypes=dtypes,
+            sample_bytes=sample_bytes,
+            parquet_settings=parquet_settings,
+            layout=layout,
+        )
+
+    os.replace(partial_preview_path, final_preview_path)
+    os.replace(partial_path, parquet_path)
+    return result
+
+
+def _content_digest():
+    return hashlib.blake2b(digest_size=32)
+
+
+def spool_and_hash(source, destination, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Copy a file object to another, hashing the bytes as they stream past.
+
+    Returns:
+        Hex BLAKE2b-256 digest of the copied bytes
+    """
+    digest = _content_digest()
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        destination.write(chunk)
+    return digest.hexdigest()
+
+
+def content_key(content_hash: str, options: dict = None) -> str:
+    """
+    Key under which a converted CSV is stored: its content hash, combined
+    with the conversion options an upload asked for (dtype overrides,
+    Parquet profile) when there are any, since those change the Parquet
+    file produced from the same bytes.
+    """
+    options = {name: value for name, value in (options or {}).items() if value}
+    if not options:
+        return content_hash
+    digest = _content_digest()
+    digest.update(content_hash.encode())
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def hash_file(path, chunk_size: int = 1024 * 1024) -> str:
+    """Content hash of a file on disk, as computed by spool_and_hash."""
+    digest = _content_digest()
+    with open(path, "rb") as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,108 @@
+"""
+Background upload jobs.
+Tracks uploads accepted with ?async=true while they convert, and fans their
+progress events out to any number of SSE subscribers.
+"""
+
+import asyncio
+import time
+import uuid
+
+# Events after which a job is finished
+TERMINAL_EVENTS = ("done", "error")
+
+
+class UploadJob:
+    """State of a single background upload."""
+
+    def __init__(self, user_id: str, filename: str, total_bytes: int):
+        self.job_id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.filename = filename
+        self.total_bytes = total_bytes
+        self.created_at = time.time()
+        self.status = "queued"
+        # Most recent event, replayed to late subscribers
+        self.last_event = {
+            "event": "queued",
+            "data": {"job_id": self.job_id, "filename": filename, "total_bytes": total_bytes},
+        }
+        self.task = None
+        self._subscribers = set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_EVENTS
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "last_event": self.last_event,
+        }
+
+
+class JobRegistry:
+    """
+    In-process registry of upload jobs.
+    Finished jobs are kept for `retention` seconds so clients that connect
+    late still receive the final event.
+    """
+
+    def __init__(self, retention: float = 600):
+        self.retention = retention
+        self._jobs = {}
+
+    def create(self, user_id: str, filename: str, total_bytes: int) -> UploadJob:
+        job = UploadJob(user_id, filename, total_bytes)
+        self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str, user_id: str):
+        """Return the job if it exists and belongs to user_id, else None."""
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def publish(self, job: UploadJob, event: str, data: dict):
+        """Record an event and deliver it to every subscriber."""
+        if job.finished:
+            return
+
+        if event == "progress":
+            data = {**data, "total_bytes": job.total_bytes}
+            job.status = "running"
+        elif event in TERMINAL_EVENTS:
+            job.status = event
+            asyncio.get_running_loop().call_later(
+                self.retention, self._jobs.pop, job.job_id, None
+            )
+
+        job.last_event = {"event": event, "data": data}
+        for queue in job._subscribers:
+            queue.put_nowait(job.last_event)
+
+    async def subscribe(self, job: UploadJob):
+        """
+        Yield the job's current state, then each new event until it finishes.
+        """
+        queue = asyncio.Queue()
+        job._subscribers.add(queue)
+        try:
+            event = job.last_event
+            while True:
+                yield event
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+                event = await queue.get()
+        finally:
+            job._subscribers.discard(queue)
+
+    async def shutdown(self):
+        """Cancel jobs that are still running."""
+        tasks = [job.task for job in self._jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,10 +1,93 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from config import (
+    CONVERSION_WORKERS,
+    CONVERSION_QUEUE_SIZE,
+    CONVERSION_TIMEOUT,
+    UPLOAD_JOB_RETENTION,
+    METADATA_URL,
+    DB_MAX_READERS,
+    DB_ACQUIRE_TIMEOUT,
+    STORAGE_URI,
+    S3_OPTIONS,
+    STORAGE_IO_THREADS,
+    STORAGE_MAX_KNOWN_DIRECTORIES,
+    UPLOAD_SESSION_TTL,
+    UPLOAD_SESSION_GC_INTERVAL,
+    STORAGE_GC_INTERVAL,
+    STORAGE_GC_GRACE,
+    STORAGE_GC_BATCH_SIZE,
+    STORAGE_GC_DELETE_RATE,
+    STORAGE_RECONCILE_INTERVAL,
+    STORAGE_ORPHAN_GRACE,
+)
+from database import open_connection_manager, close_connection_manager, get_connection_manager
+from executor import ConversionExecutor
+from storage import open_storage, close_storage
+from jobs import JobRegistry
+from upload_cache import query_results, listen_for_upload_changes
+from upload_gc import run_storage_gc
+from upload_sessions import run_session_gc
 
 # Import routers
-from routers import auth, health, users, upload
+from routers import auth, health, users, upload, data, query
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start shared background resources and stop them on shutdown."""
+    # Before the connection manager, which lets DuckDB read the backend
+    open_storage(
+        STORAGE_URI,
+        S3_OPTIONS,
+        max_workers=STORAGE_IO_THREADS,
+        max_known_directories=STORAGE_MAX_KNOWN_DIRECTORIES,
+    )
+    open_connection_manager(
+        METADATA_URL,
+        max_readers=DB_MAX_READERS,
+        acquire_timeout=DB_ACQUIRE_TIMEOUT,
+    )
+    app.state.converter = ConversionExecutor(
+        max_workers=CONVERSION_WORKERS or None,
+        max_queue=CONVERSION_QUEUE_SIZE,
+        timeout=CONVERSION_TIMEOUT,
+    )
+    app.state.converter.start()
+    app.state.upload_jobs = JobRegistry(retention=UPLOAD_JOB_RETENTION)
+    session_gc = asyncio.create_task(
+        run_session_gc(UPLOAD_SESSION_GC_INTERVAL, UPLOAD_SESSION_TTL)
+    )
+    storage_gc = asyncio.create_task(
+        run_storage_gc(
+            STORAGE_GC_INTERVAL,
+            STORAGE_GC_GRACE,
+            STORAGE_GC_BATCH_SIZE,
+            STORAGE_GC_DELETE_RATE,
+            STORAGE_RECONCILE_INTERVAL,
+            STORAGE_ORPHAN_GRACE,
+        )
+    )
+    # Other workers' writes drop what this one cached for them
+    upload_changes = asyncio.create_task(listen_for_upload_changes())
+    try:
+        yield
+    finally:
+        for task in (session_gc, storage_gc, upload_changes):
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+        await app.state.upload_jobs.shutdown()
+        await app.state.converter.shutdown()
+        query_results.close()
+        await get_connection_manager().aclose()
+        close_connection_manager()
+        close_storage()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Enable CORS so Next.js can call this API
 app.add_middleware(
@@ -15,8 +98,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+
+@app.middleware("http")
+async def persist_refreshed_session(request: Request, call_next):
+    """
+    Send the new session cookie when an API request refreshed the session,
+    so the browser stops presenting the spent refresh token.
+    """
+    response = await call_next(request)
+    sealed_session = getattr(request.state, "refreshed_session", None)
+    if sealed_session:
+        response.set_cookie(
+            key="wos_session",
+            value=sealed_session,
+            secure=True,
+            httponly=True,
+            samesite="lax",
+        )
+    return response
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(health.router)
 app.include_router(users.router)
-app.include_router(upload.router)
\ No newline at end of file
+app.include_router(upload.router)
+app.include_router(data.router)
+app.include_router(query.router)
@@ -0,0 +1,187 @@
+"""
+Metadata schema migrations.
+Each migration runs once, in order, inside its own transaction, and is
+recorded in schema_migrations; apply_migrations() (run by db_setup.py)
+applies those a database is missing. Migrations only ever add: a change to
+the schema is a new migration at the end of MIGRATIONS, never an edit to
+one that has shipped.
+
+The first migrations recreate the schema that db_setup.py used to build
+directly. Their statements are idempotent, so a database created before
+migrations existed adopts them without changes.
+
+Every migration runs on both metadata backends, DuckDB and PostgreSQL;
+types that are spelled differently come from the types argument.
+"""
+
+from datetime import datetime
+from upload_summary import add_listing_versions, create_summary_tables, rebuild_summaries
+
+# Column types that differ between the backends
+TYPES = {
+    "duckdb": {"blob": "BLOB"},
+    "postgres": {"blob": "BYTEA"},
+}
+
+# Advisory lock held while a PostgreSQL database migrates, so nodes
+# starting together take turns
+_MIGRATION_LOCK = 25001
+
+
+def _create_uploads(conn, types):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS uploads (
+            upload_id VARCHAR PRIMARY KEY,
+            user_id VARCHAR NOT NULL,
+            filename VARCHAR NOT NULL,
+            uploaded_at TIMESTAMP NOT NULL,
+            parquet_path VARCHAR NOT NULL,
+            row_count INTEGER,
+            column_count INTEGER,
+            schema_json JSON
+        )
+    """)
+    # Faster queries by user, and by time
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_user_id ON uploads(user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_uploads_uploaded_at ON uploads(uploaded_at)")
+
+
+def _create_column_stats(conn, types):
+    # Per-column statistics, filled in at upload time
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS upload_column_stats (
+            upload_id VARCHAR NOT NULL,
+            position INTEGER NOT NULL,
+            column_name VARCHAR NOT NULL,
+            dtype VARCHAR NOT NULL,
+            null_count BIGINT NOT NULL,
+            min_value JSON,
+            max_value JSON,
+            distinct_count BIGINT,
+            distinct_sketch {types['blob']},
+            quantiles JSON,
+            PRIMARY KEY (upload_id, position)
+        )
+    """)
+
+
+def _create_upload_blobs(conn, types):
+    # Content hash of each upload's CSV; uploads of identical content
+    # share one Parquet file
+    conn.execute("ALTER TABLE uploads ADD COLUMN IF NOT EXISTS content_hash VARCHAR")
+    # Stored Parquet files, one per user and content hash, with the number
+    # of uploads referring to each
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS upload_blobs (
+            user_id VARCHAR NOT NULL,
+            content_hash VARCHAR NOT NULL,
+            parquet_path VARCHAR NOT NULL,
+            ref_count INTEGER NOT NULL,
+            row_count INTEGER,
+            column_count INTEGER,
+            schema_json JSON,
+            created_at TIMESTAMP NOT NULL,
+            PRIMARY KEY (user_id, content_hash)
+        )
+    """)
+
+
+def _create_upload_sessions(conn, types):
+    # Resumable upload sessions
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            session_id VARCHAR PRIMARY KEY,
+            user_id VARCHAR NOT NULL,
+            filename VARCHAR NOT NULL,
+            total_bytes BIGINT NOT NULL,
+            committed_bytes BIGINT NOT NULL,
+            status VARCHAR NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+    """)
+
+
+def _add_deleted_at(conn, types):
+    # Deleted uploads are only marked; the storage collector purges them
+    # (see upload_gc)
+    conn.execute("ALTER TABLE uploads ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP")
+
+
+def _create_upload_summaries(conn, types):
+    # Materialized upload statistics, maintained on upload and delete;
+    # filled from uploads the first time
+    create_summary_tables(conn)
+    if not conn.execute("SELECT COUNT(*) FROM global_upload_stats").fetchone()[0]:
+        rebuild_summaries(conn)
+
+
+def _add_listing_versions(conn, types):
+    # Per-user version of the upload listing, shared by every worker
+    add_listing_versions(conn)
+
+
+# (version, name, migration(conn, types)), in the order they are applied
+MIGRATIONS = [
+    (1, "create_uploads", _create_uploads),
+    (2, "create_column_stats", _create_column_stats),
+    (3, "create_upload_blobs", _create_upload_blobs),
+    (4, "create_upload_sessions", _create_upload_sessions),
+    (5, "add_deleted_at", _add_deleted_at),
+    (6, "create_upload_summaries", _create_upload_summaries),
+    (7, "add_listing_versions", _add_listing_versions),
+]
+
+
+def applied_migrations(conn) -> list:
+    """Versions recorded in schema_migrations, in order."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR NOT NULL,
+            applied_at TIMESTAMP NOT NULL
+        )
+    """)
+    rows = conn.execute("SELECT version FROM schema_migrations ORDER BY version").fetchall()
+    return [row[0] for row in rows]
+
+
+def apply_migrations(conn, dialect: str = "duckdb") -> list:
+    """
+    Apply the migrations the database is missing, each in its own
+    transaction. A failed migration is rolled back and raised; those
+    before it stay applied.
+
+    Args:
+        conn: Standalone connection from database.get_db_connection(),
+            not inside a transaction
+        dialect: "duckdb" or "postgres" (database.metadata_dialect())
+
+    Returns:
+        Names of the migrations applied
+    """
+    types = TYPES[dialect]
+    if dialect == "postgres":
+        conn.execute(f"SELECT pg_advisory_lock({_MIGRATION_LOCK})")
+    try:
+        done = set(applied_migrations(conn))
+        applied = []
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            conn.execute("BEGIN TRANSACTION")
+            try:
+                migrate(conn, types)
+                conn.execute("""
+                    INSERT INTO schema_migrations (version, name, applied_at)
+                    VALUES (?, ?, ?)
+                """, [version, name, datetime.now()])
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            applied.append(name)
+        return applied
+    finally:
+        if dialect == "postgres":
+            conn.execute(f"SELECT pg_advisory_unlock({_MIGRATION_LOCK})")
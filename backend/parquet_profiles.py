@@ -0,0 +1,288 @@
+"""
+Parquet writer profiles.
+A profile is a named set of layout settings for the Parquet files written
+at ingest: codec and level, row-group and page sizes, dictionary encoding,
+sort keys, page indexes and bloom filters. The deployment picks a default
+profile (PARQUET_PROFILE); an upload can name another and override single
+settings on top of it.
+
+Settings:
+    compression: "zstd", "lz4", "snappy", "gzip", "brotli" or "none"
+    compression_level: Codec level, or None for the codec's default
+    row_group_rows: Target rows per row group; None writes one row group
+        per parsed CSV block
+    data_page_size: Target bytes per data page
+    dictionary_columns: Columns to dictionary-encode; None for all, [] for none
+    dictionary_page_size: Bytes a column's dictionary may grow to before the
+        rest of the row group falls back to plain encoding
+    sort_by: Columns each row group is sorted by; prefix "-" for descending
+    page_index: Write column and offset indexes for page-level pruning
+    bloom_filter_columns: Columns to write bloom filters for
+    bloom_filter_fpp: False-positive probability of those filters
+"""
+
+import os
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+COMPRESSION_CODECS = {"zstd", "lz4", "snappy", "gzip", "brotli", "none"}
+
+_BASE_SETTINGS = {
+    "compression": "zstd",
+    "compression_level": None,
+    "row_group_rows": None,
+    "data_page_size": 1024 * 1024,
+    "dictionary_columns": None,
+    "dictionary_page_size": 1024 * 1024,
+    "sort_by": [],
+    "page_index": False,
+    "bloom_filter_columns": [],
+    "bloom_filter_fpp": 0.05,
+}
+
+PROFILES = {
+    # zstd with the parser's block-sized row groups
+    "balanced": {**_BASE_SETTINGS, "compression_level": 3},
+    # Cheapest to write and decompress
+    "fast": {**_BASE_SETTINGS, "compression": "lz4"},
+    # Smallest files, large row groups with page indexes for pruning
+    "compact": {
+        **_BASE_SETTINGS,
+        "compression_level": 9,
+        "row_group_rows": 1024 * 1024,
+        "page_index": True,
+    },
+    # What ingest wrote before profiles existed
+    "snappy": {**_BASE_SETTINGS, "compression": "snappy"},
+}
+
+DEFAULT_PROFILE = "balanced"
+
+
+def _positive_int(name, value, optional=False):
+    if value is None and optional:
+        return
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        raise ValueError(f"{name} must be a positive integer")
+
+
+def _column_list(name, value, optional=False):
+    if value is None and optional:
+        return
+    if not isinstance(value, list) or not all(isinstance(c, str) for c in value):
+        raise ValueError(f"{name} must be a list of column names")
+
+
+def resolve_profile(name: str = None, overrides: dict = None) -> dict:
+    """
+    Settings of a named profile with per-upload overrides applied.
+
+    Args:
+        name: Profile name; DEFAULT_PROFILE if None
+        overrides: Optional {setting: value} replacing the profile's values
+
+    Returns:
+        dict of every setting (see module docstring)
+
+    Raises:
+        ValueError: For an unknown profile or setting, or an invalid value
+    """
+    name = name or DEFAULT_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown Parquet profile '{name}', expected one of {', '.join(PROFILES)}")
+
+    overrides = overrides or {}
+    unknown = set(overrides) - set(_BASE_SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown Parquet setting(s): {', '.join(sorted(unknown))}")
+    settings = {**PROFILES[name], **overrides}
+
+    if settings["compression"] not in COMPRESSION_CODECS:
+        raise ValueError(f"compression must be one of {', '.join(sorted(COMPRESSION_CODECS))}")
+    if overrides.get("compression") and "compression_level" not in overrides:
+        # A level only means something for the codec it was chosen for
+        settings["compression_level"] = None
+    _positive_int("compression_level", settings["compression_level"], optional=True)
+    _positive_int("row_group_rows", settings["row_group_rows"], optional=True)
+    _positive_int("data_page_size", settings["data_page_size"])
+    _positive_int("dictionary_page_size", settings["dictionary_page_size"])
+    _column_list("dictionary_columns", settings["dictionary_columns"], optional=True)
+    _column_list("sort_by", settings["sort_by"])
+    _column_list("bloom_filter_columns", settings["bloom_filter_columns"])
+    if not isinstance(settings["page_index"], bool):
+        raise ValueError("page_index must be true or false")
+    fpp = settings["bloom_filter_fpp"]
+    if not isinstance(fpp, (int, float)) or isinstance(fpp, bool) or not 0 < fpp < 1:
+        raise ValueError("bloom_filter_fpp must be between 0 and 1")
+    return settings
+
+
+def _sort_keys(settings: dict) -> list:
+    return [
+        (key[1:], "descending") if key.startswith("-") else (key, "ascending")
+        for key in settings["sort_by"]
+    ]
+
+
+def unknown_columns(settings: dict, names) -> list:
+    """Columns named by the settings that are not in names."""
+    named = set(settings["bloom_filter_columns"]) | {key for key, _ in _sort_keys(settings)}
+    named |= set(settings["dictionary_columns"] or [])
+    return sorted(named - set(names))
+
+
+def writer_options(settings: dict, schema: pa.Schema) -> dict:
+    """Keyword arguments for pyarrow.parquet.ParquetWriter."""
+    options = {
+        "compression": settings["compression"],
+        "compression_level": settings["compression_level"],
+        "data_page_size": settings["data_page_size"],
+        "use_dictionary": True if settings["dictionary_columns"] is None else settings["dictionary_columns"],
+        "dictionary_pagesize_limit": settings["dictionary_page_size"],
+        "write_page_index": settings["page_index"],
+    }
+    if settings["sort_by"]:
+        options["sorting_columns"] = pq.SortingColumn.from_ordering(schema, _sort_keys(settings))
+    if settings["bloom_filter_columns"]:
+        bloom_filter = {"fpp": settings["bloom_filter_fpp"]}
+        if settings["row_group_rows"]:
+            # A row group holds at most this many distinct values; pyarrow
+            # otherwise sizes filters for a million
+            bloom_filter["ndv"] = settings["row_group_rows"]
+        options["bloom_filter_options"] = {
+            column: bloom_filter for column in settings["bloom_filter_columns"]
+        }
+    return options
+
+
+class RowGroupWriter:
+    """
+    Writes record batches to a Parquet file with a profile's layout.
+    Batches are buffered up to row_group_rows (or written one row group
+    each when it is None), and each row group is sorted by sort_by before
+    it is written. The file as a whole is not sorted: every row group is,
+    which is what min/max and page-index pruning use.
+
+    Usage:
+        with RowGroupWriter(path, schema, settings) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+    With a pyarrow filesystem, path is within it and the file is streamed
+    to it (as a multipart upload on S3).
+    """
+
+    def __init__(self, path, schema: pa.Schema, settings: dict, filesystem=None):
+        self.settings = settings
+        self.schema = schema
+        self.row_groups = 0
+        self._sort_keys = _sort_keys(settings)
+        self._pending = []
+        self._pending_rows = 0
+        self._path = str(path) if filesystem is not None else path
+        self._filesystem = filesystem
+        self._writer = self._open()
+
+    def _open(self):
+        return pq.ParquetWriter(
+            self._path, self.schema, filesystem=self._filesystem, **writer_options(self.settings, self.schema)
+        )
+
+    def retype(self, schema: pa.Schema, observe=None):
+        """
+        Switch to a schema with some columns widened: the row groups
+        written so far are rewritten with those columns cast, one at a
+        time, and writing continues after them. Also works on a closed
+        writer, which should then be closed again.
+
+        Args:
+            schema: The new schema, with the same columns
+            observe: Optional callback receiving each rewritten row group
+                and pending batch as a pyarrow.Table
+        """
+        self._writer.close()
+        self.schema = schema
+        if not self.row_groups:
+            self._writer = self._open()
+        else:
+            previous = f"{self._path}.retype"
+            if self._filesystem is None:
+                os.replace(self._path, previous)
+            else:
+                self._filesystem.move(self._path, previous)
+            self._writer = self._open()
+            source = pq.ParquetFile(previous, filesystem=self._filesystem)
+            try:
+                for i in range(source.num_row_groups):
+                    table = source.read_row_group(i).cast(schema)
+                    if observe is not None:
+                        observe(table)
+                    self._writer.write_table(table, row_group_size=table.num_rows)
+            finally:
+                source.close()
+                if self._filesystem is None:
+                    os.remove(previous)
+                else:
+                    self._filesystem.delete_file(previous)
+        self._pending = [batch.cast(schema) for batch in self._pending]
+        if observe is not None and self._pending:
+            observe(pa.Table.from_batches(self._pending))
+
+    def write_batch(self, batch: pa.RecordBatch):
+        target = self.settings["row_group_rows"]
+        if not target:
+            self._write(pa.Table.from_batches([batch]))
+            return
+
+        self._pending.append(batch)
+        self._pending_rows += batch.num_rows
+        if self._pending_rows < target:
+            return
+        table = pa.Table.from_batches(self._pending)
+        while table.num_rows >= target:
+            self._write(table.slice(0, target))
+            table = table.slice(target)
+        self._pending = table.to_batches()
+        self._pending_rows = table.num_rows
+
+    @property
+    def pending_rows(self) -> int:
+        """Rows buffered for the next row group."""
+        return self._pending_rows
+
+    def flush(self):
+        """Write the buffered rows out as a row group, even a short one."""
+        if self._pending_rows:
+            self._write(pa.Table.from_batches(self._pending))
+            self._pending = []
+            self._pending_rows = 0
+
+    def _write(self, table: pa.Table):
+        if not table.num_rows:
+            return
+        if self._sort_keys:
+            # sort_indices can't order dictionary arrays; sort on their values
+            keys = pa.table({
+                name: table.column(name).cast(table.schema.field(name).type.value_type)
+                if pa.types.is_dictionary(table.schema.field(name).type)
+                else table.column(name)
+                for name, _ in self._sort_keys
+            })
+            table = table.take(pc.sort_indices(keys, self._sort_keys))
+        self._writer.write_table(table, row_group_size=table.num_rows)
+        self.row_groups += 1
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # The caller removes the partial file
+            self._writer.close()
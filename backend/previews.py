@@ -0,0 +1,192 @@
+"""
+Upload previews.
+At ingest, the first rows of a file and a uniform random sample of all its
+rows are collected from the batches being converted and written next to
+the Parquet file as a small zstd-compressed Arrow IPC file. The preview
+endpoint serves them from an in-memory LRU of serialized responses, so a
+preview never opens the Parquet file.
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pyarrow as pa
+
+DEFAULT_HEAD_ROWS = 20
+DEFAULT_SAMPLE_ROWS = 100
+
+# Schema metadata key recording how many leading rows are the head
+_HEAD_ROWS_KEY = b"preview_head_rows"
+
+
+def preview_path_for(parquet_path):
+    """
+    Location of the preview artifact for an upload's Parquet file: a Path,
+    or a URI for a URI (s3://bucket/key.parquet).
+    """
+    if isinstance(parquet_path, str) and "://" in parquet_path:
+        return parquet_path.rsplit(".", 1)[0] + ".preview.arrow"
+    parquet_path = Path(parquet_path)
+    return parquet_path.with_name(parquet_path.stem + ".preview.arrow")
+
+
+class PreviewSampler:
+    """
+    Collects the head and a reservoir sample of a stream of record batches.
+    The sample keeps the sample_rows rows with the smallest random keys
+    seen so far (bottom-k sampling), which is a uniform sample without
+    replacement and can be updated a whole batch at a time.
+    """
+
+    def __init__(self, schema: pa.Schema, head_rows: int = DEFAULT_HEAD_ROWS, sample_rows: int = DEFAULT_SAMPLE_ROWS):
+        self.schema = schema
+        self.head_rows = head_rows
+        self.sample_rows = sample_rows
+        self._head = []
+        self._head_count = 0
+        self._sample = schema.empty_table()
+        self._keys = np.empty(0)
+        self._rng = np.random.default_rng()
+
+    def update(self, batch: pa.RecordBatch):
+        if self._head_count < self.head_rows:
+            head = batch.slice(0, self.head_rows - self._head_count)
+            self._head.append(head)
+            self._head_count += head.num_rows
+
+        if not self.sample_rows or not batch.num_rows:
+            return
+
+        keys = self._rng.random(batch.num_rows)
+        if batch.num_rows > self.sample_rows:
+            # Only a batch's own bottom k can make the overall bottom k
+            chosen = np.argpartition(keys, self.sample_rows)[:self.sample_rows]
+            batch, keys = batch.take(pa.array(chosen)), keys[chosen]
+
+        candidates = pa.concat_tables([self._sample, pa.Table.from_batches([batch])])
+        keys = np.concatenate([self._keys, keys])
+        if len(keys) > self.sample_rows:
+            chosen = np.argpartition(keys, self.sample_rows)[:self.sample_rows]
+            candidates, keys = candidates.take(pa.array(chosen)), keys[chosen]
+        self._sample, self._keys = candidates, keys
+
+    def retype(self, schema: pa.Schema):
+        """Cast what has been collected so far to a schema with columns widened."""
+        self.schema = schema
+        self._head = [batch.cast(schema) for batch in self._head]
+        self._sample = self._sample.cast(schema)
+
+    def write(self, path, filesystem=None):
+        """
+        Write the head followed by the sample as one Arrow IPC file, to
+        local disk or to a path within a pyarrow filesystem.
+        """
+        head = pa.Table.from_batches(self._head, schema=self.schema)
+        # IPC files allow one dictionary per column, and each parsed batch
+        # brings its own
+        table = pa.concat_tables([head, self._sample]).unify_dictionaries()
+        table = table.replace_schema_metadata({_HEAD_ROWS_KEY: str(head.num_rows).encode()})
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        if filesystem is None:
+            with pa.ipc.new_file(str(path), table.schema, options=options) as writer:
+                writer.write_table(table)
+            return
+        with filesystem.open_output_stream(str(path)) as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+
+
+def read_preview(path, filesystem=None) -> dict:
+    """
+    Load a preview artifact, from local disk or a pyarrow filesystem.
+
+    Returns:
+        dict with columns, head and sample (lists of row dicts)
+    """
+    if filesystem is None:
+        with pa.ipc.open_file(str(path)) as reader:
+            table = reader.read_all()
+    else:
+        with filesystem.open_input_file(str(path)) as source:
+            table = pa.ipc.open_file(source).read_all()
+    head_rows = int(table.schema.metadata[_HEAD_ROWS_KEY])
+    rows = table.to_pylist()
+    return {
+        "columns": table.schema.names,
+        "head": rows[:head_rows],
+        "sample": rows[head_rows:],
+    }
+
+
+class PreviewCache:
+    """
+    LRU of serialized preview responses, bounded by their total size.
+    Entries remember their owner; a lookup by anyone else misses.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, upload_id: str, user_id: str):
+        """Return the cached body for the user's upload, or None."""
+        with self._lock:
+            entry = self._entries.get(upload_id)
+            if entry is None or entry[0] != user_id:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(upload_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, upload_id: str, user_id: str, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(upload_id)
+            self._entries[upload_id] = (user_id, body)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, upload_id: str):
+        with self._lock:
+            self._discard(upload_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _discard(self, upload_id: str):
+        entry = self._entries.pop(upload_id, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def serialize_preview(upload_id: str, row_count: int, preview: dict) -> bytes:
+    """JSON body of a preview response."""
+    return json.dumps({
+        "upload_id": upload_id,
+        "row_count": row_count,
+        **preview,
+    }, default=str).encode()
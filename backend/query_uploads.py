@@ -3,16 +3,19 @@ Helper script to query uploaded data.
 Shows how to retrieve metadata and query Parquet files.
 """
 
-from database import get_db_connection
+from config import QUERY_MEMORY_LIMIT, QUERY_THREADS, QUERY_TIMEOUT, QUERY_MAX_ROWS, STORAGE_URI, S3_OPTIONS, METADATA_URL
+from database import get_connection_manager, open_connection_manager
+from sql_engine import SQLQueryError, run_query, user_catalog
+from result_formats import FORMATS, stream_batches
+from upload_summary import read_summary, rebuild_summaries
+from storage import get_storage, open_storage
+from upload_queries import describe_parquet, parquet_source, quote_identifier, record_batch_reader, resolve_parquet_path
 import json
-from pathlib import Path
 
 def list_all_uploads():
     """List all uploads in the database."""
     
-    conn = get_db_connection()
-    
-    try:
+    with get_connection_manager().read() as conn:
         result = conn.execute("""
             SELECT 
                 upload_id,
@@ -22,6 +25,7 @@ def list_all_uploads():
                 row_count,
                 column_count
             FROM uploads
+            WHERE deleted_at IS NULL
             ORDER BY uploaded_at DESC
         """).fetchall()
         
@@ -39,22 +43,19 @@ def list_all_uploads():
             print(f"Uploaded: {row[3]}")
             print(f"Dimensions: {row[4]} rows × {row[5]} columns")
             print("-"*80)
-        
-    finally:
-        conn.close()
 
-def query_upload_data(upload_id: str, limit: int = 10):
+def query_upload_data(upload_id: str, limit: int = 10, output_path: str = None, output_format: str = "arrow"):
     """
     Query data from a specific upload.
     
     Args:
         upload_id: The upload ID to query
-        limit: Number of rows to return (default 10)
+        limit: Number of rows to return (default 10, None for all)
+        output_path: Optional file to stream the rows to instead of printing them
+        output_format: arrow, csv or ndjson (used with output_path)
     """
     
-    conn = get_db_connection()
-    
-    try:
+    with get_connection_manager().read() as conn:
         # Get upload metadata
         metadata = conn.execute("""
             SELECT 
@@ -64,53 +65,135 @@ def query_upload_data(upload_id: str, limit: int = 10):
                 column_count,
                 schema_json
             FROM uploads
-            WHERE upload_id = ?
+            WHERE upload_id = ? AND deleted_at IS NULL
         """, [upload_id]).fetchone()
+    
+    if not metadata:
+        print(f"Upload ID '{upload_id}' not found.")
+        return
+    
+    filename, parquet_path, row_count, col_count, schema_json = metadata
+    schema = json.loads(schema_json)
+    
+    print(f"\nQuerying: {filename}")
+    print(f"Upload ID: {upload_id}")
+    print(f"Dimensions: {row_count} rows × {col_count} columns")
+    print(f"Columns: {', '.join(schema['columns'])}")
+    print("\n" + "="*80)
+    
+    # Location of the parquet file (or dataset directory)
+    full_parquet_path = resolve_parquet_path(parquet_path)
+    
+    if not get_storage().exists(full_parquet_path):
+        print(f"✗ Parquet file not found: {full_parquet_path}")
+        return
+    
+    # The metadata may be in PostgreSQL; the data is always read by DuckDB
+    conn = get_connection_manager().scan_cursor()
+    try:
+        # Query the data as Arrow record batches, columns in upload order
+        source, params = parquet_source(full_parquet_path)
+        columns = ", ".join(quote_identifier(name) for name in describe_parquet(conn, full_parquet_path))
+        result = conn.execute(f"""
+            SELECT {columns}
+            FROM {source}
+            LIMIT ?
+        """, params + [row_count if limit is None else limit])
+        reader = record_batch_reader(result, 10000)
         
-        if not metadata:
-            print(f"Upload ID '{upload_id}' not found.")
-            return
-        
-        filename, parquet_path, row_count, col_count, schema_json = metadata
-        schema = json.loads(schema_json)
-        
-        print(f"\nQuerying: {filename}")
-        print(f"Upload ID: {upload_id}")
-        print(f"Dimensions: {row_count} rows × {col_count} columns")
-        print(f"Columns: {', '.join(schema['columns'])}")
-        print("\n" + "="*80)
-        
-        # Build full path to parquet file
-        base_path = Path(__file__).parent
-        full_parquet_path = base_path / parquet_path
-        
-        if not full_parquet_path.exists():
-            print(f"✗ Parquet file not found: {full_parquet_path}")
+        if output_path:
+            # Serialized batch by batch; rows never become Python objects
+            # (except for NDJSON)
+            with open(output_path, "wb") as f:
+                for chunk in stream_batches(reader, FORMATS[output_format]):
+                    f.write(chunk)
+            print(f"✓ Exported {filename} as {output_format} to {output_path}")
             return
         
-        # Query the data
-        result = conn.execute(f"""
-            SELECT * 
-            FROM read_parquet('{full_parquet_path}')
-            LIMIT {limit}
-        """).fetchall()
-        
         # Print results
-        print(f"\nFirst {min(limit, len(result))} rows:\n")
+        print(f"\nFirst {row_count if limit is None else min(limit, row_count)} rows:\n")
         
         # Print column headers
         print(" | ".join(schema['columns']))
         print("-" * 80)
         
         # Print data
-        for row in result:
-            print(" | ".join(str(val) for val in row))
-        
-        print("\n" + "="*80)
-        print(f"Showing {len(result)} of {row_count} total rows")
-        
+        shown = 0
+        for batch in reader:
+            columns = batch.to_pydict().values()
+            for row in zip(*columns):
+                print(" | ".join(str(val) for val in row))
+            shown += batch.num_rows
     finally:
         conn.close()
+    
+    print("\n" + "="*80)
+    print(f"Showing {shown} of {row_count} total rows")
+
+def run_sql(user_id: str, sql: str, output_path: str = None, output_format: str = "arrow"):
+    """
+    Run a SQL query across a user's uploads (see sql_engine).
+    
+    Args:
+        user_id: Whose uploads to query; each is a view named after its file
+        sql: A single SELECT
+        output_path: Optional file to stream the result to instead of printing it
+        output_format: arrow, csv or ndjson (used with output_path)
+    """
+    
+    print(f"\nTables: {', '.join(user_catalog(user_id)) or '(no uploads)'}")
+    
+    try:
+        table, truncated, _ = run_query(
+            user_id, sql, QUERY_MAX_ROWS, QUERY_MEMORY_LIMIT, QUERY_THREADS, QUERY_TIMEOUT
+        )
+    except SQLQueryError as e:
+        print(f"✗ {e}")
+        return
+    
+    if truncated:
+        print(f"Result truncated to {QUERY_MAX_ROWS} rows")
+    
+    if output_path:
+        with open(output_path, "wb") as f:
+            for chunk in stream_batches(table.to_reader(), FORMATS[output_format]):
+                f.write(chunk)
+        print(f"✓ Exported {table.num_rows} rows as {output_format} to {output_path}")
+        return
+    
+    print("\n" + " | ".join(table.column_names))
+    print("-" * 80)
+    for row in zip(*table.to_pydict().values()):
+        print(" | ".join(str(val) for val in row))
+    print("\n" + "="*80)
+    print(f"{table.num_rows} rows")
+
+def upload_stats(user_id: str = None) -> dict:
+    """
+    Upload counts, rows and dates, for one user or everyone.
+    Read from the summary tables kept by upload and delete (see upload_summary).
+    
+    Args:
+        user_id: Optional user ID to filter by
+    
+    Returns:
+        dict with total_uploads, total_rows, avg_rows_per_file, first_upload
+        and last_upload
+    """
+    
+    with get_connection_manager().read() as conn:
+        return read_summary(conn, user_id)
+
+def reconcile_upload_stats():
+    """
+    Rebuild the upload summary tables from the uploads table.
+    """
+    
+    with get_connection_manager().write() as conn:
+        result = rebuild_summaries(conn)
+    
+    print(f"✓ Rebuilt upload stats for {result['users']} users")
+    print(f"  Rows that had drifted: {result['drifted']}")
 
 def get_upload_stats(user_id: str = None):
     """
@@ -120,49 +203,39 @@ def get_upload_stats(user_id: str = None):
         user_id: Optional user ID to filter by
     """
     
-    conn = get_db_connection()
+    stats = upload_stats(user_id)
     
-    try:
-        if user_id:
-            result = conn.execute("""
-                SELECT 
-                    COUNT(*) as total_uploads,
-                    SUM(row_count) as total_rows,
-                    AVG(row_count) as avg_rows_per_file,
-                    MIN(uploaded_at) as first_upload,
-                    MAX(uploaded_at) as last_upload
-                FROM uploads
-                WHERE user_id = ?
-            """, [user_id]).fetchone()
-            
-            print(f"\nStats for user: {user_id}")
-        else:
-            result = conn.execute("""
-                SELECT 
-                    COUNT(*) as total_uploads,
-                    SUM(row_count) as total_rows,
-                    AVG(row_count) as avg_rows_per_file,
-                    MIN(uploaded_at) as first_upload,
-                    MAX(uploaded_at) as last_upload
-                FROM uploads
-            """).fetchone()
-            
-            print("\nGlobal upload stats:")
-        
-        print("="*80)
-        print(f"Total uploads: {result[0]}")
-        print(f"Total rows: {result[1]:,}")
-        print(f"Average rows per file: {result[2]:.0f}")
-        print(f"First upload: {result[3]}")
-        print(f"Last upload: {result[4]}")
-        print("="*80)
-        
-    finally:
-        conn.close()
+    if user_id:
+        print(f"\nStats for user: {user_id}")
+    else:
+        print("\nGlobal upload stats:")
+    
+    print("="*80)
+    print(f"Total uploads: {stats['total_uploads']}")
+    print(f"Total rows: {stats['total_rows'] or 0:,}")
+    print(f"Average rows per file: {stats['avg_rows_per_file'] or 0:.0f}")
+    print(f"First upload: {stats['first_upload']}")
+    print(f"Last upload: {stats['last_upload']}")
+    print("="*80)
+
+def print_usage():
+    """Print the command-line usage."""
+    
+    formats = "|".join(FORMATS)
+    print("Usage:")
+    print("  python query_uploads.py list")
+    print("  python query_uploads.py query <upload_id> [limit]")
+    print(f"  python query_uploads.py export <upload_id> <output_file> [{formats}] [limit]")
+    print(f"  python query_uploads.py sql <user_id> \"<query>\" [output_file] [{formats}]")
+    print("  python query_uploads.py stats [user_id]")
+    print("  python query_uploads.py reconcile-stats")
 
 if __name__ == "__main__":
     import sys
     
+    open_storage(STORAGE_URI, S3_OPTIONS)
+    open_connection_manager(METADATA_URL)
+    
     if len(sys.argv) > 1:
         command = sys.argv[1]
         
@@ -174,19 +247,42 @@ if __name__ == "__main__":
             limit = int(sys.argv[3]) if len(sys.argv) > 3 else 10
             query_upload_data(upload_id, limit)
         
+        elif command == "export" and len(sys.argv) > 3:
+            upload_id, output_path = sys.argv[2], sys.argv[3]
+            output_format = sys.argv[4] if len(sys.argv) > 4 else "arrow"
+            limit = int(sys.argv[5]) if len(sys.argv) > 5 else None
+            if output_format in FORMATS:
+                query_upload_data(upload_id, limit, output_path, output_format)
+            else:
+                print(f"✗ Unknown output format '{output_format}'\n")
+                print_usage()
+        
+        elif command == "sql" and len(sys.argv) > 3:
+            user_id, sql = sys.argv[2], sys.argv[3]
+            output_path = sys.argv[4] if len(sys.argv) > 4 else None
+            output_format = sys.argv[5] if len(sys.argv) > 5 else "arrow"
+            if output_format in FORMATS:
+                run_sql(user_id, sql, output_path, output_format)
+            else:
+                print(f"✗ Unknown output format '{output_format}'\n")
+                print_usage()
+        
         elif command == "stats":
             user_id = sys.argv[2] if len(sys.argv) > 2 else None
             get_upload_stats(user_id)
         
+        elif command == "reconcile-stats":
+            reconcile_upload_stats()
+        
         else:
-            print("Usage:")
-            print("  python query_uploads.py list")
-            print("  python query_uploads.py query <upload_id> [limit]")
-            print("  python query_uploads.py stats [user_id]")
+            print_usage()
     
     else:
         print("Available commands:")
         print("  list   - List all uploads")
         print("  query  - Query specific upload data")
+        print("  export - Stream upload data to a file (Arrow IPC, CSV or NDJSON)")
+        print("  sql    - Run SQL across a user's uploads (one view per file)")
         print("  stats  - Show upload statistics")
+        print("  reconcile-stats - Rebuild the upload statistics tables")
         print("\nRun with --help for usage details")
\ No newline at end of file
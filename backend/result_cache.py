@@ -0,0 +1,315 @@
+"""
+Two-tier cache of query results.
+Results are Arrow tables, kept in an LRU in memory up to a byte budget;
+entries evicted from memory spill to Arrow IPC files on disk, in a second
+LRU with its own budget, and are read back (memory-mapped) on a later hit.
+
+Keys are built by the caller from the normalized query and the uploads it
+read (result_key), so a new upload never hits a result computed without
+it. Every entry also carries tags, the upload ids it read; invalidate(tag)
+drops every entry with that tag from both tiers, which delete calls once
+its write has committed.
+
+A result computed while one of its tags was being invalidated must not be
+cached: take token() before running the query and pass it to put(), which
+drops the result if any of its tags was invalidated in the meantime.
+
+State is per worker process; each worker spills to its own directory.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# Schema metadata key holding an entry's info dict in its spill file
+_INFO_KEY = b"result_cache_info"
+# Invalidations remembered for put(); older tokens are treated as stale
+_INVALIDATION_HISTORY = 10000
+_SPILL_PREFIX = "worker-"
+
+
+def result_key(*parts) -> str:
+    """Cache key for a result; parts must be JSON-serializable."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove_stale_spill_directories(root: Path):
+    # Left behind by workers that exited without close()
+    for path in root.glob(f"{_SPILL_PREFIX}*"):
+        pid = path.name[len(_SPILL_PREFIX):].split("-", 1)[0]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class ResultCache:
+    """
+    Memory LRU of result tables with an Arrow IPC spill tier on disk.
+
+    Args:
+        max_bytes: Budget of the memory tier
+        spill_root: Directory for spill files; None keeps results in memory only
+        spill_max_bytes: Budget of the disk tier
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, spill_root=None, spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.spill_root = Path(spill_root) if spill_root else None
+        self.spill_max_bytes = spill_max_bytes if spill_root else 0
+        # key -> (table, tags, info)
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        # key -> (path, size, tags)
+        self._disk = OrderedDict()
+        self._disk_size = 0
+        # Evicted from memory, being written to disk
+        self._spilling = {}
+        self._spill_dir = None
+        self._seq = 0
+        self._invalidated = OrderedDict()
+        self._horizon = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.spills = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def fits(self, nbytes: int) -> bool:
+        """Whether a result of this size can be cached at all."""
+        return nbytes <= self.max_bytes
+
+    def token(self) -> int:
+        """Take before computing a result; pass to put()."""
+        with self._lock:
+            return self._seq
+
+    def get(self, key: str):
+        """
+        Return (table, info) for a cached result, or None.
+        A result found on disk moves back to memory.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[2]
+            spilled = self._disk.pop(key, None)
+            if spilled is None:
+                self.misses += 1
+                return None
+            self._disk_size -= spilled[1]
+            # No longer in either tier; an invalidation from here on is
+            # caught by the token when it goes back into memory
+            token = self._seq
+
+        path, _, tags = spilled
+        try:
+            # The mapping outlives the unlinked file for as long as the table does
+            table = ipc.open_file(pa.memory_map(str(path))).read_all()
+        except (OSError, pa.ArrowInvalid):
+            with self._lock:
+                self.misses += 1
+            return None
+        finally:
+            path.unlink(missing_ok=True)
+
+        metadata = dict(table.schema.metadata or {})
+        info = json.loads(metadata.pop(_INFO_KEY, b"{}"))
+        table = table.replace_schema_metadata(metadata or None)
+        with self._lock:
+            self.hits += 1
+            self.disk_hits += 1
+        self._insert(key, table, tags, info, token)
+        return table, info
+
+    def put(self, key: str, table: pa.Table, tags=(), info: dict = None, token: int = None):
+        """
+        Cache a result.
+
+        Args:
+            key: From result_key()
+            table: The result
+            tags: Strings invalidate() can drop it by
+            info: Small JSON-serializable dict returned with the table
+            token: From token(), taken before the result was computed
+        """
+        if not self.fits(table.nbytes):
+            return
+        self._insert(key, table, frozenset(tags), info or {}, token)
+
+    def _insert(self, key, table, tags, info, token):
+        with self._lock:
+            if token is not None and self._stale(tags, token):
+                return
+            self._discard(key)
+            replaced = self._discard_disk(key)
+            self._memory[key] = (table, tags, info)
+            self._memory_size += table.nbytes
+            evicted = []
+            while self._memory_size > self.max_bytes:
+                old_key, old = self._memory.popitem(last=False)
+                self._memory_size -= old[0].nbytes
+                if self.spill_max_bytes and old[0].nbytes <= self.spill_max_bytes:
+                    self._spilling[old_key] = old
+                    evicted.append(old_key)
+                else:
+                    self.evictions += 1
+        if replaced is not None:
+            replaced.unlink(missing_ok=True)
+        for old_key in evicted:
+            self._spill(old_key)
+
+    def _stale(self, tags, token: int) -> bool:
+        if token < self._horizon:
+            return True
+        return any(self._invalidated.get(tag, -1) > token for tag in tags)
+
+    def _spill(self, key: str):
+        with self._lock:
+            entry = self._spilling.get(key)
+            if entry is None:
+                return
+            if self._spill_dir is None:
+                self.spill_root.mkdir(parents=True, exist_ok=True)
+                _remove_stale_spill_directories(self.spill_root)
+                self._spill_dir = Path(tempfile.mkdtemp(
+                    prefix=f"{_SPILL_PREFIX}{os.getpid()}-", dir=self.spill_root
+                ))
+            # Unique per spill, so a reader of an older copy can't remove it
+            path = self._spill_dir / f"{key}.{uuid.uuid4().hex[:8]}.arrow"
+
+        table, tags, info = entry
+        metadata = {**(table.schema.metadata or {}), _INFO_KEY: json.dumps(info).encode()}
+        try:
+            with ipc.new_file(str(path), table.schema.with_metadata(metadata)) as writer:
+                writer.write_table(table)
+            size = path.stat().st_size
+        except OSError:
+            path.unlink(missing_ok=True)
+            with self._lock:
+                if self._spilling.pop(key, None) is not None:
+                    self.evictions += 1
+            return
+
+        with self._lock:
+            if self._spilling.pop(key, None) is None:
+                # Invalidated or replaced while it was being written
+                path.unlink(missing_ok=True)
+                return
+            self.spills += 1
+            removed = [self._discard_disk(key)]
+            self._disk[key] = (path, size, tags)
+            self._disk_size += size
+            while self._disk_size > self.spill_max_bytes:
+                _, (old_path, old_size, _) = self._disk.popitem(last=False)
+                self._disk_size -= old_size
+                self.evictions += 1
+                removed.append(old_path)
+        for old_path in removed:
+            if old_path is not None:
+                old_path.unlink(missing_ok=True)
+
+    def invalidate(self, *tags):
+        """
+        Drop every result carrying any of the tags.
+        Call after the write that changed them has committed.
+        """
+        tags = set(tags)
+        with self._lock:
+            self._seq += 1
+            for tag in tags:
+                self._invalidated.pop(tag, None)
+                self._invalidated[tag] = self._seq
+            while len(self._invalidated) > _INVALIDATION_HISTORY:
+                _, seq = self._invalidated.popitem(last=False)
+                self._horizon = max(self._horizon, seq)
+
+            for key in [k for k, e in self._memory.items() if e[1] & tags]:
+                self._discard(key)
+                self.invalidations += 1
+            for key in [k for k, e in self._spilling.items() if e[1] & tags]:
+                del self._spilling[key]
+                self.invalidations += 1
+            removed = []
+            for key in [k for k, e in self._disk.items() if e[2] & tags]:
+                removed.append(self._discard_disk(key))
+                self.invalidations += 1
+        for path in removed:
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        """
+        Drop every result, including those being computed (their tokens
+        are too old for put()).
+        """
+        with self._lock:
+            self._seq += 1
+            self._horizon = self._seq
+            self._invalidated.clear()
+            self.invalidations += len(self._memory) + len(self._spilling) + len(self._disk)
+            self._memory.clear()
+            self._memory_size = 0
+            self._spilling.clear()
+            removed = [path for path, _, _ in self._disk.values()]
+            self._disk.clear()
+            self._disk_size = 0
+        for path in removed:
+            path.unlink(missing_ok=True)
+
+    def _discard(self, key: str):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_size -= entry[0].nbytes
+        self._spilling.pop(key, None)
+
+    def _discard_disk(self, key: str):
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return None
+        self._disk_size -= entry[1]
+        return entry[0]
+
+    def close(self):
+        """Delete this worker's spill files."""
+        with self._lock:
+            self._disk.clear()
+            self._disk_size = 0
+            self._spilling.clear()
+            spill_dir, self._spill_dir = self._spill_dir, None
+        if spill_dir is not None:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._memory),
+                "bytes": self._memory_size,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "spills": self.spills,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
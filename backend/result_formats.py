@@ -0,0 +1,120 @@
+"""
+Wire formats for streamed query results.
+Serializes an Arrow RecordBatchReader as Arrow IPC, CSV or NDJSON one batch
+at a time. Arrow IPC and CSV are written by pyarrow straight from the
+columnar batches; only NDJSON converts values to Python objects.
+"""
+
+import json
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+CSV = "text/csv"
+NDJSON = "application/x-ndjson"
+
+# ?format= values and the media type each selects
+FORMATS = {
+    "arrow": ARROW_STREAM,
+    "csv": CSV,
+    "ndjson": NDJSON,
+}
+
+
+def negotiate_format(accept: str = None, requested: str = None) -> str:
+    """
+    Pick the response media type.
+    An explicit ?format= wins; otherwise the first supported type in the
+    Accept header (by q-value); NDJSON if nothing matches.
+
+    Raises:
+        ValueError: If requested is not a known format
+    """
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"Unknown format '{requested}', expected one of {', '.join(FORMATS)}")
+        return FORMATS[requested]
+
+    candidates = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type in FORMATS.values() and quality > 0:
+            candidates.append((-quality, position, media_type))
+
+    return min(candidates)[2] if candidates else NDJSON
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _stream_arrow(reader):
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(sink, reader.schema) as writer:
+        yield sink.drain()
+        for batch in reader:
+            writer.write_batch(batch)
+            yield sink.drain()
+    # End-of-stream marker written on close
+    yield sink.drain()
+
+
+def _stream_csv(reader):
+    sink = _ChunkSink()
+    with pacsv.CSVWriter(sink, reader.schema) as writer:
+        yield sink.drain()
+        for batch in reader:
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def _stream_ndjson(reader):
+    for batch in reader:
+        yield "".join(
+            json.dumps(row, default=str) + "\n" for row in batch.to_pylist()
+        ).encode()
+
+
+def stream_batches(reader, media_type: str):
+    """
+    Yield the serialized bytes of every batch in reader.
+
+    Args:
+        reader: pyarrow.RecordBatchReader
+        media_type: One of the FORMATS media types
+    """
+    if media_type == ARROW_STREAM:
+        chunks = _stream_arrow(reader)
+    elif media_type == CSV:
+        chunks = _stream_csv(reader)
+    else:
+        chunks = _stream_ndjson(reader)
+
+    for chunk in chunks:
+        if chunk:
+            yield chunk
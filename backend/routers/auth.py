@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import RedirectResponse
 from config import workos, WORKOS_REDIRECT_URI, WORKOS_COOKIE_PASSWORD
+from dependencies import session_cache
+from sessions import session_key
 
 router = APIRouter(tags=["authentication"])
 
@@ -72,6 +74,11 @@ def logout(request: Request):
     # Default redirect if we can't get WorkOS logout URL
     redirect_url = "http://localhost:3000"
     
+    # Stop honouring the cookie even if the browser keeps sending it
+    sealed_session = request.cookies.get("wos_session")
+    if sealed_session:
+        session_cache.invalidate(session_key(sealed_session))
+    
     try:
         # Try to load the session and get proper logout URL
         session = workos.user_management.load_sealed_session(
@@ -0,0 +1,282 @@
+from fastapi import APIRouter, HTTPException, Query, Header, Depends
+from fastapi.responses import Response, StreamingResponse
+import duckdb
+import itertools
+import json
+import pyarrow as pa
+import threading
+from config import (
+    ROWS_DEFAULT_LIMIT,
+    ROWS_MAX_LIMIT,
+    ROWS_QUERY_TIMEOUT,
+    ROWS_MAX_CONCURRENT,
+    ROWS_BATCH_SIZE,
+)
+from database import get_connection_manager
+from dependencies import require_user
+from upload_queries import (
+    QueryError,
+    build_rows_query,
+    describe_parquet,
+    record_batch_reader,
+    resolve_parquet_path,
+)
+from result_cache import result_key
+from result_formats import negotiate_format, stream_batches
+from previews import preview_path_for, read_preview, serialize_preview
+from storage import get_storage
+from upload_cache import upload_previews, query_results
+
+router = APIRouter(prefix="/api", tags=["data"])
+
+# Bounds the data queries streaming at once in this worker
+_query_slots = threading.BoundedSemaphore(ROWS_MAX_CONCURRENT)
+
+
+def get_owned_upload(upload_id: str, user_id: str) -> dict:
+    """
+    Load an upload's metadata, checking it belongs to the user.
+
+    Raises:
+        HTTPException: 404 if the upload doesn't exist or isn't theirs
+    """
+    with get_connection_manager().read() as conn:
+        result = conn.execute("""
+            SELECT user_id, filename, parquet_path, row_count, column_count, schema_json
+            FROM uploads
+            WHERE upload_id = ? AND deleted_at IS NULL
+        """, [upload_id]).fetchone()
+
+    if not result or result[0] != user_id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+    return {
+        "upload_id": upload_id,
+        "filename": result[1],
+        "parquet_path": result[2],
+        "row_count": result[3],
+        "column_count": result[4],
+        "schema": json.loads(result[5]),
+    }
+
+
+@router.get("/upload/{upload_id}/preview")
+def get_upload_preview(upload_id: str, user=Depends(require_user)):
+    """
+    First rows and a random sample of an upload, written when it was
+    ingested. Served from memory after the first request, once ownership
+    is checked (a cached body may outlive a delete).
+
+    Returns:
+        JSON with row_count, columns, head and sample (lists of row objects)
+        404 if the upload isn't found or predates previews
+    """
+    upload = get_owned_upload(upload_id, user.id)
+    body = upload_previews.get(upload_id, user.id)
+    if body is None:
+        filesystem, path = get_storage().locate(preview_path_for(resolve_parquet_path(upload["parquet_path"])))
+        try:
+            preview = read_preview(path, filesystem)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="No preview recorded for this upload")
+        body = serialize_preview(upload_id, upload["row_count"], preview)
+        upload_previews.put(upload_id, user.id, body)
+
+    return Response(body, media_type="application/json")
+
+
+@router.get("/upload/{upload_id}/profile")
+def get_upload_profile(upload_id: str, user=Depends(require_user)):
+    """
+    Column profile of an upload, computed when it was ingested.
+    Served from upload_column_stats; the Parquet file is not read.
+
+    Returns:
+        JSON with row_count and, per column, null_count, min, max,
+        distinct_count (HyperLogLog estimate) and quantiles (numeric
+        columns only, approximate)
+        404 if the upload isn't found or predates profiling
+    """
+    upload = get_owned_upload(upload_id, user.id)
+
+    with get_connection_manager().read() as conn:
+        rows = conn.execute("""
+            SELECT column_name, dtype, null_count, min_value, max_value,
+                   distinct_count, quantiles
+            FROM upload_column_stats
+            WHERE upload_id = ?
+            ORDER BY position
+        """, [upload_id]).fetchall()
+
+    if not rows:
+        raise HTTPException(status_code=404, detail="No profile recorded for this upload")
+
+    return {
+        "upload_id": upload_id,
+        "filename": upload["filename"],
+        "row_count": upload["row_count"],
+        "columns": [
+            {
+                "name": row[0],
+                "dtype": row[1],
+                "null_count": row[2],
+                "min": json.loads(row[3]) if row[3] is not None else None,
+                "max": json.loads(row[4]) if row[4] is not None else None,
+                "distinct_count": row[5],
+                "quantiles": json.loads(row[6]) if row[6] is not None else None,
+            }
+            for row in rows
+        ],
+    }
+
+
+def _interrupted(error: BaseException) -> bool:
+    """Whether a DuckDB error is the query timeout's interrupt."""
+    # While an Arrow reader is being read, DuckDB's errors arrive as OSError
+    return isinstance(error, duckdb.InterruptException) or (
+        isinstance(error, OSError) and str(error).startswith("INTERRUPT Error")
+    )
+
+
+def _split(value: str):
+    return [part.strip() for part in value.split(",") if part.strip()] if value else None
+
+
+@router.get("/upload/{upload_id}/rows")
+def get_upload_rows(
+    upload_id: str,
+    columns: str = None,
+    filter: list[str] = Query(None),
+    sort: str = None,
+    limit: int = Query(ROWS_DEFAULT_LIMIT, ge=1, le=ROWS_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    format: str = None,
+    accept: str = Header(None),
+    user=Depends(require_user)
+):
+    """
+    Stream rows of an upload's Parquet file.
+    The format follows the Accept header: application/vnd.apache.arrow.stream
+    streams DuckDB's Arrow record batches as Arrow IPC, text/csv as CSV, and
+    anything else as newline-delimited JSON. Results small enough are cached
+    (in any format) once fully streamed; X-Cache says whether this one was.
+
+    Args:
+        upload_id: The upload to read
+        columns: Comma-separated columns to return (default: all)
+        filter: Repeatable <column>:<op>[:<value>] filters, ANDed together;
+            op is eq, ne, lt, le, gt, ge, contains, startswith, isnull or notnull
+        sort: Comma-separated sort columns, "-" prefix for descending
+        limit: Maximum rows to return
+        offset: Rows to skip
+        format: arrow, csv or ndjson; overrides the Accept header
+
+    Returns:
+        Arrow IPC stream, CSV or application/x-ndjson (one JSON object per row)
+        400 for invalid columns/filters/format, 404 if the upload isn't found,
+        503 if too many data queries are running, 504 if the query times
+        out before its first rows; a timeout after that aborts the response
+        rather than ending it early as if complete
+    """
+    try:
+        media_type = negotiate_format(accept, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    upload = get_owned_upload(upload_id, user.id)
+    parquet_path = resolve_parquet_path(upload["parquet_path"])
+
+    if not _query_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many data queries are running, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    conn = get_connection_manager().scan_cursor()
+    # Interrupt the query (and abort the stream) once the time limit passes
+    timer = threading.Timer(ROWS_QUERY_TIMEOUT, conn.interrupt)
+
+    def release():
+        timer.cancel()
+        conn.close()
+        _query_slots.release()
+
+    try:
+        timer.start()
+        sql, params, _ = build_rows_query(
+            parquet_path,
+            describe_parquet(conn, parquet_path),
+            columns=_split(columns),
+            filters=filter,
+            sort=_split(sort),
+            limit=limit,
+            offset=offset
+        )
+        key = result_key("rows", upload_id, sql, params)
+        cached = query_results.get(key)
+        if cached is None:
+            token = query_results.token()
+            reader = record_batch_reader(conn.execute(sql, params), ROWS_BATCH_SIZE)
+            # Read ahead to the first batch, so a query that times out
+            # before producing rows still gets a status code
+            try:
+                first = [reader.read_next_batch()]
+            except StopIteration:
+                first = []
+    except QueryError as e:
+        release()
+        raise HTTPException(status_code=400, detail=str(e))
+    except (duckdb.ConversionException, duckdb.BinderException, duckdb.InvalidInputException) as e:
+        release()
+        raise HTTPException(status_code=400, detail=f"Invalid query: {str(e)}")
+    except (duckdb.InterruptException, OSError) as e:
+        release()
+        if not _interrupted(e):
+            raise
+        raise HTTPException(status_code=504, detail="Query timed out")
+    except BaseException:
+        release()
+        raise
+
+    if cached is not None:
+        release()
+        return StreamingResponse(
+            stream_batches(cached[0].to_reader(max_chunksize=ROWS_BATCH_SIZE), media_type),
+            media_type=media_type,
+            headers={"Vary": "Accept", "X-Cache": "HIT"}
+        )
+
+    # Keeps the streamed batches while they still fit in the cache
+    kept = []
+    kept_bytes = 0
+
+    def tee():
+        nonlocal kept, kept_bytes
+        for batch in itertools.chain(first, reader):
+            if kept is not None:
+                kept_bytes += batch.nbytes
+                if query_results.fits(kept_bytes):
+                    kept.append(batch)
+                else:
+                    kept = None
+            yield batch
+
+    def stream():
+        # A timeout from here on propagates: the headers are already sent,
+        # so the server aborts the connection and the client sees an
+        # incomplete response instead of a truncated result
+        try:
+            yield from stream_batches(pa.RecordBatchReader.from_batches(reader.schema, tee()), media_type)
+        finally:
+            release()
+        if kept is not None:
+            query_results.put(
+                key, pa.Table.from_batches(kept, schema=reader.schema), tags=[upload_id], token=token
+            )
+
+    return StreamingResponse(
+        stream(),
+        media_type=media_type,
+        headers={"Vary": "Accept", "X-Cache": "MISS"}
+    )
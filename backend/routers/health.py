@@ -1,6 +1,11 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 from sse_starlette.sse import EventSourceResponse
 import asyncio
+from database import get_connection_manager
+from storage import get_storage
+from dependencies import session_cache, refresh_flight, require_admin
+from upload_cache import upload_listings, upload_previews, query_results
+from upload_gc import gc_stats
 
 router = APIRouter(prefix="/health", tags=["health"])
 
@@ -22,4 +27,22 @@ async def health_stream():
         while True:
             await asyncio.sleep(60)  # Idle loop every 60 secs to keep connection alive
    
-    return EventSourceResponse(event_generator())
\ No newline at end of file
+    return EventSourceResponse(event_generator())
+
+
+@router.get("/metrics")
+async def health_metrics(user=Depends(require_admin)):
+    """
+    Internal counters for the shared resources of this worker.
+    Admins only (see dependencies.require_admin).
+    """
+    return {
+        "database": get_connection_manager().stats(),
+        "sessions": session_cache.stats(),
+        "session_refresh": refresh_flight.stats(),
+        "upload_listings": upload_listings.stats(),
+        "upload_previews": upload_previews.stats(),
+        "query_results": query_results.stats(),
+        "storage": get_storage().stats(),
+        "storage_gc": dict(gc_stats),
+    }
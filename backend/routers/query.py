@@ -0,0 +1,112 @@
+from fastapi import APIRouter, HTTPException, Header, Depends
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
+import threading
+from config import (
+    QUERY_MEMORY_LIMIT,
+    QUERY_THREADS,
+    QUERY_TIMEOUT,
+    QUERY_MAX_ROWS,
+    QUERY_MAX_CONCURRENT,
+)
+from dependencies import require_user
+from result_formats import negotiate_format, stream_batches
+from sql_engine import QueryTimeoutError, SQLQueryError, run_query, user_catalog
+from upload_cache import query_results
+
+router = APIRouter(prefix="/api", tags=["query"])
+
+# Bounds the SQL queries running at once in this worker
+_query_slots = threading.BoundedSemaphore(QUERY_MAX_CONCURRENT)
+
+
+class QueryRequest(BaseModel):
+    sql: str
+
+
+@router.get("/query/catalog")
+def get_query_catalog(user=Depends(require_user)):
+    """
+    Views a query can use: one per upload, named after its file.
+
+    Returns:
+        JSON with tables: name, upload_id, filename, row_count, column_count
+    """
+    catalog = user_catalog(user.id)
+    return {
+        "tables": [
+            {
+                "name": name,
+                "upload_id": view["upload_id"],
+                "filename": view["filename"],
+                "row_count": view["row_count"],
+                "column_count": view["column_count"],
+            }
+            for name, view in catalog.items()
+        ]
+    }
+
+
+@router.post("/query")
+async def query_uploads(
+    request: QueryRequest,
+    format: str = None,
+    accept: str = Header(None),
+    user=Depends(require_user)
+):
+    """
+    Run a read-only SQL query across the user's uploads.
+    Uploads are referenced by view name (see GET /api/query/catalog), e.g.
+    SELECT region, sum(amount) FROM sales JOIN regions USING (store_id) GROUP BY 1.
+
+    Args:
+        request: JSON body {"sql": "..."}; a single SELECT
+        format: arrow, csv or ndjson; overrides the Accept header (as for
+            GET /api/upload/{id}/rows)
+
+    Returns:
+        The result rows; X-Result-Truncated: true if there were more than
+        QUERY_MAX_ROWS, X-Cache: HIT or MISS
+        400 for an invalid or failing query, 503 if too many are running,
+        504 if it timed out
+    """
+    try:
+        media_type = negotiate_format(accept, format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not _query_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=503,
+            detail="Too many queries are running, please retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+    try:
+        table, truncated, cached = await run_in_threadpool(
+            run_query,
+            user.id,
+            request.sql,
+            QUERY_MAX_ROWS,
+            QUERY_MEMORY_LIMIT,
+            QUERY_THREADS,
+            QUERY_TIMEOUT,
+            query_results
+        )
+    except QueryTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SQLQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        _query_slots.release()
+
+    return StreamingResponse(
+        stream_batches(table.to_reader(), media_type),
+        media_type=media_type,
+        headers={
+            "Vary": "Accept",
+            "X-Cache": "HIT" if cached else "MISS",
+            "X-Result-Truncated": "true" if truncated else "false",
+        }
+    )
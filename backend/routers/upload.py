@@ -1,95 +1,246 @@
-from fastapi import APIRouter, Request, UploadFile, File, HTTPException
+from fastapi import APIRouter, Request, UploadFile, File, HTTPException, Query, Header, Depends
 from fastapi.responses import JSONResponse, Response
-import pandas as pd
+from starlette.concurrency import run_in_threadpool
+from sse_starlette.sse import EventSourceResponse
+from pydantic import BaseModel
+import asyncio
+import base64
 import json
 import uuid
+import zipfile
 from datetime import datetime
 from pathlib import Path
-from config import workos, WORKOS_COOKIE_PASSWORD
-from database import get_db_connection, get_user_upload_directory
+from config import (
+    INGEST_BLOCK_SIZE,
+    CSV_ENGINE,
+    CSV_SAMPLE_BYTES,
+    PARQUET_PROFILE,
+    DATASET_THRESHOLD_BYTES,
+    DATASET_FILE_BYTES,
+    UPLOADS_PAGE_SIZE,
+    UPLOADS_MAX_PAGE_SIZE,
+    PREVIEW_HEAD_ROWS,
+    PREVIEW_SAMPLE_ROWS,
+    BATCH_MAX_FILES,
+    BATCH_MAX_ARCHIVE_BYTES,
+    UPLOAD_CHUNK_SIZE,
+    UPLOAD_SESSION_MAX_BYTES,
+    BULK_DELETE_MAX_IDS,
+)
+from dependencies import require_user, require_admin
+from database import SPOOL_DIR, get_connection_manager
+from ingest import convert_csv_file, content_key, spool_and_hash, hash_file
+from csv_parsers import EmptyCSVError, CSVParseError, parse_column_types
+from parquet_profiles import resolve_profile
+from datasets import PartitionError
+from executor import ExecutorSaturatedError, ConversionTimeoutError
+from upload_cache import upload_listings, etag_matches, invalidate_uploads, listing_version, publish_upload_changes
+from query_uploads import upload_stats
+from upload_summary import record_uploads
+from upload_gc import soft_delete_uploads
+from previews import preview_path_for
+from storage import get_storage
+from upload_sessions import (
+    ChunkError,
+    claim_for_commit,
+    create_session,
+    delete_session,
+    get_session,
+    reopen_session,
+    spool_path_for,
+    verify_checksum,
+    write_chunk,
+)
 
 router = APIRouter(prefix="/api", tags=["upload"])
 
+# Parquet layout of uploads that don't ask for another
+DEFAULT_PARQUET_SETTINGS = resolve_profile(PARQUET_PROFILE)
+
+
+# Fields a listing can return, and the column each is read from.
+# "columns" needs schema_json, so it is only fetched when asked for.
+UPLOAD_LIST_FIELDS = {
+    "upload_id": "upload_id",
+    "filename": "filename",
+    "uploaded_at": "uploaded_at",
+    "row_count": "row_count",
+    "column_count": "column_count",
+    "columns": "schema_json",
+}
+DEFAULT_UPLOAD_LIST_FIELDS = ["upload_id", "filename", "uploaded_at", "row_count", "column_count"]
+
+
+def _encode_cursor(uploaded_at: datetime, upload_id: str) -> str:
+    """Opaque keyset cursor pointing just after the given row."""
+    payload = json.dumps([uploaded_at.isoformat(), upload_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def _decode_cursor(cursor: str):
+    try:
+        uploaded_at, upload_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(uploaded_at), upload_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
 
 @router.get("/uploads")
-async def get_uploads(request: Request):
+async def get_uploads(
+    request: Request,
+    limit: int = Query(UPLOADS_PAGE_SIZE, ge=1, le=UPLOADS_MAX_PAGE_SIZE),
+    cursor: str = None,
+    fields: str = None,
+    filename_prefix: str = None,
+    uploaded_after: datetime = None,
+    uploaded_before: datetime = None,
+    user=Depends(require_user)
+):
     """
-    Get all uploads for the authenticated user.
+    Get a page of uploads for the authenticated user, newest first.
     
+    Args:
+        limit: Maximum uploads to return
+        cursor: next_cursor from the previous page
+        fields: Comma-separated fields to return (default: everything
+            except "columns")
+        filename_prefix: Only uploads whose filename starts with this
+        uploaded_after: Only uploads at or after this time
+        uploaded_before: Only uploads before this time
+        
     Returns:
-        JSON response with list of uploads
+        JSON response with the page of uploads and next_cursor (null on
+        the last page), with an ETag; 304 if If-None-Match still matches
     """
-    # Check authentication with session refresh support
-    try:
-        session = workos.user_management.load_sealed_session(
-            sealed_session=request.cookies.get("wos_session"),
-            cookie_password=WORKOS_COOKIE_PASSWORD,
-        )
-        auth_response = session.authenticate()
-        
-        # If not authenticated, attempt to refresh the session
-        if not auth_response.authenticated:
-            if auth_response.reason == "no_session_cookie_provided":
-                raise HTTPException(status_code=401, detail="No session cookie")
-            
-            # Try to refresh the session
-            try:
-                refresh_result = session.refresh()
-                if not refresh_result.authenticated:
-                    raise HTTPException(status_code=401, detail="Session refresh failed")
-                
-                # Session refreshed successfully - use the new session
-                user_id = refresh_result.user.id
-            except Exception as refresh_error:
-                raise HTTPException(status_code=401, detail="Session expired")
-        else:
-            user_id = auth_response.user.id
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
+    user_id = user.id
     
-    # Fetch uploads from database
-    conn = get_db_connection()
-    try:
-        result = conn.execute("""
-            SELECT 
-                upload_id,
-                filename,
-                uploaded_at,
-                row_count,
-                column_count,
-                schema_json
+    # Projection: only read (and decode) what the client asked for
+    requested = DEFAULT_UPLOAD_LIST_FIELDS
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in UPLOAD_LIST_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    select_columns = ["uploaded_at", "upload_id"] + [
+        UPLOAD_LIST_FIELDS[f] for f in requested
+    ]
+    
+    # Filters; the keyset condition resumes after the cursor's row
+    conditions = ["user_id = ?", "deleted_at IS NULL"]
+    params = [user_id]
+    if cursor:
+        conditions.append("(uploaded_at, upload_id) < (?, ?)")
+        params.extend(_decode_cursor(cursor))
+    if filename_prefix:
+        conditions.append("filename LIKE ? ESCAPE '\\'")
+        params.append(_escape_like(filename_prefix) + "%")
+    if uploaded_after:
+        conditions.append("uploaded_at >= ?")
+        params.append(uploaded_after)
+    if uploaded_before:
+        conditions.append("uploaded_at < ?")
+        params.append(uploaded_before)
+    
+    # Conditional GET: the ETag depends only on the user's listing version
+    # (shared by every worker) and the query, so an unchanged listing
+    # costs no listing query, and no query at all once the version is
+    # cached
+    query_key = json.dumps([
+        limit,
+        cursor,
+        requested,
+        filename_prefix,
+        uploaded_after.isoformat() if uploaded_after else None,
+        uploaded_before.isoformat() if uploaded_before else None
+    ])
+    version = await listing_version(user_id)
+    etag = upload_listings.etag(user_id, query_key, version)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        upload_listings.record_not_modified()
+        return Response(status_code=304, headers=headers)
+    
+    body = upload_listings.get(user_id, query_key, version)
+    if body is None:
+        body = await _list_uploads(select_columns, conditions, params, limit, requested)
+        upload_listings.put(user_id, query_key, version, body)
+    
+    return Response(
+        status_code=200,
+        content=body,
+        media_type="application/json",
+        headers=headers
+    )
+
+
+async def _list_uploads(select_columns, conditions, params, limit, requested) -> bytes:
+    """Run a listing query and serialize the page as JSON."""
+    # Fetch one extra row to know whether there is a next page
+    async with get_connection_manager().aread() as conn:
+        cursor = await conn.execute(f"""
+            SELECT {', '.join(select_columns)}
             FROM uploads
-            WHERE user_id = ?
-            ORDER BY uploaded_at DESC
-        """, [user_id]).fetchall()
-        
-        uploads = []
-        for row in result:
-            schema = json.loads(row[5])
-            uploads.append({
-                "upload_id": row[0],
-                "filename": row[1],
-                "uploaded_at": row[2].isoformat() if row[2] else None,
-                "row_count": row[3],
-                "column_count": row[4],
-                "columns": schema.get('columns', [])
-            })
-        
-        return JSONResponse(
-            status_code=200,
-            content={"uploads": uploads}
-        )
-    finally:
-        conn.close()
+            WHERE {' AND '.join(conditions)}
+            ORDER BY uploaded_at DESC, upload_id DESC
+            LIMIT ?
+        """, params + [limit + 1])
+        result = await cursor.fetchall()
+    
+    next_cursor = None
+    if len(result) > limit:
+        result = result[:limit]
+        next_cursor = _encode_cursor(result[-1][0], result[-1][1])
+    
+    uploads = []
+    for row in result:
+        upload = {}
+        for field, value in zip(requested, row[2:]):
+            if field == "uploaded_at":
+                value = value.isoformat() if value else None
+            elif field == "columns":
+                value = json.loads(value).get('columns', [])
+            upload[field] = value
+        uploads.append(upload)
+    
+    return json.dumps({"uploads": uploads, "next_cursor": next_cursor}).encode()
+
+
+@router.get("/uploads/stats")
+async def get_uploads_stats(user=Depends(require_user)):
+    """
+    Totals over the authenticated user's uploads.
+    Read from user_upload_stats, kept current by upload and delete.
+    
+    Returns:
+        JSON with total_uploads, total_rows, avg_rows_per_file, first_upload
+        and last_upload
+    """
+    return await run_in_threadpool(upload_stats, user.id)
+
+
+@router.get("/uploads/stats/global")
+async def get_global_uploads_stats(user=Depends(require_admin)):
+    """
+    Totals over every user's uploads, from global_upload_stats.
+    
+    Returns:
+        JSON as for /api/uploads/stats
+        403 unless the user is listed in ADMIN_USER_IDS
+    """
+    return await run_in_threadpool(upload_stats)
 
 
 @router.delete("/upload/{upload_id}")
-async def delete_upload(upload_id: str, request: Request):
+async def delete_upload(upload_id: str, request: Request, user=Depends(require_user)):
     """
-    Delete an upload and its associated Parquet file.
+    Delete an upload. It disappears at once; its Parquet file is removed
+    later by the storage collector, once no other upload of the same
+    content refers to it.
     
     Args:
         upload_id: The UUID of the upload to delete
@@ -100,76 +251,603 @@ async def delete_upload(upload_id: str, request: Request):
         404 if upload not found or doesn't belong to user
         401 if not authenticated
     """
-    # Check authentication with session refresh support
-    try:
-        session = workos.user_management.load_sealed_session(
-            sealed_session=request.cookies.get("wos_session"),
-            cookie_password=WORKOS_COOKIE_PASSWORD,
-        )
-        auth_response = session.authenticate()
-        
-        # If not authenticated, attempt to refresh the session
-        if not auth_response.authenticated:
-            if auth_response.reason == "no_session_cookie_provided":
-                raise HTTPException(status_code=401, detail="No session cookie")
-            
-            # Try to refresh the session
-            try:
-                refresh_result = session.refresh()
-                if not refresh_result.authenticated:
-                    raise HTTPException(status_code=401, detail="Session refresh failed")
-                
-                # Session refreshed successfully - use the new user
-                user_id = refresh_result.user.id
-            except Exception as refresh_error:
-                raise HTTPException(status_code=401, detail="Session expired")
-        else:
-            user_id = auth_response.user.id
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
+    user_id = user.id
     
-    # Get upload metadata from database
-    conn = get_db_connection()
-    try:
-        result = conn.execute("""
-            SELECT parquet_path, user_id
-            FROM uploads
-            WHERE upload_id = ?
-        """, [upload_id]).fetchone()
-        
-        if not result:
-            raise HTTPException(status_code=404, detail="Upload not found")
+    deleted = await run_in_threadpool(_delete_uploads, user_id, [upload_id])
+    
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    
+    invalidate_uploads(user_id, deleted)
+    
+    return Response(status_code=204)
+
+
+class BulkDeleteRequest(BaseModel):
+    upload_ids: list[str]
+
+
+@router.post("/uploads/delete")
+async def delete_uploads(request: BulkDeleteRequest, user=Depends(require_user)):
+    """
+    Delete many uploads in one transaction, as DELETE /api/upload/{id} does
+    for one.
+    
+    Args:
+        request: JSON body {"upload_ids": [...]}
         
-        parquet_path, upload_user_id = result
+    Returns:
+        JSON with deleted (ids deleted) and not_found (ids that don't exist,
+        aren't the user's or were already deleted)
+        400 if more than BULK_DELETE_MAX_IDS ids are given
+    """
+    user_id = user.id
+    upload_ids = list(dict.fromkeys(request.upload_ids))
+    if len(upload_ids) > BULK_DELETE_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BULK_DELETE_MAX_IDS} uploads can be deleted per request"
+        )
+    
+    deleted = await run_in_threadpool(_delete_uploads, user_id, upload_ids)
+    
+    if deleted:
+        invalidate_uploads(user_id, deleted)
+    
+    deleted_ids = set(deleted)
+    return {
+        "deleted": [upload_id for upload_id in upload_ids if upload_id in deleted_ids],
+        "not_found": [upload_id for upload_id in upload_ids if upload_id not in deleted_ids],
+    }
+
+
+def _delete_uploads(user_id: str, upload_ids: list) -> list:
+    """
+    Mark the user's uploads deleted in one write transaction, and tell
+    the other workers. Blocking.
+    
+    Returns:
+        The upload ids that were deleted
+    """
+    with get_connection_manager().write() as conn:
+        deleted = soft_delete_uploads(conn, user_id, upload_ids)
+        if deleted:
+            publish_upload_changes(conn, user_id, deleted)
+    return deleted
+
+
+def _reference_blob(conn, user_id: str, content_hash: str):
+    """
+    Take a reference on the user's stored file with this content hash.
+    
+    Returns:
+        dict with parquet_path, row_count, column_count and schema_json,
+        or None if no such file is stored
+    """
+    result = conn.execute("""
+        UPDATE upload_blobs
+        SET ref_count = ref_count + 1
+        WHERE user_id = ? AND content_hash = ?
+        RETURNING parquet_path, row_count, column_count, schema_json
+    """, [user_id, content_hash]).fetchone()
+    
+    if not result:
+        return None
+    
+    return {
+        "parquet_path": result[0],
+        "row_count": result[1],
+        "column_count": result[2],
+        "schema_json": result[3]
+    }
+
+
+def _publish_blob(conn, user_id: str, content_hash: str, converted_path: str, result: dict) -> dict:
+    """
+    Store a freshly converted file as the user's copy of this content,
+    with one reference, and move it (and its preview) to its
+    content-addressed path. A backend that can't rename (S3) keeps it at
+    the converted path, which is unique to the upload.
+    
+    Returns:
+        The blob dict as _reference_blob returns it, or None if another
+        worker has stored the same content since (nothing is moved)
+    """
+    storage = get_storage()
+    blob_path = converted_path
+    if storage.supports_rename:
+        blob_path = storage.uri(user_id, f"{content_hash}.parquet")
+    blob = {
+        "parquet_path": blob_path,
+        "row_count": result['row_count'],
+        "column_count": result['column_count'],
+        "schema_json": json.dumps(result['schema'])
+    }
+    inserted = conn.execute("""
+        INSERT INTO upload_blobs (
+            user_id,
+            content_hash,
+            parquet_path,
+            ref_count,
+            row_count,
+            column_count,
+            schema_json,
+            created_at
+        ) VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT (user_id, content_hash) DO NOTHING
+        RETURNING content_hash
+    """, [
+        user_id,
+        content_hash,
+        blob['parquet_path'],
+        blob['row_count'],
+        blob['column_count'],
+        blob['schema_json'],
+        datetime.now()
+    ]).fetchone()
+    
+    if inserted is None:
+        return None
+    
+    if blob_path != converted_path:
+        # Renames, so they happen before the commit without holding it up
+        storage.replace(preview_path_for(converted_path), preview_path_for(blob_path))
+        storage.replace(converted_path, blob_path)
+    return blob
+
+
+def _store_uploads(conn, user_id: str, entries: list) -> list:
+    """
+    Record uploads inside the caller's write transaction.
+    Each upload takes a reference on the user's stored file for its
+    content hash; the first converted upload of content not yet stored
+    publishes its file. Metadata rows and column profiles are then
+    bulk inserted, and the upload statistics updated.
+    
+    Args:
+        conn: Cursor from get_connection_manager().write()
+        user_id: Owner of the uploads
+        entries: dicts with upload_id, filename, uploaded_at, content_hash,
+            result (conversion result, or None if not converted) and
+            converted_path (Parquet file written by the conversion)
+    
+    A converted entry whose content turns out to be stored already gets
+    discarded=True; the caller removes its files after the commit (see
+    _discard_conversions).
+    
+    Returns:
+        Per entry, the new upload's data dict, or None if the entry was not
+        converted and its content is not stored
+    """
+    stored = []
+    upload_rows = []
+    stats_rows = []
+    # Column profiles of content first stored in this call
+    new_profiles = {}
+    
+    for entry in entries:
+        content_hash = entry['content_hash']
+        upload_id = entry['upload_id']
         
-        # Verify the upload belongs to the authenticated user
-        if upload_user_id != user_id:
-            raise HTTPException(status_code=404, detail="Upload not found")
+        blob = _reference_blob(conn, user_id, content_hash)
+        deduplicated = blob is not None
         
-        # Delete the Parquet file from filesystem
-        full_path = Path(__file__).parent.parent / parquet_path
-        if full_path.exists():
-            full_path.unlink()
+        if blob is None and entry['result'] is not None:
+            blob = _publish_blob(conn, user_id, content_hash, entry['converted_path'], entry['result'])
+            if blob is not None:
+                new_profiles[content_hash] = entry['result']['column_stats']
+            else:
+                # Another worker stored the same content first; share theirs
+                blob = _reference_blob(conn, user_id, content_hash)
+                deduplicated = blob is not None
         
-        # Delete the record from database
-        conn.execute("""
-            DELETE FROM uploads
-            WHERE upload_id = ?
-        """, [upload_id])
+        if content_hash in new_profiles:
+            column_stats = new_profiles[content_hash]
+        elif blob is not None:
+            # Copy the profile of an earlier, live upload of the same
+            # file that has one
+            column_stats = None
+            conn.execute("""
+                INSERT INTO upload_column_stats (
+                    upload_id,
+                    position,
+                    column_name,
+                    dtype,
+                    null_count,
+                    min_value,
+                    max_value,
+                    distinct_count,
+                    distinct_sketch,
+                    quantiles
+                )
+                SELECT ?, position, column_name, dtype, null_count, min_value,
+                       max_value, distinct_count, distinct_sketch, quantiles
+                FROM upload_column_stats
+                WHERE upload_id = (
+                    SELECT upload_id FROM uploads
+                    WHERE user_id = ? AND content_hash = ? AND deleted_at IS NULL
+                        AND EXISTS (
+                            SELECT 1 FROM upload_column_stats
+                            WHERE upload_column_stats.upload_id = uploads.upload_id
+                        )
+                    ORDER BY uploaded_at DESC, upload_id
+                    LIMIT 1
+                )
+            """, [upload_id, user_id, content_hash])
+        else:
+            stored.append(None)
+            continue
         
-        return Response(status_code=204)
+        if deduplicated and entry['result'] is not None:
+            # An identical upload was stored first; drop this conversion
+            entry['discarded'] = True
         
+        upload_rows.append([
+            upload_id,
+            user_id,
+            entry['filename'],
+            entry['uploaded_at'],
+            blob['parquet_path'],
+            blob['row_count'],
+            blob['column_count'],
+            blob['schema_json'],
+            content_hash
+        ])
+        stats_rows.extend(
+            [
+                upload_id,
+                position,
+                stats['name'],
+                stats['dtype'],
+                stats['null_count'],
+                json.dumps(stats['min']),
+                json.dumps(stats['max']),
+                stats['distinct_count'],
+                stats['distinct_sketch'],
+                json.dumps(stats['quantiles'])
+            ]
+            for position, stats in enumerate(column_stats or [])
+        )
+        stored.append(_upload_data(
+            upload_id, entry['filename'], entry['uploaded_at'], blob, deduplicated
+        ))
+    
+    if upload_rows:
+        conn.executemany("""
+            INSERT INTO uploads (
+                upload_id,
+                user_id,
+                filename,
+                uploaded_at,
+                parquet_path,
+                row_count,
+                column_count,
+                schema_json,
+                content_hash
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, upload_rows)
+        record_uploads(conn, user_id, [(row[5], row[3]) for row in upload_rows])
+    
+    if stats_rows:
+        conn.executemany("""
+            INSERT INTO upload_column_stats (
+                upload_id,
+                position,
+                column_name,
+                dtype,
+                null_count,
+                min_value,
+                max_value,
+                distinct_count,
+                distinct_sketch,
+                quantiles
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, stats_rows)
+    
+    return stored
+
+
+def _record_uploads(user_id: str, entries: list) -> list:
+    """
+    _store_uploads() in a write transaction of its own, telling the other
+    workers if anything was stored. Blocking.
+    """
+    with get_connection_manager().write() as conn:
+        stored = _store_uploads(conn, user_id, entries)
+        if any(upload_data is not None for upload_data in stored):
+            publish_upload_changes(conn, user_id)
+    return stored
+
+
+async def _discard_conversions(entries: list):
+    """Remove the files of conversions _store_uploads marked discarded."""
+    storage = get_storage()
+    for entry in entries:
+        if entry.get('discarded'):
+            await storage.aremove_upload(entry['converted_path'])
+
+
+async def _convert_upload(
+    converter,
+    user_id: str,
+    upload_id: str,
+    spool_path: Path,
+    on_progress=None,
+    dtypes=None,
+    parquet_settings=None,
+    partition_by=None
+):
+    """
+    Convert a spooled CSV to <upload_id>.parquet in the user's directory
+    of the storage backend, in the process pool, with optional column
+    dtype overrides and Parquet layout (the deployment's default profile
+    if None).
+    
+    The result is a dataset directory at that path instead of a file when
+    partition_by is given or the CSV is at least DATASET_THRESHOLD_BYTES.
+    
+    Returns:
+        (conversion result, URI of the converted file)
+    """
+    storage = get_storage()
+    await storage.aensure_directory(storage.uri(user_id))
+    parquet_path = storage.uri(user_id, f"{upload_id}.parquet")
+    # Workers write to local paths, or stream to the backend's filesystem
+    filesystem, target = storage.locate(parquet_path)
+    
+    def remove_outputs():
+        storage.remove_upload(parquet_path)
+    
+    layout = None
+    large = DATASET_THRESHOLD_BYTES and await storage.asize(spool_path) >= DATASET_THRESHOLD_BYTES
+    if partition_by is not None or large:
+        layout = {"partition_by": partition_by, "file_bytes": DATASET_FILE_BYTES}
+    
+    try:
+        # Convert in the process pool; metadata is accumulated while
+        # the batches are written
+        result = await converter.run(
+            convert_csv_file,
+            str(spool_path),
+            str(target),
+            INGEST_BLOCK_SIZE,
+            PREVIEW_HEAD_ROWS,
+            PREVIEW_SAMPLE_ROWS,
+            CSV_ENGINE,
+            dtypes,
+            CSV_SAMPLE_BYTES,
+            parquet_settings or DEFAULT_PARQUET_SETTINGS,
+            layout,
+            filesystem,
+            on_progress=on_progress,
+            on_abandon=remove_outputs
+        )
+    except Exception:
+        # Clean up parquet file and preview if they were created
+        await storage.aremove_upload(parquet_path)
+        raise
+    
+    return result, parquet_path
+
+
+async def _ingest_upload(
+    converter,
+    user_id: str,
+    upload_id: str,
+    filename: str,
+    spool_path: Path,
+    content_hash: str,
+    on_progress=None,
+    dtypes=None,
+    parquet_settings=None,
+    partition_by=None
+) -> dict:
+    """
+    Convert a spooled CSV to Parquet and record it in the uploads table.
+    Shared by the synchronous upload and background upload jobs.
+    
+    Parquet files are stored once per user and content hash. If the user
+    already has a file with the same content, the new upload points at it
+    and conversion is skipped.
+    
+    Args:
+        converter: The app's ConversionExecutor
+        user_id: Owner of the upload
+        upload_id: ID of the new upload
+        filename: Original CSV filename
+        spool_path: Spooled CSV on disk
+        content_hash: Hash of the spooled bytes (see ingest.spool_and_hash)
+        on_progress: Optional callback for per-row-group progress events
+        dtypes: Optional {column: type name} overrides
+        parquet_settings: Optional Parquet layout (see _parse_parquet_settings)
+        partition_by: Optional column to partition the stored dataset by
+    
+    Uploads share a Parquet file only if these conversion options match too.
+    
+    Returns:
+        dict describing the new upload
+    
+    Raises:
+        EmptyCSVError, CSVParseError: If the CSV is invalid
+        ExecutorSaturatedError, ConversionTimeoutError: If conversion
+            could not be scheduled or did not finish in time
+    """
+    entry = {
+        "upload_id": upload_id,
+        "filename": filename,
+        "uploaded_at": datetime.now(),
+        "content_hash": content_key(content_hash, {
+            "dtypes": dtypes,
+            "parquet": parquet_settings,
+            "partition_by": partition_by
+        }),
+        "result": None,
+        "converted_path": None
+    }
+    
+    # Reuse an identical file the user has already uploaded
+    upload_data = (await run_in_threadpool(_record_uploads, user_id, [entry]))[0]
+    
+    if upload_data is None:
+        entry['result'], entry['converted_path'] = await _convert_upload(
+            converter, user_id, upload_id, spool_path, on_progress, dtypes, parquet_settings, partition_by
+        )
+        try:
+            # Insert metadata into database
+            upload_data = (await run_in_threadpool(_record_uploads, user_id, [entry]))[0]
+        except Exception:
+            await get_storage().aremove_upload(entry['converted_path'])
+            raise
+        await _discard_conversions([entry])
+    
+    upload_listings.invalidate(user_id)
+    return upload_data
+
+
+def _upload_data(upload_id, filename, uploaded_at, blob, deduplicated: bool) -> dict:
+    return {
+        "upload_id": upload_id,
+        "filename": filename,
+        "row_count": blob['row_count'],
+        "column_count": blob['column_count'],
+        "columns": json.loads(blob['schema_json'])['columns'],
+        "uploaded_at": uploaded_at.isoformat(),
+        "deduplicated": deduplicated
+    }
+
+
+def _parse_dtypes(dtypes: str):
+    """
+    Validate the ?dtypes= JSON object of column type overrides.
+    
+    Raises:
+        HTTPException: 400 if it is not an object of known type names
+    """
+    if dtypes is None:
+        return None
+    try:
+        parsed = json.loads(dtypes)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="dtypes must be a JSON object")
+    if not isinstance(parsed, dict) or not all(isinstance(v, str) for v in parsed.values()):
+        raise HTTPException(
+            status_code=400,
+            detail='dtypes must map column names to type names, e.g. {"id": "int64"}'
+        )
+    try:
+        parse_column_types(parsed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return parsed or None
+
+
+def _parse_parquet_settings(profile: str, options: str):
+    """
+    Resolve the ?parquet_profile= and ?parquet_options= (JSON object of
+    settings) of an upload.
+    
+    Returns:
+        The Parquet settings, or None for the deployment's default layout
+    
+    Raises:
+        HTTPException: 400 for an unknown profile or invalid settings
+    """
+    if profile is None and options is None:
+        return None
+    overrides = None
+    if options is not None:
+        try:
+            overrides = json.loads(options)
+        except ValueError:
+            overrides = None
+        if not isinstance(overrides, dict):
+            raise HTTPException(status_code=400, detail="parquet_options must be a JSON object")
+    try:
+        settings = resolve_profile(profile or PARQUET_PROFILE, overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return None if settings == DEFAULT_PARQUET_SETTINGS else settings
+
+
+def _upload_error(error: Exception) -> HTTPException:
+    """Map an ingestion failure to the HTTP error returned to the client."""
+    if isinstance(error, EmptyCSVError):
+        return HTTPException(status_code=400, detail="CSV file is empty")
+    
+    if isinstance(error, PartitionError):
+        return HTTPException(status_code=400, detail=str(error))
+    
+    if isinstance(error, CSVParseError):
+        return HTTPException(
+            status_code=400,
+            detail=f"Failed to parse CSV: {str(error)}"
+        )
+    
+    if isinstance(error, ExecutorSaturatedError):
+        return HTTPException(
+            status_code=503,
+            detail="Too many uploads are being processed, please retry shortly",
+            headers={"Retry-After": "5"}
+        )
+    
+    if isinstance(error, ConversionTimeoutError):
+        return HTTPException(
+            status_code=504,
+            detail=f"Upload timed out: {str(error)}"
+        )
+    
+    return HTTPException(
+        status_code=500,
+        detail=f"Upload failed: {str(error)}"
+    )
+
+
+async def _run_upload_job(
+    app,
+    job,
+    upload_id: str,
+    spool_path: Path,
+    content_hash: str,
+    dtypes=None,
+    parquet_settings=None,
+    partition_by=None
+):
+    """Run a background upload and publish its progress to the job registry."""
+    jobs = app.state.upload_jobs
+    try:
+        upload_data = await _ingest_upload(
+            app.state.converter,
+            job.user_id,
+            upload_id,
+            job.filename,
+            spool_path,
+            content_hash,
+            on_progress=lambda event: jobs.publish(job, "progress", event),
+            dtypes=dtypes,
+            parquet_settings=parquet_settings,
+            partition_by=partition_by
+        )
+        jobs.publish(job, "done", upload_data)
+    except Exception as e:
+        error = _upload_error(e)
+        jobs.publish(job, "error", {
+            "status_code": error.status_code,
+            "detail": error.detail
+        })
     finally:
-        conn.close()
+        await get_storage().aunlink(spool_path)
 
 
 @router.post("/upload")
 async def upload_csv(
     request: Request,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    run_async: bool = Query(False, alias="async"),
+    dtypes: str = Query(None),
+    parquet_profile: str = Query(None),
+    parquet_options: str = Query(None),
+    partition_by: str = Query(None),
+    user=Depends(require_user)
 ):
     """
     Upload a CSV file, convert to Parquet, and store metadata.
@@ -177,163 +855,612 @@ async def upload_csv(
     Args:
         request: FastAPI request object (for session)
         file: The uploaded CSV file
-        
+        run_async: If true (?async=true), return 202 with a job ID as soon
+            as the file is spooled and convert it in the background
+        dtypes: Optional JSON object of column type overrides
+            (?dtypes={"id":"int64","city":"dictionary"}); other columns
+            are inferred from a sample of the file
+        parquet_profile: Optional Parquet writer profile (see
+            parquet_profiles.PROFILES) instead of the deployment default
+        parquet_options: Optional JSON object of Parquet settings applied
+            on top of the profile (?parquet_options={"sort_by":["date"]})
+        partition_by: Optional column to store the upload as a dataset
+            partitioned by (Hive-style, one directory per value)
+    
     Returns:
-        JSON response with upload details
+        JSON response with upload details, or the job ID in async mode
     """
     
-    # 1. Check authentication with session refresh support
-    try:
-        session = workos.user_management.load_sealed_session(
-            sealed_session=request.cookies.get("wos_session"),
-            cookie_password=WORKOS_COOKIE_PASSWORD,
-        )
-        auth_response = session.authenticate()
-        
-        # If not authenticated, attempt to refresh the session
-        if not auth_response.authenticated:
-            if auth_response.reason == "no_session_cookie_provided":
-                raise HTTPException(status_code=401, detail="No session cookie")
-            
-            # Try to refresh the session
-            try:
-                refresh_result = session.refresh()
-                if not refresh_result.authenticated:
-                    raise HTTPException(status_code=401, detail="Session refresh failed")
-                
-                # Session refreshed successfully - use the new user
-                user = refresh_result.user
-                user_id = user.id
-            except Exception as refresh_error:
-                raise HTTPException(status_code=401, detail="Session expired")
-        else:
-            user = auth_response.user
-            user_id = user.id
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=401, detail="Authentication failed")
+    # 1. Authenticated by require_user (with session refresh support)
+    user_id = user.id
     
     # 2. Validate file type
     if not file.filename.endswith('.csv'):
         raise HTTPException(
-            status_code=400, 
+            status_code=400,
             detail="Only CSV files are allowed"
         )
+    column_dtypes = _parse_dtypes(dtypes)
+    parquet_settings = _parse_parquet_settings(parquet_profile, parquet_options)
+    
+    # Refuse early rather than spooling a file we cannot convert
+    if request.app.state.converter.saturated:
+        raise _upload_error(ExecutorSaturatedError())
     
     # 3. Generate unique upload ID
     upload_id = str(uuid.uuid4())
     
+    # 4. Spool the upload to disk so a worker process can read it,
+    # hashing it on the way to detect files the user already has
+    storage = get_storage()
+    spool_path = await storage.aensure_directory(SPOOL_DIR) / f"{upload_id}.csv"
+    await file.seek(0)
+    content_hash = await storage.arun(_spool_file, file.file, spool_path)
+    
+    # 5a. Async mode: hand the spooled file to a background job
+    if run_async:
+        job = request.app.state.upload_jobs.create(
+            user_id,
+            file.filename,
+            await storage.asize(spool_path)
+        )
+        job.task = asyncio.create_task(
+            _run_upload_job(
+                request.app, job, upload_id, spool_path, content_hash,
+                column_dtypes, parquet_settings, partition_by
+            )
+        )
+        return JSONResponse(
+            status_code=202,
+            content={
+                "success": True,
+                "message": "Upload accepted for processing",
+                "data": {
+                    "job_id": job.job_id,
+                    "events_url": f"/api/upload/jobs/{job.job_id}/events"
+                }
+            }
+        )
+    
+    # 5b. Sync mode: convert and wait for the result
+    try:
+        upload_data = await _ingest_upload(
+            request.app.state.converter,
+            user_id,
+            upload_id,
+            file.filename,
+            spool_path,
+            content_hash,
+            dtypes=column_dtypes,
+            parquet_settings=parquet_settings,
+            partition_by=partition_by
+        )
+    except Exception as e:
+        raise _upload_error(e)
+    finally:
+        await storage.aunlink(spool_path)
+    
+    # 6. Return success response
+    return JSONResponse(
+        status_code=201,
+        content={
+            "success": True,
+            "message": "File uploaded successfully",
+            "data": upload_data
+        }
+    )
+
+
+def _spool_file(source, spool_path: Path) -> str:
+    """
+    Copy a file-like object to spool_path and hash it. Blocking; run on
+    the storage threads.
+    
+    Returns:
+        Content hash of the spooled bytes (see ingest.spool_and_hash)
+    """
     try:
-        # 4. Read CSV file
-        contents = await file.read()
+        with open(spool_path, 'wb') as spool:
+            return spool_and_hash(source, spool)
+    except BaseException:
+        spool_path.unlink(missing_ok=True)
+        raise
+
+
+def _spool_batch(files, spool_dir: Path) -> list:
+    """
+    Spool and hash every CSV in a batch request, expanding ZIP archives.
+    Runs on the storage threads.
+    
+    Returns:
+        Per CSV (or rejected file), a dict with filename and either
+        upload_id, spool_path and content_hash, or status_code and detail
+    """
+    items = []
+    accepted = 0
+    
+    def reject(filename, status_code, detail):
+        items.append({"filename": filename, "status_code": status_code, "detail": detail})
+    
+    def add_csv(filename, source):
+        nonlocal accepted
+        if accepted >= BATCH_MAX_FILES:
+            reject(filename, 413, f"A batch can hold at most {BATCH_MAX_FILES} files")
+            return
+        upload_id = str(uuid.uuid4())
+        spool_path = spool_dir / f"{upload_id}.csv"
+        content_hash = _spool_file(source, spool_path)
+        accepted += 1
+        items.append({
+            "filename": filename,
+            "upload_id": upload_id,
+            "spool_path": spool_path,
+            "content_hash": content_hash
+        })
+    
+    for file in files:
+        if file.filename.endswith('.csv'):
+            file.file.seek(0)
+            add_csv(file.filename, file.file)
+            continue
+        
+        if not file.filename.endswith('.zip'):
+            reject(file.filename, 400, "Only CSV files or ZIP archives of them are allowed")
+            continue
         
-        # Try different encodings
         try:
-            df = pd.read_csv(
-                pd.io.common.BytesIO(contents),
-                encoding='utf-8'
-            )
-        except UnicodeDecodeError:
-            # Fallback to latin-1 if utf-8 fails
-            df = pd.read_csv(
-                pd.io.common.BytesIO(contents),
-                encoding='latin-1'
-            )
+            archive = zipfile.ZipFile(file.file)
+        except zipfile.BadZipFile:
+            reject(file.filename, 400, "Invalid ZIP archive")
+            continue
         
-        # 5. Get metadata
-        row_count = len(df)
-        column_count = len(df.columns)
+        with archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir()
+                and not member.filename.startswith("__MACOSX/")
+                and not member.filename.rsplit("/", 1)[-1].startswith(".")
+            ]
+            # Sizes come from the archive's directory; zipfile never
+            # extracts more than a member declares
+            if sum(member.file_size for member in members) > BATCH_MAX_ARCHIVE_BYTES:
+                reject(file.filename, 413, "ZIP archive is too large when extracted")
+                continue
+            
+            for member in members:
+                filename = member.filename.rsplit("/", 1)[-1]
+                if not filename.endswith('.csv'):
+                    reject(filename, 400, "Only CSV files are allowed")
+                    continue
+                try:
+                    with archive.open(member) as source:
+                        add_csv(filename, source)
+                except (zipfile.BadZipFile, RuntimeError, NotImplementedError) as e:
+                    # Corrupt, encrypted or unsupported compression
+                    reject(filename, 400, f"Could not extract from {file.filename}: {str(e)}")
+    
+    return items
+
+
+async def _stored_hashes(user_id: str, content_hashes: set) -> set:
+    """Content hashes, of those given, that the user already has stored."""
+    if not content_hashes:
+        return set()
+    placeholders = ", ".join("?" for _ in content_hashes)
+    async with get_connection_manager().aread() as conn:
+        cursor = await conn.execute(f"""
+            SELECT content_hash
+            FROM upload_blobs
+            WHERE user_id = ? AND content_hash IN ({placeholders})
+        """, [user_id, *content_hashes])
+        rows = await cursor.fetchall()
+    return {row[0] for row in rows}
+
+
+@router.post("/upload/batch")
+async def upload_batch(
+    request: Request,
+    files: list[UploadFile] = File(...),
+    user=Depends(require_user)
+):
+    """
+    Upload several CSV files, or ZIP archives of them, in one request.
+    Distinct files are converted concurrently in the process pool and all
+    metadata is written in a single transaction.
+    
+    Args:
+        request: FastAPI request object (for session)
+        files: CSV files and/or ZIP archives containing CSV files
+    
+    Returns:
+        JSON response with one result per CSV (or rejected file), in
+        request order, each with a status_code and either data or detail;
+        201 if every file was stored, 207 if any failed
+    """
+    
+    # 1. Authenticated by require_user (with session refresh support)
+    user_id = user.id
+    converter = request.app.state.converter
+    
+    # Refuse early rather than spooling files we cannot convert
+    if converter.saturated:
+        raise _upload_error(ExecutorSaturatedError())
+    
+    # 2. Spool (and hash) every CSV, expanding ZIP archives
+    storage = get_storage()
+    items = await storage.arun(_spool_batch, files, await storage.aensure_directory(SPOOL_DIR))
+    if not items:
+        raise HTTPException(status_code=400, detail="No CSV files found in the upload")
+    accepted = [item for item in items if "spool_path" in item]
+    
+    try:
+        # 3. Convert each distinct file the user doesn't already have,
+        # no more at once than there are workers
+        stored_hashes = await _stored_hashes(user_id, {item['content_hash'] for item in accepted})
+        to_convert = {}
+        for item in accepted:
+            if item['content_hash'] not in stored_hashes:
+                to_convert.setdefault(item['content_hash'], item)
         
-        # Store schema as JSON
-        schema = {
-            'columns': df.columns.tolist(),
-            'dtypes': df.dtypes.astype(str).to_dict()
-        }
-        schema_json = json.dumps(schema)
+        slots = asyncio.Semaphore(converter.max_workers)
         
-        # 6. Save as Parquet
-        user_dir = get_user_upload_directory(user_id)
-        parquet_filename = f"{upload_id}.parquet"
-        parquet_path = user_dir / parquet_filename
+        async def convert(item):
+            async with slots:
+                return await _convert_upload(converter, user_id, item['upload_id'], item['spool_path'])
         
-        # Convert to Parquet with compression
-        df.to_parquet(
-            parquet_path,
-            engine='pyarrow',
-            compression='snappy',
-            index=False
+        outcomes = await asyncio.gather(
+            *(convert(item) for item in to_convert.values()),
+            return_exceptions=True
         )
+        conversions = dict(zip(to_convert, outcomes))
         
-        # Store relative path for portability
-        relative_path = str(parquet_path.relative_to(Path(__file__).parent.parent))
-        
-        # 7. Insert metadata into database
-        conn = get_db_connection()
-        uploaded_at = datetime.now()
+        # 4. Record every converted or already stored file in one transaction
+        entries = []
+        for item in accepted:
+            outcome = conversions.get(item['content_hash'])
+            if isinstance(outcome, Exception):
+                error = _upload_error(outcome)
+                item.update(status_code=error.status_code, detail=error.detail)
+                continue
+            converted = to_convert.get(item['content_hash']) is item
+            item['entry'] = {
+                "upload_id": item['upload_id'],
+                "filename": item['filename'],
+                "uploaded_at": datetime.now(),
+                "content_hash": item['content_hash'],
+                "result": outcome[0] if converted else None,
+                "converted_path": outcome[1] if converted else None
+            }
+            entries.append(item)
         
         try:
-            conn.execute("""
-                INSERT INTO uploads (
-                    upload_id,
-                    user_id,
-                    filename,
-                    uploaded_at,
-                    parquet_path,
-                    row_count,
-                    column_count,
-                    schema_json
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, [
-                upload_id,
-                user_id,
-                file.filename,
-                uploaded_at,
-                relative_path,
-                row_count,
-                column_count,
-                schema_json
-            ])
-            
-        finally:
-            conn.close()
+            stored = await run_in_threadpool(
+                _record_uploads, user_id, [item['entry'] for item in entries]
+            )
+        except Exception as e:
+            for outcome in outcomes:
+                if not isinstance(outcome, BaseException):
+                    await storage.aremove_upload(outcome[1])
+            raise _upload_error(e)
+        await _discard_conversions([item['entry'] for item in entries])
         
-        # 8. Prepare response data
-        upload_data = {
-            "upload_id": upload_id,
-            "filename": file.filename,
-            "row_count": row_count,
-            "column_count": column_count,
-            "columns": schema['columns'],
-            "uploaded_at": uploaded_at.isoformat()
-        }
+        for item, upload_data in zip(entries, stored):
+            if upload_data is None:
+                item.update(status_code=409, detail="An identical upload was deleted while this batch was processed, please retry")
+            else:
+                item.update(status_code=201, data=upload_data)
         
-        # 9. Return success response
+        if any(upload_data is not None for upload_data in stored):
+            upload_listings.invalidate(user_id)
+    
+    finally:
+        for item in accepted:
+            await storage.aunlink(item['spool_path'])
+    
+    # 5. Return per-file results
+    results = []
+    for item in items:
+        result = {"filename": item['filename'], "status_code": item['status_code']}
+        if "data" in item:
+            result["data"] = item['data']
+        else:
+            result["detail"] = item['detail']
+        results.append(result)
+    
+    failed = sum(1 for result in results if result['status_code'] != 201)
+    return JSONResponse(
+        status_code=207 if failed else 201,
+        content={
+            "success": failed == 0,
+            "message": f"{len(results) - failed} of {len(results)} files uploaded",
+            "data": {
+                "uploaded": len(results) - failed,
+                "failed": failed,
+                "results": results
+            }
+        }
+    )
+
+
+def _session_response(session: dict, status_code: int = 200) -> JSONResponse:
+    """Session state, with its offset in tus-style headers as well."""
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "session_id": session['session_id'],
+            "filename": session['filename'],
+            "total_bytes": session['total_bytes'],
+            "offset": session['committed_bytes'],
+            "chunk_size": UPLOAD_CHUNK_SIZE,
+            "status": session['status'],
+            "upload_url": f"/api/upload/sessions/{session['session_id']}"
+        },
+        headers={
+            "Upload-Offset": str(session['committed_bytes']),
+            "Upload-Length": str(session['total_bytes'])
+        }
+    )
+
+
+def _owned_session(session_id: str, user_id: str) -> dict:
+    session = get_session(session_id, user_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+
+@router.post("/upload/sessions")
+async def create_upload_session(
+    filename: str,
+    total_bytes: int = Query(..., ge=1, le=UPLOAD_SESSION_MAX_BYTES),
+    user=Depends(require_user)
+):
+    """
+    Start a resumable upload.
+    The file is then sent with PUT /api/upload/sessions/{session_id} in
+    chunks of chunk_size bytes and finished with .../commit.
+    
+    Args:
+        filename: Name of the CSV file being uploaded
+        total_bytes: Size of the file in bytes
+    
+    Returns:
+        201 with the session (session_id, offset, chunk_size, upload_url)
+    """
+    if not filename.endswith('.csv'):
+        raise HTTPException(
+            status_code=400,
+            detail="Only CSV files are allowed"
+        )
+    
+    session = await run_in_threadpool(create_session, user.id, filename, total_bytes)
+    return _session_response(session, status_code=201)
+
+
+@router.api_route("/upload/sessions/{session_id}", methods=["GET", "HEAD"])
+async def get_upload_session(session_id: str, user=Depends(require_user)):
+    """
+    Committed offset of a resumable upload; resume sending from there.
+    """
+    session = await run_in_threadpool(_owned_session, session_id, user.id)
+    return _session_response(session)
+
+
+@router.put("/upload/sessions/{session_id}")
+async def put_upload_chunk(
+    session_id: str,
+    request: Request,
+    upload_offset: int = Header(...),
+    upload_checksum: str = Header(None),
+    user=Depends(require_user)
+):
+    """
+    Write one chunk of a resumable upload.
+    
+    Args:
+        session_id: The upload session
+        upload_offset: Upload-Offset header; must equal the committed offset
+        upload_checksum: Optional Upload-Checksum header,
+            "<sha256|sha1|md5> <base64 digest>" of the chunk
+    
+    Returns:
+        204 with the new Upload-Offset header
+        409 (with the committed offset) if the offset is stale,
+        460 if the checksum doesn't match, 413 for an oversized chunk
+    """
+    await run_in_threadpool(_owned_session, session_id, user.id)
+    
+    # Read the chunk; at most one chunk is ever held in memory
+    chunk = bytearray()
+    async for piece in request.stream():
+        chunk += piece
+        if len(chunk) > UPLOAD_CHUNK_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Chunks may be at most {UPLOAD_CHUNK_SIZE} bytes"
+            )
+    
+    try:
+        if upload_checksum:
+            verify_checksum(upload_checksum, chunk)
+        offset = await run_in_threadpool(
+            write_chunk, session_id, upload_offset, bytes(chunk), UPLOAD_CHUNK_SIZE
+        )
+    except ChunkError as e:
+        headers = None
+        if e.status_code == 409:
+            session = await run_in_threadpool(_owned_session, session_id, user.id)
+            headers = {"Upload-Offset": str(session['committed_bytes'])}
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+    
+    return Response(status_code=204, headers={"Upload-Offset": str(offset)})
+
+
+@router.delete("/upload/sessions/{session_id}")
+async def delete_upload_session(session_id: str, user=Depends(require_user)):
+    """
+    Abandon a resumable upload and discard the bytes received.
+    """
+    await run_in_threadpool(_owned_session, session_id, user.id)
+    await run_in_threadpool(delete_session, session_id)
+    return Response(status_code=204)
+
+
+@router.post("/upload/sessions/{session_id}/commit")
+async def commit_upload_session(
+    session_id: str,
+    request: Request,
+    run_async: bool = Query(False, alias="async"),
+    dtypes: str = Query(None),
+    parquet_profile: str = Query(None),
+    parquet_options: str = Query(None),
+    partition_by: str = Query(None),
+    user=Depends(require_user)
+):
+    """
+    Finish a resumable upload and ingest the file like POST /api/upload.
+    
+    Args:
+        session_id: A session whose every byte has been received
+        run_async: If true (?async=true), return 202 with a job ID and
+            convert in the background
+        dtypes: Optional JSON object of column type overrides
+        parquet_profile, parquet_options, partition_by: Optional Parquet
+            layout, as for POST /api/upload
+    
+    Returns:
+        201 with upload details (202 with the job in async mode)
+        409 if bytes are missing or the session is already being committed;
+        400 for a file that can't be ingested, which ends the session; after
+        any other error the commit can be retried
+    """
+    user_id = user.id
+    session = await run_in_threadpool(_owned_session, session_id, user_id)
+    column_dtypes = _parse_dtypes(dtypes)
+    parquet_settings = _parse_parquet_settings(parquet_profile, parquet_options)
+    
+    # Refuse before claiming the session, so the commit can be retried
+    if request.app.state.converter.saturated:
+        raise _upload_error(ExecutorSaturatedError())
+    
+    if not await run_in_threadpool(claim_for_commit, session_id, user_id):
+        raise HTTPException(
+            status_code=409,
+            detail=(
+                f"Upload incomplete: {session['committed_bytes']} of {session['total_bytes']} bytes received"
+                if session['committed_bytes'] < session['total_bytes']
+                else "Upload session is already being committed"
+            ),
+            headers={"Upload-Offset": str(session['committed_bytes'])}
+        )
+    
+    spool_path = spool_path_for(session_id)
+    upload_id = str(uuid.uuid4())
+    try:
+        content_hash = await get_storage().arun(hash_file, spool_path)
+    except Exception as e:
+        await run_in_threadpool(reopen_session, session_id)
+        raise _upload_error(e)
+    
+    # Async mode: the background job takes over the spool file
+    if run_async:
+        await run_in_threadpool(delete_session, session_id, True)
+        job = request.app.state.upload_jobs.create(
+            user_id,
+            session['filename'],
+            session['total_bytes']
+        )
+        job.task = asyncio.create_task(
+            _run_upload_job(
+                request.app, job, upload_id, spool_path, content_hash,
+                column_dtypes, parquet_settings, partition_by
+            )
+        )
         return JSONResponse(
-            status_code=201,
+            status_code=202,
             content={
                 "success": True,
-                "message": "File uploaded successfully",
-                "data": upload_data
+                "message": "Upload accepted for processing",
+                "data": {
+                    "job_id": job.job_id,
+                    "events_url": f"/api/upload/jobs/{job.job_id}/events"
+                }
             }
         )
-        
-    except pd.errors.EmptyDataError:
-        raise HTTPException(status_code=400, detail="CSV file is empty")
     
-    except pd.errors.ParserError as e:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Failed to parse CSV: {str(e)}"
+    try:
+        upload_data = await _ingest_upload(
+            request.app.state.converter,
+            user_id,
+            upload_id,
+            session['filename'],
+            spool_path,
+            content_hash,
+            dtypes=column_dtypes,
+            parquet_settings=parquet_settings,
+            partition_by=partition_by
         )
-    
+    except ValueError as e:
+        # EmptyCSVError, CSVParseError, PartitionError or bad dtypes: the
+        # same bytes would fail again
+        await run_in_threadpool(delete_session, session_id)
+        raise _upload_error(e)
     except Exception as e:
-        # Clean up parquet file if it was created
-        if 'parquet_path' in locals() and parquet_path.exists():
-            parquet_path.unlink()
-        
-        raise HTTPException(
-            status_code=500,
-            detail=f"Upload failed: {str(e)}"
-        )
\ No newline at end of file
+        # Saturation, a timeout or the metadata database: keep the bytes
+        # so the commit can be retried
+        await run_in_threadpool(reopen_session, session_id)
+        raise _upload_error(e)
+    
+    await run_in_threadpool(delete_session, session_id)
+    
+    return JSONResponse(
+        status_code=201,
+        content={
+            "success": True,
+            "message": "File uploaded successfully",
+            "data": upload_data
+        }
+    )
+
+
+@router.get("/upload/jobs/{job_id}")
+async def get_upload_job(job_id: str, request: Request, user=Depends(require_user)):
+    """
+    Get the current status of a background upload job.
+    
+    Returns:
+        JSON with the job status and its most recent event
+        404 if the job is unknown, expired or belongs to another user
+    """
+    user_id = user.id
+    
+    job = request.app.state.upload_jobs.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JSONResponse(status_code=200, content=job.to_dict())
+
+
+@router.get("/upload/jobs/{job_id}/events")
+async def upload_job_events(job_id: str, request: Request, user=Depends(require_user)):
+    """
+    Server-Sent Events stream of a background upload job.
+    Sends the current state immediately, then "progress" events
+    (bytes_parsed, rows_written, row_groups) and finally "done" with the
+    upload details or "error" with status_code and detail.
+    """
+    user_id = user.id
+    
+    jobs = request.app.state.upload_jobs
+    job = jobs.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_generator():
+        async for event in jobs.subscribe(job):
+            yield {
+                "event": event["event"],
+                "data": json.dumps(event["data"])
+            }
+    
+    return EventSourceResponse(event_generator())
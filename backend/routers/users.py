@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, Depends
-from config import workos, WORKOS_COOKIE_PASSWORD
-from dependencies import with_auth
+from fastapi.responses import RedirectResponse
+from dependencies import with_auth, get_authenticated_user
 
 router = APIRouter(tags=["users"])
 
@@ -11,17 +11,13 @@ def dashboard(request: Request, auth=Depends(with_auth)):
     Protected dashboard endpoint.
     Returns user data if authenticated.
     """
-    # If with_auth returns a RedirectResponse (not authenticated), FastAPI will return it
-    # Otherwise, auth contains {"session": session, "user": user}
-    
-    session = workos.user_management.load_sealed_session(
-        sealed_session=request.cookies.get("wos_session"),
-        cookie_password=WORKOS_COOKIE_PASSWORD,
-    )
+    # If with_auth returns a RedirectResponse (not authenticated), return it
+    # Otherwise, auth contains {"session": session, "user": user}, already
+    # verified - no need to authenticate the session a second time
+    if isinstance(auth, RedirectResponse):
+        return auth
 
-    response = session.authenticate()
-
-    current_user = response.user if response.authenticated else None
+    current_user = auth["user"]
 
     print(f"User {current_user.first_name} is logged in")
 
@@ -44,14 +40,9 @@ def get_current_user(request: Request):
     Returns authentication status and user data if logged in.
     """
     try:
-        session = workos.user_management.load_sealed_session(
-            sealed_session=request.cookies.get("wos_session"),
-            cookie_password=WORKOS_COOKIE_PASSWORD,
-        )
-        auth_response = session.authenticate()
+        user = get_authenticated_user(request)
         
-        if auth_response.authenticated:
-            user = auth_response.user
+        if user is not None:
             return {
                 "authenticated": True,
                 "user": {
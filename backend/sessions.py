@@ -0,0 +1,162 @@
+"""
+In-process cache of verified sessions.
+Maps a hash of the sealed session cookie to the user it resolved to, so a
+cookie is unsealed and its JWT verified once rather than on every request.
+Entries never outlive the access token inside the cookie.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+try:
+    from workos.session import unseal_data
+except ImportError:  # SDKs that do not expose it; fall back to the TTL alone
+    unseal_data = None
+
+
+def session_key(sealed_session: str) -> str:
+    """Cache key for a sealed session cookie (never store the cookie itself)."""
+    return hashlib.sha256(sealed_session.encode()).hexdigest()
+
+
+def token_expiry(sealed_session: str, cookie_password: str):
+    """
+    Expiry of the access token inside a sealed session.
+
+    Returns:
+        Expiry as a Unix timestamp, or None if it cannot be read
+    """
+    if unseal_data is None:
+        return None
+    try:
+        session = unseal_data(sealed_session, cookie_password)
+        # Already verified by authenticate(); only the claim is needed here
+        claims = jwt.decode(session["access_token"], options={"verify_signature": False})
+        return float(claims["exp"])
+    except Exception:
+        return None
+
+
+class SessionCache:
+    """
+    Thread-safe TTL + LRU cache of authenticated users.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        """Return the cached user for key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, user, expires_at: float = None, ttl: float = None):
+        """
+        Cache user under key until the earlier of expires_at and now + ttl.
+        """
+        now = time.time()
+        deadline = now + (self.ttl if ttl is None else ttl)
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        if deadline <= now:
+            return
+
+        with self._lock:
+            self._entries[key] = (user, deadline)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into one execution.
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and share its result (or exception).
+    """
+
+    def __init__(self, max_keys: int = 1024):
+        self.max_keys = max_keys
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if not leader:
+                self.coalesced += 1
+            elif len(self._flights) < self.max_keys:
+                flight = self._flights[key] = _Flight()
+            self.executions += leader
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        if flight is None:
+            # Too many keys in flight; run without coalescing
+            return fn()
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+            }
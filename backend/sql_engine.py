@@ -0,0 +1,225 @@
+"""
+SQL queries across a user's uploads.
+Every upload is exposed as a view named after its file (sales.csv → sales;
+a second sales.csv → sales_2), so a query can join and union uploads by
+name. Each query runs on its own in-memory DuckDB connection holding only
+the views it references, with its own memory and thread limits; the
+connection can read nothing outside the user's upload directory (or
+bucket prefix) and its settings are locked before the query runs. Only a single SELECT is
+accepted.
+
+Results can be cached (result_cache.ResultCache), keyed by the parsed
+query and the uploads its views resolved to and tagged with those uploads,
+so a result never outlives the uploads it was computed from.
+"""
+
+import json
+import re
+import threading
+from pathlib import Path
+import duckdb
+import pyarrow as pa
+from database import get_connection_manager
+from datasets import dataset_schema, is_dataset
+from result_cache import ResultCache, result_key
+from storage import get_storage
+from upload_queries import parquet_source, quote_identifier, record_batch_reader, resolve_parquet_path
+
+# Parses queries without running them; cursors are made per call
+_parser = duckdb.connect()
+
+
+class SQLQueryError(ValueError):
+    """Raised for a query that is invalid, not a single SELECT, or fails."""
+
+
+class QueryTimeoutError(SQLQueryError):
+    """Raised when a query runs past its time limit."""
+
+
+def view_name(filename: str) -> str:
+    """SQL-friendly view name for an uploaded file ("Q1 Sales.csv" → "q1_sales")."""
+    name = re.sub(r"[^a-z0-9_]+", "_", Path(filename).stem.lower()).strip("_") or "upload"
+    return f"t_{name}" if name[0].isdigit() else name
+
+
+def user_catalog(user_id: str) -> dict:
+    """
+    The user's uploads by view name; the oldest upload of a file name
+    gets the plain name, later ones _2, _3, ...
+
+    Returns:
+        dict of view name -> {upload_id, filename, parquet_path, row_count, column_count}
+    """
+    with get_connection_manager().read() as conn:
+        rows = conn.execute("""
+            SELECT upload_id, filename, parquet_path, row_count, column_count
+            FROM uploads
+            WHERE user_id = ? AND deleted_at IS NULL
+            ORDER BY uploaded_at, upload_id
+        """, [user_id]).fetchall()
+
+    catalog = {}
+    for upload_id, filename, parquet_path, row_count, column_count in rows:
+        base = name = view_name(filename)
+        suffix = 2
+        while name in catalog:
+            name = f"{base}_{suffix}"
+            suffix += 1
+        catalog[name] = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "parquet_path": parquet_path,
+            "row_count": row_count,
+            "column_count": column_count,
+        }
+    return catalog
+
+
+def _strip_locations(node):
+    # Character offsets change with whitespace, not meaning
+    if isinstance(node, dict):
+        return {k: _strip_locations(v) for k, v in node.items() if k != "query_location"}
+    if isinstance(node, list):
+        return [_strip_locations(v) for v in node]
+    return node
+
+
+def _table_names(node, names: set) -> set:
+    if isinstance(node, dict):
+        if node.get("type") == "BASE_TABLE" and not node.get("catalog_name"):
+            names.add(node["table_name"].lower())
+        for value in node.values():
+            _table_names(value, names)
+    elif isinstance(node, list):
+        for value in node:
+            _table_names(value, names)
+    return names
+
+
+def parse_query(sql: str):
+    """
+    Parse a query without binding or running it.
+
+    Returns:
+        (normalized query text, set of table names it references)
+
+    Raises:
+        SQLQueryError: If it is not exactly one valid SELECT
+    """
+    cursor = _parser.cursor()
+    try:
+        tree = json.loads(cursor.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    finally:
+        cursor.close()
+
+    if tree["error"]:
+        if tree.get("error_type") == "not implemented":
+            raise SQLQueryError("Only SELECT queries are allowed")
+        raise SQLQueryError(tree["error_message"])
+    if len(tree["statements"]) != 1:
+        raise SQLQueryError("Send exactly one SELECT statement")
+
+    normalized = json.dumps(_strip_locations(tree["statements"][0]), sort_keys=True)
+    return normalized, _table_names(tree, set())
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _create_view(conn, name: str, parquet_path):
+    source, params = parquet_source(parquet_path)
+    # Views can't take parameters; the path is inlined as a string literal
+    source = source.replace("?", _literal(params[0]), 1)
+    columns = "*"
+    filesystem, native_path = get_storage().locate(parquet_path)
+    if is_dataset(native_path, filesystem):
+        # Partition columns back in their upload position
+        columns = ", ".join(quote_identifier(c) for c in dataset_schema(native_path, filesystem)[0].names)
+    conn.execute(f"CREATE VIEW {quote_identifier(name)} AS SELECT {columns} FROM {source}")
+
+
+def run_query(
+    user_id: str,
+    sql: str,
+    max_rows: int,
+    memory_limit: str,
+    threads: int,
+    timeout: float,
+    cache: ResultCache = None,
+):
+    """
+    Run a SELECT over the user's uploads.
+    Blocking; call from a worker thread.
+
+    Args:
+        user_id: Whose uploads the query can see
+        sql: The query, naming uploads by view name (see user_catalog)
+        max_rows: Rows returned at most; the rest are not computed
+        memory_limit: DuckDB memory limit for the query (e.g. "1GB")
+        threads: DuckDB threads for the query
+        timeout: Seconds before the query is interrupted
+        cache: Optional cache for results
+
+    Returns:
+        (pyarrow.Table, truncated: bool, cached: bool)
+
+    Raises:
+        SQLQueryError: If the query is invalid or fails
+        QueryTimeoutError: If it runs past timeout
+    """
+    normalized, table_names = parse_query(sql)
+    catalog = user_catalog(user_id)
+    views = {name: catalog[name] for name in sorted(table_names) if name in catalog}
+
+    upload_ids = {name: view["upload_id"] for name, view in views.items()}
+    key = result_key("sql", user_id, normalized, max_rows, upload_ids)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1]["truncated"], True
+        token = cache.token()
+
+    storage = get_storage()
+    conn = duckdb.connect(config={"memory_limit": memory_limit, "threads": threads})
+    timer = threading.Timer(timeout, conn.interrupt)
+    try:
+        storage.configure_duckdb(conn)
+        for name, view in views.items():
+            location = resolve_parquet_path(view["parquet_path"])
+            if isinstance(location, Path):
+                # Compared with user_root, which resolves symlinks
+                location = location.resolve()
+            _create_view(conn, name, location)
+
+        # From here on the query can only read the user's own files
+        conn.execute("SET allowed_directories = ?", [[storage.user_root(user_id)]])
+        conn.execute("SET enable_external_access = false")
+        conn.execute("SET lock_configuration = true")
+
+        timer.start()
+        reader = record_batch_reader(conn.execute(sql), 10000)
+        batches = []
+        rows = 0
+        for batch in reader:
+            batches.append(batch)
+            rows += batch.num_rows
+            if rows > max_rows:
+                break
+        table = pa.Table.from_batches(batches, schema=reader.schema)
+    except duckdb.InterruptException:
+        raise QueryTimeoutError(f"Query did not finish within {timeout:g}s")
+    except duckdb.OutOfMemoryException:
+        raise SQLQueryError(f"Query needed more than the {memory_limit} memory limit")
+    except duckdb.Error as e:
+        raise SQLQueryError(str(e))
+    finally:
+        timer.cancel()
+        conn.close()
+
+    truncated = table.num_rows > max_rows
+    table = table.slice(0, max_rows)
+    if cache is not None:
+        cache.put(key, table, tags=upload_ids.values(), info={"truncated": truncated}, token=token)
+    return table, truncated, False
@@ -0,0 +1,410 @@
+"""
+Storage for uploaded files.
+Uploads' Parquet files and previews live in a storage backend: a local
+directory (LocalStorage) or an S3-compatible bucket (S3Storage), so that
+several API nodes can serve the same uploads. uploads.parquet_path holds
+the URI of an upload's file (file:///... or s3://bucket/key); paths stored
+before URIs, relative to the backend directory, still resolve. Spool files
+and the trash are always on local disk.
+
+Both backends are reached through pyarrow.fs: conversion workers stream
+Parquet straight into the backend (multipart uploads on S3), previews are
+read with ranged requests, and DuckDB reads S3 objects through its httpfs
+extension, fetching only the footers and row groups a query needs.
+
+Blocking calls go through a Storage rather than os and pathlib in request
+handlers. Its async methods (a-prefixed) run the call on a dedicated
+thread pool, so a slow volume or bucket stalls neither the event loop nor
+the threadpool that serves sync endpoints; the plain methods are for code
+already running in a worker thread, or inside a write transaction where a
+rename has to happen before the commit.
+
+Directories already known to exist are remembered, so ensuring a user's
+upload directory on every upload costs a set lookup after the first.
+"""
+
+import asyncio
+import functools
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+import pyarrow.fs as pafs
+from datasets import remove_parquet
+from previews import preview_path_for
+
+# Stored paths from before URIs are relative to the backend directory
+BASE_DIR = Path(__file__).parent
+UPLOADS_DIR = BASE_DIR / "data" / "uploads"
+
+DEFAULT_IO_THREADS = 8
+# Directories remembered as existing; least recently ensured are forgotten
+DEFAULT_MAX_KNOWN_DIRECTORIES = 100_000
+
+_LOCAL = pafs.LocalFileSystem()
+
+
+class Storage:
+    """
+    Operations shared by the backends.
+    Locations are local Paths or URIs; a backend resolves its own URIs to
+    a pyarrow filesystem, everything else is on local disk.
+
+    Args:
+        max_workers: Threads for blocking filesystem calls
+        max_known_directories: Directories remembered as existing
+    """
+
+    # Whether upload files can be atomically renamed within the backend
+    supports_rename = True
+
+    def __init__(self, max_workers: int = DEFAULT_IO_THREADS, max_known_directories: int = DEFAULT_MAX_KNOWN_DIRECTORIES):
+        self.max_known_directories = max_known_directories
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+        self._known = OrderedDict()
+        self._lock = threading.Lock()
+        self.directory_hits = 0
+        self.directory_creates = 0
+
+    # Backend specific
+
+    def uri(self, *parts: str) -> str:
+        """URI of an upload file, from path parts under the backend root."""
+        raise NotImplementedError
+
+    def user_root(self, user_id: str) -> str:
+        """Location prefix every file of the user's uploads is under."""
+        raise NotImplementedError
+
+    def _locate_uri(self, parsed):
+        raise ValueError(f"Unsupported storage URI scheme: {parsed.scheme}")
+
+    def configure_duckdb(self, conn):
+        """Let a DuckDB connection read files in this backend."""
+
+    @staticmethod
+    def resolve(location):
+        """
+        Normalize a stored parquet_path (or any location): local files
+        become absolute Paths, other URIs are returned as they are.
+        """
+        if isinstance(location, Path):
+            return location
+        parsed = urlparse(location)
+        if parsed.scheme == "file":
+            return Path(unquote(parsed.path))
+        if parsed.scheme and "://" in location:
+            return location
+        return BASE_DIR / location
+
+    def locate(self, location):
+        """
+        Where a location is, for pyarrow and the Parquet modules.
+
+        Returns:
+            (pyarrow FileSystem, or None for local disk, path within it)
+        """
+        location = self.resolve(location)
+        if isinstance(location, Path):
+            return None, location
+        return self._locate_uri(urlparse(location))
+
+    # Local directories
+
+    async def arun(self, fn, *args, **kwargs):
+        """Run a blocking call on the storage threads."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def _known_directory(self, path) -> bool:
+        with self._lock:
+            if path in self._known:
+                self._known.move_to_end(path)
+                self.directory_hits += 1
+                return True
+            return False
+
+    def _remember_directory(self, path):
+        with self._lock:
+            self._known[path] = True
+            self._known.move_to_end(path)
+            self.directory_creates += 1
+            while len(self._known) > self.max_known_directories:
+                self._known.popitem(last=False)
+
+    def ensure_directory(self, location):
+        """
+        Create a local directory (and parents) unless known to exist.
+        Object stores have no directories; their locations are returned as
+        they are.
+        """
+        location = self.resolve(location)
+        if isinstance(location, Path) and not self._known_directory(location):
+            location.mkdir(parents=True, exist_ok=True)
+            self._remember_directory(location)
+        return location
+
+    async def aensure_directory(self, location):
+        location = self.resolve(location)
+        if not isinstance(location, Path) or self._known_directory(location):
+            return location
+        return await self.arun(self.ensure_directory, location)
+
+    def forget_directory(self, path):
+        """Stop assuming a directory exists, e.g. after removing it."""
+        with self._lock:
+            self._known.pop(Path(path), None)
+
+    # Files, in any backend
+
+    def info(self, location) -> pafs.FileInfo:
+        filesystem, path = self.locate(location)
+        return (filesystem or _LOCAL).get_file_info(str(path))
+
+    def exists(self, location) -> bool:
+        return self.info(location).type != pafs.FileType.NotFound
+
+    async def aexists(self, location) -> bool:
+        return await self.arun(self.exists, location)
+
+    def size(self, location) -> int:
+        info = self.info(location)
+        if info.type == pafs.FileType.NotFound:
+            raise FileNotFoundError(str(location))
+        return info.size
+
+    async def asize(self, location) -> int:
+        return await self.arun(self.size, location)
+
+    def unlink(self, location):
+        """Delete a file, if present."""
+        filesystem, path = self.locate(location)
+        if filesystem is None:
+            path.unlink(missing_ok=True)
+            return
+        try:
+            filesystem.delete_file(str(path))
+        except FileNotFoundError:
+            pass
+
+    async def aunlink(self, location):
+        await self.arun(self.unlink, location)
+
+    def replace(self, source, destination):
+        """
+        Rename source over destination. Atomic on local disk; on an object
+        store it is a copy and delete (see supports_rename).
+        """
+        source_fs, source_path = self.locate(source)
+        destination_fs, destination_path = self.locate(destination)
+        if source_fs is None and destination_fs is None:
+            os.replace(source_path, destination_path)
+        elif source_fs is destination_fs:
+            source_fs.move(str(source_path), str(destination_path))
+        else:
+            raise ValueError(f"Can't move {source} to {destination} across storage backends")
+
+    def remove(self, location):
+        """Delete a file or directory tree, if present."""
+        filesystem, path = self.locate(location)
+        remove_parquet(path, filesystem)
+
+    async def aremove(self, location):
+        await self.arun(self.remove, location)
+
+    def remove_upload(self, parquet_path):
+        """Delete an upload's Parquet file or dataset directory and its preview."""
+        self.remove(parquet_path)
+        self.unlink(preview_path_for(self.resolve(parquet_path)))
+
+    async def aremove_upload(self, parquet_path):
+        await self.arun(self.remove_upload, parquet_path)
+
+    def listdir(self, location) -> list:
+        """
+        Entries of a directory, or [] if it doesn't exist.
+
+        Returns:
+            (location, pyarrow FileInfo) per entry
+        """
+        filesystem, path = self.locate(location)
+        selector = pafs.FileSelector(str(path), allow_not_found=True)
+        infos = (filesystem or _LOCAL).get_file_info(selector)
+        if filesystem is None:
+            return [(Path(info.path), info) for info in infos]
+        prefix = urlparse(self.resolve(location)).scheme + "://"
+        return [(prefix + info.path, info) for info in infos]
+
+    async def alistdir(self, location) -> list:
+        return await self.arun(self.listdir, location)
+
+    def modified(self, location, info: pafs.FileInfo = None) -> float:
+        """
+        Last modification time in seconds. Object stores keep none for a
+        dataset directory; it is that of its newest file.
+        """
+        info = info or self.info(location)
+        if info.mtime is not None:
+            return info.mtime.timestamp()
+        filesystem, path = self.locate(location)
+        files = (filesystem or _LOCAL).get_file_info(pafs.FileSelector(str(path), recursive=True, allow_not_found=True))
+        times = [entry.mtime.timestamp() for entry in files if entry.mtime is not None]
+        return max(times, default=0.0)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": type(self).__name__,
+                "known_directories": len(self._known),
+                "directory_hits": self.directory_hits,
+                "directory_creates": self.directory_creates,
+                "queued": self._executor._work_queue.qsize(),
+            }
+
+
+class LocalStorage(Storage):
+    """
+    Uploads in a local (or mounted) directory.
+
+    Args:
+        root: Directory holding one subdirectory per user
+    """
+
+    def __init__(self, root: Path = UPLOADS_DIR, **limits):
+        super().__init__(**limits)
+        self.root = Path(root).absolute()
+
+    def uri(self, *parts: str) -> str:
+        return self.root.joinpath(*parts).as_uri()
+
+    def user_root(self, user_id: str) -> str:
+        return str(self.ensure_directory(self.root / user_id).resolve())
+
+
+class S3Storage(Storage):
+    """
+    Uploads in an S3-compatible bucket (AWS S3, MinIO, ...).
+    Objects can't be renamed, so supports_rename is False: a converted
+    upload keeps the key it was written under.
+
+    Args:
+        uri: s3://bucket/optional/prefix
+        endpoint_url: Endpoint of a non-AWS service, e.g. http://localhost:9000
+        region: Bucket region
+        access_key_id: Access key (default: the usual AWS credential chain)
+        secret_access_key: Secret for access_key_id
+    """
+
+    supports_rename = False
+
+    def __init__(
+        self,
+        uri: str,
+        endpoint_url: str = None,
+        region: str = None,
+        access_key_id: str = None,
+        secret_access_key: str = None,
+        **limits,
+    ):
+        super().__init__(**limits)
+        parsed = urlparse(uri)
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip("/")
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self._credentials = (access_key_id, secret_access_key)
+        options = {"region": region, "access_key": access_key_id, "secret_key": secret_access_key}
+        if endpoint_url:
+            endpoint = urlparse(endpoint_url)
+            options.update(endpoint_override=endpoint.netloc, scheme=endpoint.scheme)
+        self.filesystem = pafs.S3FileSystem(**{name: value for name, value in options.items() if value})
+
+    def _key(self, *parts: str) -> str:
+        return "/".join(part.strip("/") for part in (self.bucket, self.prefix, *parts) if part)
+
+    def uri(self, *parts: str) -> str:
+        return "s3://" + self._key(*parts)
+
+    def user_root(self, user_id: str) -> str:
+        return self.uri(user_id) + "/"
+
+    def _locate_uri(self, parsed):
+        if parsed.scheme != "s3":
+            return super()._locate_uri(parsed)
+        return self.filesystem, f"{parsed.netloc}/{parsed.path.strip('/')}".rstrip("/")
+
+    def configure_duckdb(self, conn):
+        """Load httpfs and give the connection this bucket's credentials."""
+        conn.execute("INSTALL httpfs")
+        conn.execute("LOAD httpfs")
+        options = {"TYPE": "s3", "SCOPE": f"'s3://{self.bucket}'"}
+        access_key_id, secret_access_key = self._credentials
+        if access_key_id:
+            options.update(KEY_ID=_literal(access_key_id), SECRET=_literal(secret_access_key or ""))
+        else:
+            options["PROVIDER"] = "credential_chain"
+        if self.region:
+            options["REGION"] = _literal(self.region)
+        if self.endpoint_url:
+            endpoint = urlparse(self.endpoint_url)
+            options.update(
+                ENDPOINT=_literal(endpoint.netloc),
+                URL_STYLE="'path'",
+                USE_SSL="true" if endpoint.scheme == "https" else "false",
+            )
+        settings = ", ".join(f"{name} {value}" for name, value in options.items())
+        conn.execute(f"CREATE OR REPLACE SECRET upload_storage ({settings})")
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def open_storage(uri: str = None, s3_options: dict = None, **limits) -> Storage:
+    """
+    Create the process-wide storage.
+    Called from the FastAPI lifespan, before the connection manager
+    (which lets DuckDB read the backend).
+
+    Args:
+        uri: s3://bucket/prefix for S3Storage; a directory or file:// URI
+            for LocalStorage (default: data/uploads)
+        s3_options: Keyword arguments for S3Storage (endpoint_url, region,
+            access_key_id, secret_access_key)
+        **limits: max_workers, max_known_directories
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if uri and uri.startswith("s3://"):
+                _storage = S3Storage(uri, **(s3_options or {}), **limits)
+            else:
+                _storage = LocalStorage(Storage.resolve(uri) if uri else UPLOADS_DIR, **limits)
+        return _storage
+
+
+def close_storage():
+    """Wait for pending filesystem calls and shut the storage threads down."""
+    global _storage
+    with _storage_lock:
+        if _storage is not None:
+            _storage.close()
+            _storage = None
+
+
+def get_storage() -> Storage:
+    """
+    Get the process-wide storage.
+    Opens local storage with default limits if the app lifespan has not
+    (e.g. in command-line scripts that don't read uploads).
+    """
+    return _storage or open_storage()
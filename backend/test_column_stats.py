@@ -0,0 +1,71 @@
+"""
+Test script for column statistics.
+Profiles a table in several batches and checks the sketches against exact values.
+"""
+
+import numpy as np
+import pyarrow as pa
+from column_stats import TableProfiler, HyperLogLog, QuantileSketch, hash_array
+
+def test_column_profile():
+    """Test that batch-by-batch profiling matches the whole table."""
+
+    print("\n" + "="*50)
+    print("Testing column statistics")
+    print("="*50)
+
+    rng = np.random.default_rng(7)
+    rows = 200_000
+    table = pa.table({
+        'id': pa.array(np.arange(rows)),
+        'price': pa.array(rng.uniform(0, 100, rows), mask=rng.random(rows) < 0.1),
+        'city': pa.array([f"city{i}" for i in rng.integers(0, 1000, rows)]),
+        'empty': pa.nulls(rows),
+    })
+
+    # 1. Profile in batches
+    print("\n1. Profiling in 10,000 row batches...")
+    profiler = TableProfiler(table.schema)
+    for batch in table.to_batches(max_chunksize=10_000):
+        profiler.update(batch)
+    stats = {column['name']: column for column in profiler.result()}
+
+    assert stats['id']['min'] == 0 and stats['id']['max'] == rows - 1
+    assert stats['price']['null_count'] == table['price'].null_count
+    assert stats['empty']['null_count'] == rows
+    assert stats['empty']['distinct_count'] == 0
+    assert stats['city']['quantiles'] is None
+    print("✓ Null counts and min/max are exact")
+
+    # 2. Distinct counts within a few percent
+    print("\n2. Checking distinct counts...")
+    for name, exact in [('id', rows), ('city', 1000)]:
+        estimate = stats[name]['distinct_count']
+        assert abs(estimate - exact) / exact < 0.05, (name, estimate)
+        print(f"✓ {name}: {estimate} (exact {exact})")
+
+    # 3. Quantiles within 1% rank error
+    print("\n3. Checking quantiles...")
+    ids = np.arange(rows)
+    for key, q in [('p05', 0.05), ('p50', 0.5), ('p95', 0.95)]:
+        rank = np.searchsorted(ids, stats['id']['quantiles'][key]) / rows
+        assert abs(rank - q) < 0.01, (key, rank)
+    print("✓ Quantile ranks within 1%")
+
+    # 4. Sketches merge
+    print("\n4. Merging sketches...")
+    left, right = HyperLogLog(), HyperLogLog()
+    left.add_hashes(hash_array(pa.array(range(0, 6000))))
+    right.add_hashes(hash_array(pa.array(range(4000, 10000))))
+    left.merge(right)
+    assert abs(left.estimate() - 10000) / 10000 < 0.05
+    assert HyperLogLog(registers=left.to_bytes()).estimate() == left.estimate()
+    assert QuantileSketch().quantiles([0.5]) == [None]
+    print("✓ Merged estimate matches the union")
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_column_profile()
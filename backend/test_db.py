@@ -28,7 +28,10 @@ def test_database():
         }
         
         conn.execute("""
-            INSERT INTO uploads VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO uploads (
+                upload_id, user_id, filename, uploaded_at,
+                parquet_path, row_count, column_count, schema_json
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """, [
             test_data['upload_id'],
             test_data['user_id'],
@@ -0,0 +1,97 @@
+"""
+Test script for the conversion executor.
+Runs sleeping jobs in a small process pool to exercise the queue limit and
+the per-job timeout.
+"""
+
+import asyncio
+import time
+from executor import ConversionExecutor, ConversionTimeoutError, ExecutorSaturatedError
+
+def sleep_for(seconds, progress=None):
+    """Job that sleeps, reporting once if asked to; returns seconds."""
+    if progress is not None:
+        progress({"sleeping": seconds})
+    time.sleep(seconds)
+    return seconds
+
+async def _wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out waiting"
+        await asyncio.sleep(0.05)
+
+async def _run_tests():
+    # 1. A job runs in a worker and reports progress
+    print("\n1. Running a job...")
+    executor = ConversionExecutor(max_workers=1, max_queue=1, timeout=1)
+    executor.start()
+    try:
+        events = []
+        assert await executor.run(sleep_for, 0.1, on_progress=events.append) == 0.1
+        assert events == [{"sleeping": 0.1}]
+        print("✓ Result and progress returned")
+
+        # 2. A full queue rejects the job (the upload routes answer 503)
+        print("\n2. Filling the queue...")
+        running = [asyncio.ensure_future(executor.run(sleep_for, 0.7)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert executor.saturated
+        try:
+            await executor.run(sleep_for, 0.1)
+            raise AssertionError("Expected the queue to be full")
+        except ExecutorSaturatedError:
+            pass
+        print("✓ Job rejected while saturated")
+
+        # 3. The timeout starts when a worker picks the job up
+        print("\n3. Waiting in the queue...")
+        # The second job waits 0.7s for the worker, then runs 0.7s: over
+        # the 1s timeout in total, but not once started
+        assert await asyncio.gather(*running) == [0.7, 0.7]
+        await _wait_until(lambda: executor.pending == 0)
+        print("✓ Time spent queued not counted")
+    finally:
+        await executor.shutdown()
+
+    # 4. A job past its timeout has its worker killed
+    print("\n4. Timing out a running job...")
+    executor = ConversionExecutor(max_workers=2, max_queue=0, timeout=1)
+    executor.start()
+    try:
+        await executor.run(sleep_for, 0)
+        abandoned = []
+        started = time.monotonic()
+        stuck = asyncio.ensure_future(
+            executor.run(sleep_for, 60, on_abandon=lambda: abandoned.append(True))
+        )
+        # Caught in the same pool; run again in the new one
+        bystander = asyncio.ensure_future(executor.run(sleep_for, 0.5))
+        try:
+            await stuck
+            raise AssertionError("Expected the job to time out")
+        except ConversionTimeoutError:
+            pass
+        assert await bystander == 0.5
+        await _wait_until(lambda: abandoned == [True] and executor.pending == 0)
+        assert time.monotonic() - started < 10
+        assert await executor.run(sleep_for, 0.1) == 0.1
+        print("✓ Worker killed, other job rerun, pool replaced")
+    finally:
+        await executor.shutdown()
+
+def test_executor():
+    """Test the conversion executor's queue limit and timeout."""
+
+    print("\n" + "="*50)
+    print("Testing the conversion executor")
+    print("="*50)
+
+    asyncio.run(_run_tests())
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_executor()
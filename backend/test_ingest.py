@@ -0,0 +1,290 @@
+"""
+Test script for the streaming CSV → Parquet conversion.
+Converts sample CSVs with a tiny block size to exercise multi-batch writes.
+"""
+
+import io
+from pathlib import Path
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from ingest import convert_csv_to_parquet, DEFAULT_SAMPLE_BYTES
+from csv_parsers import EmptyCSVError, CSVParseError
+from datasets import DatasetWriter, remove_parquet
+from parquet_profiles import resolve_profile
+from previews import preview_path_for, read_preview
+from upload_queries import build_rows_query, describe_parquet
+
+class _CountingReader:
+    """File object wrapper counting the bytes read through it."""
+
+    def __init__(self, source):
+        self.source = source
+        self.name = source.name
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.bytes_read += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+def test_streaming_conversion():
+    """Test that a CSV larger than one block is written as several row groups."""
+
+    print("\n" + "="*50)
+    print("Testing streaming CSV → Parquet conversion")
+    print("="*50)
+
+    test_parquet = Path(__file__).parent / "test_ingest.parquet"
+    rows = 5000
+    csv_bytes = b"id,name,,name\n" + b"".join(
+        f"{i},user{i},{i * 2},alias{i}\n".encode() for i in range(rows)
+    )
+
+    try:
+        # 1. Convert with a 4 KB block size
+        print("\n1. Converting in 4 KB blocks...")
+        result = convert_csv_to_parquet(io.BytesIO(csv_bytes), test_parquet, block_size=4096)
+
+        assert result['row_count'] == rows
+        assert result['column_count'] == 4
+        assert result['schema']['columns'] == ['id', 'name', 'Unnamed: 2', 'name.1']
+        assert result['schema']['dtypes']['id'] == 'int64'
+        print(f"✓ Converted {result['row_count']} rows")
+
+        # 2. Check the Parquet layout
+        print("\n2. Verifying Parquet file...")
+        metadata = pq.ParquetFile(test_parquet).metadata
+        assert metadata.num_rows == rows
+        assert metadata.num_row_groups > 1
+        print(f"✓ {metadata.num_row_groups} row groups written")
+
+        # 3. Latin-1 fallback
+        print("\n3. Testing latin-1 fallback...")
+        result = convert_csv_to_parquet(io.BytesIO(b"city\nZ\xfcrich\n"), test_parquet)
+        assert pq.read_table(test_parquet).column('city').to_pylist() == ['Zürich']
+        print("✓ Non UTF-8 file decoded as latin-1")
+
+        # 4. Error handling
+        print("\n4. Testing invalid files...")
+        for contents, error in [(b"", EmptyCSVError), (b"a,b\n1,2,3\n", CSVParseError)]:
+            try:
+                convert_csv_to_parquet(io.BytesIO(contents), test_parquet)
+                raise AssertionError("Expected conversion to fail")
+            except error:
+                pass
+            assert not test_parquet.exists()
+        print("✓ Invalid files rejected and partial output removed")
+
+        # 5. Preview artifact
+        print("\n5. Writing a preview...")
+        convert_csv_to_parquet(
+            io.BytesIO(csv_bytes), test_parquet, block_size=4096,
+            preview_path=preview_path_for(test_parquet), head_rows=5, sample_rows=50
+        )
+        preview = read_preview(preview_path_for(test_parquet))
+        assert [row['id'] for row in preview['head']] == [0, 1, 2, 3, 4]
+        assert len(preview['sample']) == 50
+        assert len({row['id'] for row in preview['sample']}) == 50
+        print("✓ Head and sample stored")
+
+        # 6. Sampled schema with dtype overrides, on both engines
+        print("\n6. Testing dtype overrides...")
+        typed_csv = b"id,city,score\n" + b"".join(
+            f"{i},{['Paris', 'Berlin'][i % 2]},{i}\n".encode() for i in range(rows)
+        ) + b"9,M\xe9rida,1\n"
+        for engine in ["pyarrow", "duckdb"]:
+            typed_path = test_parquet.with_name(f"test_ingest_{engine}.csv")
+            typed_path.write_bytes(typed_csv)
+            try:
+                with open(typed_path, "rb") as source:
+                    convert_csv_to_parquet(
+                        source, test_parquet, block_size=4096, engine=engine,
+                        dtypes={"score": "float32"}, sample_bytes=1024
+                    )
+            finally:
+                typed_path.unlink()
+            table = pq.read_table(test_parquet)
+            assert str(table.schema.field('score').type) == 'float'
+            assert pa.types.is_dictionary(table.schema.field('city').type)
+            assert table.column('city').to_pylist()[-1] == 'Mérida'
+            print(f"✓ {engine}: overrides applied, strings dictionary-encoded")
+
+        # 7. Parquet writer profile
+        print("\n7. Writing with a Parquet profile...")
+        settings = resolve_profile("compact", {"row_group_rows": 2000, "sort_by": ["-id"]})
+        convert_csv_to_parquet(
+            io.BytesIO(csv_bytes), test_parquet, block_size=4096, parquet_settings=settings
+        )
+        metadata = pq.ParquetFile(test_parquet).metadata
+        assert [metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)] == [2000, 2000, 1000]
+        first = metadata.row_group(0)
+        assert first.column(0).compression == 'ZSTD'
+        assert first.sorting_columns[0].descending
+        assert pq.read_table(test_parquet).column('id')[0].as_py() == 1999
+        print("✓ Row groups sized, sorted and zstd-compressed")
+
+        # 8. Partitioned dataset
+        print("\n8. Writing a partitioned dataset...")
+        dataset_path = test_parquet.with_name("test_ingest_dataset.parquet")
+        try:
+            partitioned_csv = b"id,city\n" + b"".join(
+                f"{i},{['Paris', 'New York'][i % 2]}\n".encode() for i in range(rows)
+            )
+            result = convert_csv_to_parquet(
+                io.BytesIO(partitioned_csv), dataset_path, block_size=4096,
+                layout={"partition_by": "city", "file_bytes": 16 * 1024}
+            )
+            assert result['schema']['columns'] == ['id', 'city']
+            assert len(list((dataset_path / "city=New%20York").glob("*.parquet"))) > 1
+            conn = duckdb.connect()
+            assert list(describe_parquet(conn, dataset_path)) == ['id', 'city']
+            sql, params, _ = build_rows_query(
+                dataset_path, describe_parquet(conn, dataset_path),
+                filters=["city:eq:New York"], limit=rows
+            )
+            assert len(conn.execute(sql, params).fetchall()) == rows // 2
+            conn.close()
+            print("✓ Partitions written and read back with Hive partitioning")
+        finally:
+            remove_parquet(dataset_path)
+
+        # 9. A type that changes after the first block
+        print("\n9. Widening a column after the first block...")
+        changing_csv = b"id,amount,code\n" + b"".join(
+            f"{i},{i},{i}\n".encode() for i in range(rows)
+        ) + b"5000,1.5,2.5\n5001,2,unknown\n"
+        result = convert_csv_to_parquet(
+            io.BytesIO(changing_csv), test_parquet, block_size=4096, sample_bytes=1024
+        )
+        assert result['row_count'] == rows + 2
+        assert result['schema']['dtypes'] == {'id': 'int64', 'amount': 'double', 'code': 'string'}
+        table = pq.read_table(test_parquet)
+        assert table.column('amount').to_pylist()[-2:] == [1.5, 2.0]
+        assert table.column('code').to_pylist()[-3:] == ['4999', '2.5', 'unknown']
+        stats = {column['name']: column for column in result['column_stats']}
+        assert stats['amount']['dtype'] == 'double' and stats['amount']['max'] == 4999.0
+        assert stats['code']['dtype'] == 'string' and stats['code']['max'] == 'unknown'
+        assert stats['code']['null_count'] == 0
+        try:
+            convert_csv_to_parquet(
+                io.BytesIO(changing_csv), test_parquet, block_size=4096,
+                sample_bytes=1024, dtypes={"amount": "int64"}
+            )
+            raise AssertionError("Expected conversion to fail")
+        except CSVParseError:
+            pass
+        assert not test_parquet.exists()
+        print("✓ Inferred types widened, overrides still enforced")
+
+        # 10. A type that changes after the default sample, on both engines
+        print("\n10. Widening a column after the sample...")
+        large_rows = 200_000
+        large_csv = b"id,amount\n" + b"".join(
+            f"{i},{i}\n".encode() for i in range(large_rows)
+        ) + b"200000,1.5\n"
+        assert len(large_csv) > DEFAULT_SAMPLE_BYTES
+        for engine in ["pyarrow", "duckdb"]:
+            large_path = test_parquet.with_name(f"test_ingest_{engine}.csv")
+            large_path.write_bytes(large_csv)
+            try:
+                with open(large_path, "rb") as source:
+                    result = convert_csv_to_parquet(source, test_parquet, block_size=256 * 1024, engine=engine)
+            finally:
+                large_path.unlink()
+            assert result['row_count'] == large_rows + 1
+            assert result['schema']['dtypes']['amount'] == 'double'
+            assert pq.read_table(test_parquet).column('amount')[-1].as_py() == 1.5
+            print(f"✓ {engine}: sampled int64 read as double")
+
+        # 11. Invalid UTF-8 that the sample missed, on both engines
+        print("\n11. Reading a stray latin-1 byte...")
+        mixed_csv = b"id,city\n" + b"".join(
+            f"{i},{['Zürich', 'Köln'][i % 2]}\n".encode() for i in range(rows)
+        )
+        middle = mixed_csv.index(b"\n", len(mixed_csv) // 2) + 1
+        mixed_csv = mixed_csv[:middle] + b"9,M\xe9rida\n" + mixed_csv[middle:]
+        for engine in ["pyarrow", "duckdb"]:
+            mixed_path = test_parquet.with_name(f"test_ingest_{engine}.csv")
+            mixed_path.write_bytes(mixed_csv)
+            try:
+                with open(mixed_path, "rb") as source:
+                    counting = _CountingReader(source)
+                    result = convert_csv_to_parquet(
+                        counting, test_parquet, block_size=4096, engine=engine, sample_bytes=1024
+                    )
+            finally:
+                mixed_path.unlink()
+            if engine == "pyarrow":
+                # Parsed once: only the sampled head and tail are read again
+                assert counting.bytes_read < len(mixed_csv) + 4 * 1024
+            assert result['row_count'] == rows + 1
+            cities = pq.read_table(test_parquet).column('city').to_pylist()
+            assert cities[:2] == ['Zürich', 'Köln'] and cities[-1] == 'Köln'
+            assert 'Mérida' in cities
+            print(f"✓ {engine}: stray byte read as latin-1, the rest as UTF-8")
+
+        # 12. Widening a partitioned dataset, partition column included
+        print("\n12. Widening a partitioned dataset...")
+        dataset_path = test_parquet.with_name("test_ingest_dataset.parquet")
+        try:
+            widening_csv = b"id,year,amount\n" + b"".join(
+                f"{i},{2000 + i % 3},{i}\n".encode() for i in range(rows)
+            ) + b"5000,unknown,1.5\n"
+            result = convert_csv_to_parquet(
+                io.BytesIO(widening_csv), dataset_path, block_size=4096, sample_bytes=1024,
+                layout={"partition_by": "year", "file_bytes": 8 * 1024}
+            )
+            assert result['schema']['dtypes'] == {'id': 'int64', 'year': 'string', 'amount': 'double'}
+            stats = {column['name']: column for column in result['column_stats']}
+            assert stats['year']['max'] == 'unknown' and stats['year']['distinct_count'] == 4
+            conn = duckdb.connect()
+            sql, params, _ = build_rows_query(
+                dataset_path, describe_parquet(conn, dataset_path), filters=["year:eq:2001"], limit=rows
+            )
+            assert len(conn.execute(sql, params).fetchall()) == (rows + 1) // 3
+            assert conn.execute(
+                f"SELECT sum(amount) FROM read_parquet('{dataset_path}/**/*.parquet')"
+            ).fetchone()[0] == sum(range(rows)) + 1.5
+            conn.close()
+            print("✓ Files written before the widening rewritten")
+        finally:
+            remove_parquet(dataset_path)
+
+        # 13. Many partitions with large row groups
+        print("\n13. Bounding memory across partitions...")
+        dataset_path = test_parquet.with_name("test_ingest_dataset.parquet")
+        try:
+            schema = pa.schema([("id", pa.int64()), ("key", pa.string())])
+            settings = resolve_profile("compact", {"row_group_rows": 1000})
+            writer = DatasetWriter(dataset_path, schema, settings, "key", max_open_files=8)
+            with writer:
+                for start in range(0, rows, 500):
+                    ids = list(range(start, start + 500))
+                    writer.write_batch(pa.record_batch(
+                        [pa.array(ids), pa.array([f"k{i % 50}" for i in ids])], schema=schema
+                    ))
+                    assert len(writer._open) <= 8
+                    assert sum(state[0].pending_rows for state in writer._open.values()) <= 1000
+            table = duckdb.connect().execute(
+                f"SELECT count(*), count(DISTINCT id), count(DISTINCT key) "
+                f"FROM read_parquet('{dataset_path}/**/*.parquet', hive_partitioning = true)"
+            ).fetchone()
+            assert table == (rows, rows, 50)
+            print("✓ Open files and buffered rows capped, every row written")
+        finally:
+            remove_parquet(dataset_path)
+
+        print("\n" + "="*50)
+        print("All tests passed! ✓")
+        print("="*50)
+
+    finally:
+        test_parquet.unlink(missing_ok=True)
+        preview_path_for(test_parquet).unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    test_streaming_conversion()
@@ -0,0 +1,66 @@
+"""
+Test script for the metadata schema migrations.
+Migrates a new DuckDB database, and one created before migrations existed.
+"""
+
+import duckdb
+from datetime import datetime
+from migrations import MIGRATIONS, applied_migrations, apply_migrations
+
+def test_migrations():
+    """Test applying, re-applying and adopting migrations."""
+
+    print("\n" + "="*50)
+    print("Testing schema migrations")
+    print("="*50)
+
+    # 1. A new database gets every migration, in order
+    print("\n1. Migrating a new database...")
+    conn = duckdb.connect()
+    applied = apply_migrations(conn)
+    assert applied == [name for _, name, _ in MIGRATIONS]
+    assert applied_migrations(conn) == [version for version, _, _ in MIGRATIONS]
+    tables = {row[0] for row in conn.execute("SELECT table_name FROM information_schema.tables").fetchall()}
+    assert {"uploads", "upload_blobs", "upload_sessions", "user_upload_stats", "global_upload_stats"} <= tables
+    print(f"✓ Applied {len(applied)} migrations")
+
+    # 2. Applying again does nothing
+    print("\n2. Migrating again...")
+    assert apply_migrations(conn) == []
+    conn.close()
+    print("✓ Nothing to apply")
+
+    # 3. A database from before migrations keeps its rows and gains the rest
+    print("\n3. Adopting an existing database...")
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE uploads (
+            upload_id VARCHAR PRIMARY KEY,
+            user_id VARCHAR NOT NULL,
+            filename VARCHAR NOT NULL,
+            uploaded_at TIMESTAMP NOT NULL,
+            parquet_path VARCHAR NOT NULL,
+            row_count INTEGER,
+            column_count INTEGER,
+            schema_json JSON
+        )
+    """)
+    conn.execute("""
+        INSERT INTO uploads VALUES ('u1', 'alice', 'a.csv', ?, 'data/uploads/alice/u1.parquet', 10, 1, '{"columns": ["x"]}')
+    """, [datetime(2024, 1, 1)])
+    assert len(apply_migrations(conn)) == len(MIGRATIONS)
+    row = conn.execute("SELECT filename, content_hash, deleted_at FROM uploads").fetchone()
+    assert row == ("a.csv", None, None)
+    stats = conn.execute("""
+        SELECT total_uploads, total_rows, listing_version FROM user_upload_stats WHERE user_id = 'alice'
+    """).fetchone()
+    assert stats == (1, 10, 0)
+    conn.close()
+    print("✓ Existing uploads kept and summarized")
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_migrations()
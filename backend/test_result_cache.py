@@ -0,0 +1,65 @@
+"""
+Test script for the query result cache.
+Fills the memory tier past its budget and checks spilling, disk hits and invalidation.
+"""
+
+import os
+import tempfile
+import pyarrow as pa
+from result_cache import ResultCache, result_key
+
+def test_result_cache():
+    """Test the memory and disk tiers of ResultCache."""
+
+    print("\n" + "="*50)
+    print("Testing result cache")
+    print("="*50)
+
+    spill_root = tempfile.mkdtemp()
+    table = pa.table({'x': pa.array(range(100), pa.int64())})
+    cache = ResultCache(max_bytes=2 * table.nbytes, spill_root=spill_root, spill_max_bytes=1024 * 1024)
+    keys = [result_key("rows", f"upload{i}", "SELECT *") for i in range(4)]
+
+    # 1. Overflowing memory spills the oldest entries to disk
+    print("\n1. Caching four results in room for two...")
+    for i, key in enumerate(keys):
+        cache.put(key, table, tags=[f"upload{i}"], info={'i': i})
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['disk_entries'] == 2 and stats['spills'] == 2
+    print("✓ Two in memory, two spilled")
+
+    # 2. A spilled result is read back with its info and returns to memory
+    print("\n2. Reading a spilled result...")
+    result, info = cache.get(keys[0])
+    assert result.equals(table) and info == {'i': 0}
+    assert cache.stats()['disk_hits'] == 1 and keys[0] in cache._memory
+    assert cache.get(result_key("rows", "other", "SELECT *")) is None
+    print("✓ Disk hit promoted back to memory")
+
+    # 3. Invalidation drops a tag from both tiers and removes its files
+    print("\n3. Invalidating...")
+    cache.invalidate("upload0", "upload1", "upload2", "upload3")
+    stats = cache.stats()
+    assert stats['entries'] == 0 and stats['disk_entries'] == 0 and stats['invalidations'] == 4
+    assert not any(files for _, _, files in os.walk(spill_root))
+    print("✓ Nothing left in memory or on disk")
+
+    # 4. A result computed across an invalidation is not cached
+    print("\n4. Putting a result computed before an invalidation...")
+    token = cache.token()
+    cache.invalidate("upload0")
+    cache.put(keys[0], table, tags=["upload0"], token=token)
+    assert cache.get(keys[0]) is None
+    cache.put(keys[0], table, tags=["upload0"], token=cache.token())
+    assert cache.get(keys[0]) is not None
+    print("✓ Stale result dropped, fresh one kept")
+
+    cache.close()
+    assert os.listdir(spill_root) == []
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_result_cache()
@@ -0,0 +1,131 @@
+"""
+Test script for coalesced session refreshes.
+Runs concurrent callers against a stubbed refresh that counts its calls.
+"""
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+# dependencies builds the WorkOS client on import; the refresh is stubbed
+os.environ.setdefault("WORKOS_API_KEY", "sk_test")
+os.environ.setdefault("WORKOS_CLIENT_ID", "client_test")
+
+import dependencies
+from sessions import SingleFlight, session_key
+
+CALLERS = 8
+
+def _wait_for_waiters(flight, waiters):
+    """Block the leader until the other callers are waiting on it."""
+    deadline = time.monotonic() + 10
+    while flight.stats()["coalesced"] < waiters:
+        assert time.monotonic() < deadline, "Callers never coalesced"
+        time.sleep(0.01)
+
+def _run_concurrently(call):
+    """Run call() from CALLERS threads; return their results or exceptions."""
+    outcomes = [None] * CALLERS
+
+    def run(i):
+        try:
+            outcomes[i] = call()
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return outcomes
+
+def test_single_flight():
+    """Test that concurrent refreshes of one session run once."""
+
+    print("\n" + "="*50)
+    print("Testing coalesced session refreshes")
+    print("="*50)
+
+    # 1. Concurrent calls share one execution
+    print("\n1. Coalescing concurrent calls...")
+    flight = SingleFlight()
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        _wait_for_waiters(flight, CALLERS - 1)
+        return "user"
+
+    outcomes = _run_concurrently(lambda: flight.do("cookie", refresh))
+    assert outcomes == ["user"] * CALLERS
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": CALLERS - 1}
+    print(f"✓ {CALLERS} callers, 1 execution")
+
+    # 2. An error reaches every waiter
+    print("\n2. Sharing an error...")
+    flight = SingleFlight()
+    calls = []
+    error = RuntimeError("refresh failed")
+
+    def failing_refresh():
+        calls.append(1)
+        _wait_for_waiters(flight, CALLERS - 1)
+        raise error
+
+    outcomes = _run_concurrently(lambda: flight.do("cookie", failing_refresh))
+    assert all(outcome is error for outcome in outcomes)
+    assert len(calls) == 1
+    print("✓ Every caller got the error")
+
+    # 3. The next call after a flight lands runs again
+    print("\n3. Calling again...")
+    assert flight.do("cookie", lambda: "fresh") == "fresh"
+    assert flight.stats()["executions"] == 2
+    print("✓ Finished flights are not reused")
+
+    # 4. refresh_session coalesces requests carrying the same cookie
+    print("\n4. Refreshing one session from concurrent requests...")
+    refreshes = []
+    user = SimpleNamespace(id="user_1")
+    before = dependencies.refresh_flight.stats()["coalesced"]
+
+    class StubSession:
+        def refresh(self):
+            refreshes.append(1)
+            _wait_for_waiters(dependencies.refresh_flight, before + CALLERS - 1)
+            return SimpleNamespace(authenticated=True, user=user, sealed_session="new-cookie")
+
+    requests = [
+        SimpleNamespace(cookies={"wos_session": "expired-cookie"}, state=SimpleNamespace())
+        for _ in range(CALLERS)
+    ]
+    original = dependencies.load_session
+    dependencies.load_session = lambda request: StubSession()
+    try:
+        pending = iter(requests)
+        lock = threading.Lock()
+
+        def refresh_next():
+            with lock:
+                request = next(pending)
+            return dependencies.refresh_session(request)
+
+        outcomes = _run_concurrently(refresh_next)
+    finally:
+        dependencies.load_session = original
+        dependencies.session_cache.invalidate(session_key("expired-cookie"))
+
+    assert outcomes == [(user, "new-cookie")] * CALLERS
+    assert len(refreshes) == 1
+    assert all(request.state.user is user for request in requests)
+    print(f"✓ {CALLERS} requests, 1 refresh")
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_single_flight()
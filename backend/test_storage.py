@@ -0,0 +1,68 @@
+"""
+Test script for the upload storage backends.
+Resolves stored paths and URIs and manages files through LocalStorage.
+"""
+
+import tempfile
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from storage import BASE_DIR, LocalStorage, S3Storage
+
+def test_storage():
+    """Test URIs, directory caching and file removal."""
+
+    print("\n" + "="*50)
+    print("Testing upload storage")
+    print("="*50)
+
+    root = Path(tempfile.mkdtemp())
+    storage = LocalStorage(root, max_workers=2)
+
+    # 1. URIs, and paths stored before them, resolve to local files
+    print("\n1. Resolving locations...")
+    uri = storage.uri("user1", "a b.parquet")
+    assert uri.startswith("file://") and storage.resolve(uri) == root / "user1" / "a b.parquet"
+    assert storage.resolve("data/uploads/u/x.parquet") == BASE_DIR / "data/uploads/u/x.parquet"
+    assert storage.locate(uri) == (None, root / "user1" / "a b.parquet")
+    print("✓ file:// URIs and legacy relative paths")
+
+    # 2. Directories are created once, then remembered
+    print("\n2. Ensuring directories...")
+    storage.ensure_directory(storage.uri("user1"))
+    storage.ensure_directory(storage.uri("user1"))
+    stats = storage.stats()
+    assert (root / "user1").is_dir() and stats['directory_creates'] == 1 and stats['directory_hits'] == 1
+    print("✓ Second ensure is a cache hit")
+
+    # 3. Files and dataset directories are removed with their preview
+    print("\n3. Removing uploads...")
+    pq.write_table(pa.table({'x': [1, 2]}), storage.resolve(uri))
+    dataset = storage.uri("user1", "d.parquet")
+    (root / "user1" / "d.parquet" / "k=1").mkdir(parents=True)
+    (root / "user1" / "d.preview.arrow").write_bytes(b"x")
+    assert storage.size(uri) > 0 and len(storage.listdir(storage.uri("user1"))) == 3
+    storage.remove_upload(uri)
+    storage.remove_upload(dataset)
+    storage.remove_upload(dataset)
+    assert storage.listdir(storage.uri("user1")) == [] and not storage.exists(uri)
+    print("✓ Files, directories and previews removed")
+
+    # 4. S3 URIs map to keys in the bucket
+    print("\n4. Resolving S3 locations...")
+    s3 = S3Storage("s3://bucket/prefix/", endpoint_url="http://localhost:9000", region="us-east-1")
+    assert s3.uri("user1", "a.parquet") == "s3://bucket/prefix/user1/a.parquet"
+    assert s3.locate(s3.uri("user1", "a.parquet"))[1] == "bucket/prefix/user1/a.parquet"
+    assert s3.locate(root / "spool.csv") == (None, root / "spool.csv")
+    assert s3.user_root("user1") == "s3://bucket/prefix/user1/" and not s3.supports_rename
+    print("✓ Keys under the prefix; local paths stay local")
+
+    storage.close()
+    s3.close()
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_storage()
@@ -0,0 +1,69 @@
+"""
+Test script for data queries over Parquet files.
+Builds row queries with projection, filters and sorting and runs them in DuckDB.
+"""
+
+from pathlib import Path
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from upload_queries import build_rows_query, describe_parquet, QueryError
+
+def test_rows_query():
+    """Test query building against a small Parquet file."""
+
+    print("\n" + "="*50)
+    print("Testing row queries over Parquet")
+    print("="*50)
+
+    test_parquet = Path(__file__).parent / "test_rows.parquet"
+    pq.write_table(pa.table({
+        'id': [1, 2, 3, 4, 5],
+        'city': ['Paris', 'Berlin', None, 'Paris', 'Rome'],
+        'price': [10.0, 20.5, 30.0, 40.25, 50.0],
+    }), test_parquet)
+
+    conn = duckdb.connect()
+    try:
+        column_types = describe_parquet(conn, test_parquet)
+        assert column_types == {'id': 'BIGINT', 'city': 'VARCHAR', 'price': 'DOUBLE'}
+        print("✓ Schema read from footer")
+
+        # 1. Projection, filters and sorting
+        sql, params, selected = build_rows_query(
+            test_parquet,
+            column_types,
+            columns=['id', 'price'],
+            filters=['city:eq:Paris', 'price:gt:15'],
+            sort=['-id'],
+            limit=10
+        )
+        assert selected == ['id', 'price']
+        assert str(test_parquet) not in sql
+        assert conn.execute(sql, params).fetchall() == [(4, 40.25)]
+        print("✓ Filtered, projected and sorted query")
+
+        # 2. Null checks and paging
+        sql, params, _ = build_rows_query(test_parquet, column_types, filters=['city:notnull'], sort=['id'], limit=2, offset=1)
+        assert [row[0] for row in conn.execute(sql, params).fetchall()] == [2, 4]
+        print("✓ Null filter with limit/offset")
+
+        # 3. Quoted identifiers and invalid input
+        for kwargs in [{'columns': ['id" FROM x; --']}, {'filters': ['id:like:1']}, {'sort': ['-nope']}]:
+            try:
+                build_rows_query(test_parquet, column_types, **kwargs)
+                raise AssertionError("Expected QueryError")
+            except QueryError:
+                pass
+        print("✓ Invalid columns, operators and sort keys rejected")
+
+        print("\n" + "="*50)
+        print("All tests passed! ✓")
+        print("="*50)
+
+    finally:
+        conn.close()
+        test_parquet.unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    test_rows_query()
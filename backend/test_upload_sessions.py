@@ -0,0 +1,163 @@
+"""
+Test script for resumable upload sessions.
+Drives a session through the chunk protocol against a scratch metadata database.
+"""
+
+import base64
+import hashlib
+import os
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+import duckdb
+import database
+from migrations import apply_migrations
+from upload_sessions import (
+    ChunkError,
+    claim_for_commit,
+    collect_stale_sessions,
+    create_session,
+    delete_session,
+    get_session,
+    reopen_session,
+    spool_path_for,
+    verify_checksum,
+    write_chunk,
+)
+
+CHUNK_SIZE = 4
+
+def _expect_chunk_error(status_code, call, *args):
+    """Run call(*args) and check it fails with a ChunkError of status_code."""
+    try:
+        call(*args)
+    except ChunkError as e:
+        assert e.status_code == status_code, f"Expected {status_code}, got {e.status_code}: {e}"
+        return e
+    raise AssertionError(f"Expected a {status_code} ChunkError")
+
+def test_upload_sessions():
+    """Test offsets, chunk sizes, checksums, commits and cleanup of upload sessions."""
+
+    print("\n" + "="*50)
+    print("Testing resumable upload sessions")
+    print("="*50)
+
+    db_path = Path(tempfile.mkdtemp()) / "sessions.db"
+    conn = duckdb.connect(str(db_path))
+    apply_migrations(conn)
+    conn.close()
+    previous = database._manager
+    database._manager = database.ConnectionManager(db_path)
+    contents = b"id\n1\n2\n3\n"
+
+    try:
+        session = create_session("test-user", "data.csv", len(contents))
+        session_id = session["session_id"]
+        assert session["committed_bytes"] == 0 and session["status"] == "open"
+
+        # 1. Chunks must arrive at the committed offset
+        print("\n1. Sending a chunk at the wrong offset...")
+        _expect_chunk_error(409, write_chunk, session_id, 4, contents[4:8], CHUNK_SIZE)
+        assert write_chunk(session_id, 0, contents[0:4], CHUNK_SIZE) == 4
+        _expect_chunk_error(409, write_chunk, session_id, 0, contents[0:4], CHUNK_SIZE)
+        print("✓ 409 for an offset other than the committed one")
+
+        # 2. Chunks must be the session's chunk size (the last one the rest)
+        print("\n2. Sending a chunk of the wrong size...")
+        _expect_chunk_error(400, write_chunk, session_id, 4, contents[4:7], CHUNK_SIZE)
+        _expect_chunk_error(400, write_chunk, session_id, 4, contents[4:9], CHUNK_SIZE)
+        assert get_session(session_id, "test-user")["committed_bytes"] == 4
+        print("✓ 400 for a short or long chunk")
+
+        # 3. Checksums
+        print("\n3. Checking chunk checksums...")
+        chunk = contents[4:8]
+        verify_checksum("sha256 " + base64.b64encode(hashlib.sha256(chunk).digest()).decode(), chunk)
+        wrong = base64.b64encode(hashlib.sha256(b"other").digest()).decode()
+        _expect_chunk_error(460, verify_checksum, f"sha256 {wrong}", chunk)
+        _expect_chunk_error(400, verify_checksum, f"crc32 {wrong}", chunk)
+        _expect_chunk_error(400, verify_checksum, "sha256 not-base64!", chunk)
+        print("✓ 460 for a mismatch, 400 for a malformed header")
+
+        # 4. A chunk cut off before it committed is resent at the same
+        # offset; one whose response was lost, at the new offset
+        print("\n4. Resending after a dropped connection...")
+        with open(spool_path_for(session_id), "r+b") as spool:
+            spool.seek(4)
+            spool.write(b"\n9")
+        assert write_chunk(session_id, 4, chunk, CHUNK_SIZE) == 8
+        assert spool_path_for(session_id).read_bytes() == contents[:8]
+        # The client never saw the 8; it asks for the offset, then resumes
+        offset = get_session(session_id, "test-user")["committed_bytes"]
+        assert offset == 8
+        _expect_chunk_error(409, write_chunk, session_id, 4, chunk, CHUNK_SIZE)
+        print("✓ Uncommitted chunk overwritten; committed one rejected with 409")
+
+        # 5. An incomplete session can't be committed
+        print("\n5. Committing an incomplete session...")
+        assert not claim_for_commit(session_id, "test-user")
+        assert get_session(session_id, "test-user")["status"] == "open"
+        assert write_chunk(session_id, offset, contents[offset:], CHUNK_SIZE) == len(contents)
+        assert spool_path_for(session_id).read_bytes() == contents
+        print("✓ Commit refused until every byte arrived")
+
+        # 6. A failed commit reopens the session for a retry
+        print("\n6. Reopening after a failed commit...")
+        assert not claim_for_commit(session_id, "other-user")
+        assert claim_for_commit(session_id, "test-user")
+        assert not claim_for_commit(session_id, "test-user")
+        _expect_chunk_error(409, write_chunk, session_id, len(contents), b"", CHUNK_SIZE)
+        reopen_session(session_id)
+        assert get_session(session_id, "test-user")["status"] == "open"
+        assert claim_for_commit(session_id, "test-user")
+        delete_session(session_id)
+        assert get_session(session_id, "test-user") is None
+        assert not spool_path_for(session_id).exists()
+        _expect_chunk_error(404, write_chunk, session_id, 0, contents[0:4], CHUNK_SIZE)
+        print("✓ Claimed once, reopened, claimed again")
+
+        # 7. Sessions that stop receiving chunks are removed
+        print("\n7. Removing stale sessions...")
+        stale = create_session("test-user", "stale.csv", 100)["session_id"]
+        active = create_session("test-user", "active.csv", 100)["session_id"]
+        with database.get_connection_manager().write() as conn:
+            conn.execute(
+                "UPDATE upload_sessions SET updated_at = ? WHERE session_id = ?",
+                [datetime.now() - timedelta(hours=2), stale]
+            )
+        assert collect_stale_sessions(3600) == 1
+        assert get_session(stale, "test-user") is None
+        assert not spool_path_for(stale).exists()
+        assert get_session(active, "test-user") is not None
+        delete_session(active)
+        print("✓ Stale session and spool file removed, active one kept")
+
+        # 8. Spool files of sessions another node expired are swept
+        print("\n8. Sweeping orphaned spool files...")
+        old = (datetime.now() - timedelta(hours=2)).timestamp()
+        orphan = spool_path_for("expired-elsewhere")
+        orphan.touch()
+        os.utime(orphan, (old, old))
+        fresh = spool_path_for("being-created")
+        fresh.touch()
+        idle = create_session("test-user", "idle.csv", 100)["session_id"]
+        os.utime(spool_path_for(idle), (old, old))
+        assert collect_stale_sessions(3600) == 0
+        assert not orphan.exists()
+        assert fresh.exists() and spool_path_for(idle).exists()
+        delete_session(idle)
+        fresh.unlink()
+        print("✓ Old file without a session removed; new and live files kept")
+
+        print("\n" + "="*50)
+        print("All tests passed! ✓")
+        print("="*50)
+
+    finally:
+        database._manager.close()
+        database._manager = previous
+        db_path.unlink(missing_ok=True)
+
+if __name__ == "__main__":
+    test_upload_sessions()
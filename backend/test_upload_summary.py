@@ -0,0 +1,96 @@
+"""
+Test script for the materialized upload statistics.
+Applies uploads and deletes incrementally and checks them against a full rebuild.
+"""
+
+import duckdb
+from datetime import datetime, timedelta
+from upload_summary import add_listing_versions, create_summary_tables, read_summary, rebuild_summaries, record_deletes, record_uploads
+
+def test_upload_summary():
+    """Test that incremental maintenance matches rebuild_summaries."""
+
+    print("\n" + "="*50)
+    print("Testing upload summary tables")
+    print("="*50)
+
+    conn = duckdb.connect()
+    conn.execute("""
+        CREATE TABLE uploads (
+            upload_id VARCHAR PRIMARY KEY,
+            user_id VARCHAR NOT NULL,
+            uploaded_at TIMESTAMP NOT NULL,
+            row_count INTEGER,
+            deleted_at TIMESTAMP
+        )
+    """)
+    create_summary_tables(conn)
+    add_listing_versions(conn)
+    start = datetime(2024, 1, 1)
+
+    def upload(upload_id, user_id, day, rows):
+        conn.execute("INSERT INTO uploads VALUES (?, ?, ?, ?, NULL)", [upload_id, user_id, start + timedelta(days=day), rows])
+        record_uploads(conn, user_id, [(rows, start + timedelta(days=day))])
+
+    def delete(upload_id):
+        user_id, uploaded_at, rows = conn.execute(
+            "UPDATE uploads SET deleted_at = now() WHERE upload_id = ? RETURNING user_id, uploaded_at, row_count",
+            [upload_id]
+        ).fetchone()
+        record_deletes(conn, user_id, [(rows, uploaded_at)])
+
+    # 1. Uploads add to the running totals
+    print("\n1. Recording uploads...")
+    upload("a1", "alice", 1, 10)
+    upload("a2", "alice", 2, 20)
+    upload("a3", "alice", 3, 30)
+    upload("b1", "bob", 0, 5)
+    stats = read_summary(conn, "alice")
+    assert stats['total_uploads'] == 3 and stats['total_rows'] == 60 and stats['avg_rows_per_file'] == 20
+    assert read_summary(conn)['first_upload'] == start
+    print("✓ Per-user and global totals")
+
+    # 2. Deleting an extreme recomputes it; deleting the middle doesn't need to
+    print("\n2. Recording deletes...")
+    delete("a2")
+    delete("a3")
+    delete("b1")
+    stats = read_summary(conn, "alice")
+    assert stats['total_uploads'] == 1 and stats['last_upload'] == start + timedelta(days=1)
+    assert read_summary(conn)['first_upload'] == start + timedelta(days=1)
+    delete("a1")
+    assert read_summary(conn, "alice")['first_upload'] is None
+    assert read_summary(conn, "nobody")['total_uploads'] == 0
+    print("✓ Extremes follow deletes")
+
+    # 3. Incremental state matches a rebuild; drift is reported
+    print("\n3. Rebuilding...")
+    upload("c1", "carol", 4, 7)
+    assert rebuild_summaries(conn)['drifted'] == 0
+    conn.execute("UPDATE user_upload_stats SET total_rows = 0 WHERE user_id = 'carol'")
+    result = rebuild_summaries(conn)
+    assert result == {'users': 1, 'drifted': 1}
+    assert read_summary(conn, "carol")['total_rows'] == 7
+    print("✓ Rebuild matches and repairs drift")
+
+    # 4. Every change bumps the user's listing version, rebuilds included
+    print("\n4. Checking listing versions...")
+    def listing_version(user_id):
+        return conn.execute("SELECT listing_version FROM user_upload_stats WHERE user_id = ?", [user_id]).fetchone()[0]
+    before = listing_version("alice")
+    upload("a4", "alice", 5, 1)
+    assert listing_version("alice") == before + 1
+    delete("a4")
+    assert listing_version("alice") == before + 2
+    rebuild_summaries(conn)
+    assert listing_version("alice") == before + 3
+    print("✓ Versions only go up")
+
+    conn.close()
+
+    print("\n" + "="*50)
+    print("All tests passed! ✓")
+    print("="*50)
+
+if __name__ == "__main__":
+    test_upload_summary()
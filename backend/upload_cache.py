@@ -0,0 +1,230 @@
+"""
+Per-user upload versions and cached upload responses.
+Every write to a user's uploads bumps their listing_version in
+user_upload_stats, in the same transaction (see upload_summary). The
+version drives the listing's ETag and keys its cached response bodies, so
+a client polling an unchanged list gets a 304 (or a cached body) without
+a listing query, from whichever worker answers. Serialized previews and
+query results are cached here too (see previews.PreviewCache and
+result_cache.ResultCache).
+
+Each worker keeps the versions it has read, with the bodies. When the
+metadata is shared by several workers (PostgreSQL), each write also
+notifies the others, which drop what they cached for the same user and
+uploads (publish_upload_changes() and listen_for_upload_changes()), and
+everything they cached whenever they may have missed a notification.
+"""
+
+import hashlib
+import json
+import threading
+import uuid
+from collections import OrderedDict
+
+from config import (
+    UPLOAD_LISTING_CACHE_SIZE,
+    PREVIEW_CACHE_BYTES,
+    RESULT_CACHE_BYTES,
+    RESULT_CACHE_DISK_BYTES,
+)
+from database import RESULT_CACHE_DIR, get_connection_manager
+from previews import PreviewCache
+from result_cache import ResultCache
+
+# Tells this worker's notifications apart from others'
+_BOOT_ID = uuid.uuid4().hex[:8]
+
+# Notification channel carrying upload changes between workers
+UPLOAD_CHANGES_CHANNEL = "upload_changes"
+# Upload ids per notification; PostgreSQL payloads are limited to 8000 bytes
+_IDS_PER_NOTIFICATION = 100
+
+
+class UploadListingCache:
+    """
+    Listing versions read from the metadata plus an LRU of serialized
+    listing responses.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._versions = {}
+        # Bumped by every invalidation, so a version read from the
+        # metadata before one isn't kept after it
+        self._generation = 0
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.version_reads = 0
+
+    def cached_version(self, user_id: str):
+        """
+        Return (version, generation): the user's version, or None if it
+        must be read from the metadata and then passed to
+        remember_version() with the generation.
+        """
+        with self._lock:
+            return self._versions.get(user_id), self._generation
+
+    def remember_version(self, user_id: str, version: int, generation: int):
+        """Keep a version read from the metadata, unless invalidated since."""
+        with self._lock:
+            self.version_reads += 1
+            if generation == self._generation:
+                self._versions[user_id] = version
+
+    def invalidate(self, user_id: str):
+        """
+        Record that the user's uploads changed.
+        Call after the write has committed.
+        """
+        with self._lock:
+            self._generation += 1
+            self._versions.pop(user_id, None)
+            for key in [k for k in self._bodies if k[0] == user_id]:
+                del self._bodies[key]
+
+    def clear(self):
+        """Forget every version and body, e.g. after missing notifications."""
+        with self._lock:
+            self._generation += 1
+            self._versions.clear()
+            self._bodies.clear()
+
+    def etag(self, user_id: str, query_key: str, version: int) -> str:
+        """Strong ETag for a listing query at the given version."""
+        digest = hashlib.sha1(query_key.encode()).hexdigest()[:16]
+        return f'"{version}-{digest}"'
+
+    def record_not_modified(self):
+        with self._lock:
+            self.not_modified += 1
+
+    def get(self, user_id: str, query_key: str, version: int):
+        """Return the body cached for this version, or None."""
+        with self._lock:
+            entry = self._bodies.get((user_id, query_key))
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._bodies.move_to_end((user_id, query_key))
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: str, query_key: str, version: int, body: bytes):
+        """
+        Cache a body computed at `version`. Dropped if the user's uploads
+        changed while it was being computed.
+        """
+        with self._lock:
+            if version != self._versions.get(user_id):
+                return
+            self._bodies[(user_id, query_key)] = (version, body)
+            self._bodies.move_to_end((user_id, query_key))
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._bodies),
+                "versions": len(self._versions),
+                "version_reads": self.version_reads,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+
+# Shared by every request in this worker
+upload_listings = UploadListingCache(max_entries=UPLOAD_LISTING_CACHE_SIZE)
+upload_previews = PreviewCache(max_bytes=PREVIEW_CACHE_BYTES)
+query_results = ResultCache(
+    max_bytes=RESULT_CACHE_BYTES,
+    spill_root=RESULT_CACHE_DIR,
+    spill_max_bytes=RESULT_CACHE_DISK_BYTES,
+)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """True if an If-None-Match header value matches etag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+async def listing_version(user_id: str) -> int:
+    """
+    The user's listing_version: from this worker's cache, or read from
+    user_upload_stats (0 for a user who never uploaded).
+    """
+    version, generation = upload_listings.cached_version(user_id)
+    if version is not None:
+        return version
+    async with get_connection_manager().aread() as conn:
+        cursor = await conn.execute("""
+            SELECT listing_version
+            FROM user_upload_stats
+            WHERE user_id = ?
+        """, [user_id])
+        row = await cursor.fetchone()
+    version = row[0] if row else 0
+    upload_listings.remember_version(user_id, version, generation)
+    return version
+
+
+def invalidate_uploads(user_id: str, upload_ids=()):
+    """
+    Drop this worker's cached responses for a user whose uploads changed:
+    their listings, and the previews and query results of upload_ids.
+    Call after the write has committed.
+    """
+    upload_listings.invalidate(user_id)
+    for upload_id in upload_ids:
+        upload_previews.invalidate(upload_id)
+    if upload_ids:
+        query_results.invalidate(*upload_ids)
+
+
+def publish_upload_changes(conn, user_id: str, upload_ids=()):
+    """
+    Have the other workers invalidate_uploads() once the write
+    transaction of conn commits. A no-op on DuckDB, where this is the
+    only worker.
+    """
+    manager = get_connection_manager()
+    upload_ids = list(upload_ids)
+    for start in range(0, max(len(upload_ids), 1), _IDS_PER_NOTIFICATION):
+        manager.notify(conn, UPLOAD_CHANGES_CHANNEL, json.dumps({
+            "worker": _BOOT_ID,
+            "user_id": user_id,
+            "upload_ids": upload_ids[start:start + _IDS_PER_NOTIFICATION],
+        }))
+
+
+def _apply_upload_changes(payload: str):
+    change = json.loads(payload)
+    # This worker invalidated its own caches after the commit
+    if change["worker"] != _BOOT_ID:
+        invalidate_uploads(change["user_id"], change["upload_ids"])
+
+
+def _clear_upload_caches():
+    # Changes may have been missed while not listening
+    upload_listings.clear()
+    upload_previews.clear()
+    query_results.clear()
+
+
+async def listen_for_upload_changes():
+    """
+    Apply other workers' upload changes to this worker's caches until
+    cancelled, dropping everything cached each time the listener
+    (re)connects.
+    """
+    await get_connection_manager().listen(
+        UPLOAD_CHANGES_CHANNEL, _apply_upload_changes, reset=_clear_upload_caches
+    )
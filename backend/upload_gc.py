@@ -0,0 +1,313 @@
+"""
+Upload deletion and storage garbage collection.
+Deleting an upload only marks its row (deleted_at): it disappears from
+listings, reads and queries at once and the upload statistics are updated,
+but no file is touched inside the request. A background task then purges
+marked uploads in batches, dropping their rows and file references.
+
+A file nothing refers to any more (and its preview) is moved into a trash
+directory in the same write transaction that dropped its last reference,
+so a new upload of the same content, which is published under the same
+content-addressed path, can never lose its file to the collector. Moving
+is a rename on the same volume; the slow part, removing trashed files and
+dataset directories, happens afterwards at a bounded rate on the storage
+threads.
+
+In a backend that can't rename (S3), files are never moved: each upload's
+file keeps the unique key it was converted to, so nothing can be published
+again at a key being collected, and unreferenced files are deleted right
+after the transaction instead.
+
+Every so often the task also reconciles the uploads directory against the
+database: files no row refers to (left by a crash, or a failed conversion)
+are trashed once older than a grace period, and live uploads whose file
+is missing are reported.
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from pyarrow.fs import FileType
+from database import get_connection_manager, get_trash_directory
+from previews import preview_path_for
+from storage import get_storage
+from upload_summary import record_deletes
+
+_PREVIEW_SUFFIX = ".preview.arrow"
+
+# Counters for /health/metrics; updated only by the collector task
+gc_stats = {
+    "purged_uploads": 0,
+    "trashed_files": 0,
+    "removed_files": 0,
+    "orphan_files": 0,
+    "missing_files": 0,
+    "last_run": None,
+    "last_reconcile": None,
+}
+
+
+def soft_delete_uploads(conn, user_id: str, upload_ids: list) -> list:
+    """
+    Mark the user's uploads deleted, inside the caller's write transaction.
+
+    Args:
+        conn: Cursor from get_connection_manager().write()
+        user_id: Owner of the uploads; others' uploads are left alone
+        upload_ids: Uploads to delete
+
+    Returns:
+        The upload ids that were deleted (not already deleted or unknown)
+    """
+    if not upload_ids:
+        return []
+    placeholders = ", ".join("?" for _ in upload_ids)
+    rows = conn.execute(f"""
+        UPDATE uploads
+        SET deleted_at = ?
+        WHERE user_id = ? AND deleted_at IS NULL AND upload_id IN ({placeholders})
+        RETURNING upload_id, row_count, uploaded_at
+    """, [datetime.now(), user_id, *upload_ids]).fetchall()
+    record_deletes(conn, user_id, [(row_count, uploaded_at) for _, row_count, uploaded_at in rows])
+    return [row[0] for row in rows]
+
+
+def _trash(paths: list, moved: list):
+    # Rename each file or directory into the trash, recording (from, to)
+    # so a failed transaction can put them back. Local storage only.
+    storage = get_storage()
+    trash = get_trash_directory()
+    for path in paths:
+        for source in (path, preview_path_for(path)):
+            if storage.exists(source):
+                target = trash / f"{uuid.uuid4().hex}-{source.name}"
+                storage.replace(source, target)
+                moved.append((source, target))
+
+
+def _restore(moved: list):
+    storage = get_storage()
+    for source, target in reversed(moved):
+        storage.replace(target, source)
+
+
+def _collect(paths: list, moved: list):
+    # Inside the write transaction, before the commit
+    storage = get_storage()
+    if storage.supports_rename:
+        _trash([storage.resolve(path) for path in paths], moved)
+
+
+def _delete_collected(paths: list) -> int:
+    # After the commit, for backends that didn't trash them
+    storage = get_storage()
+    if storage.supports_rename:
+        return 0
+    for path in paths:
+        storage.remove_upload(path)
+    return len(paths)
+
+
+def purge_deleted_uploads(older_than: datetime, batch_size: int) -> int:
+    """
+    Drop up to batch_size uploads marked deleted before older_than, and
+    trash (or delete) the files no longer referenced. Blocking.
+
+    Returns:
+        Number of uploads purged
+    """
+    moved = []
+    try:
+        with get_connection_manager().write() as conn:
+            # Deleting the rows first claims them, so collectors in other
+            # workers never release the same references
+            rows = conn.execute("""
+                DELETE FROM uploads
+                WHERE upload_id IN (
+                    SELECT upload_id
+                    FROM uploads
+                    WHERE deleted_at IS NOT NULL AND deleted_at < ?
+                    ORDER BY deleted_at
+                    LIMIT ?
+                )
+                RETURNING upload_id, user_id, content_hash, parquet_path
+            """, [older_than, batch_size]).fetchall()
+            if not rows:
+                return 0
+
+            unreferenced = []
+            for _, user_id, content_hash, parquet_path in rows:
+                if content_hash is None:
+                    # Uploaded before files were shared
+                    unreferenced.append(parquet_path)
+                    continue
+                blob = conn.execute("""
+                    UPDATE upload_blobs
+                    SET ref_count = ref_count - 1
+                    WHERE user_id = ? AND content_hash = ?
+                    RETURNING ref_count, parquet_path
+                """, [user_id, content_hash]).fetchone()
+                if blob is not None and blob[0] == 0:
+                    conn.execute("""
+                        DELETE FROM upload_blobs
+                        WHERE user_id = ? AND content_hash = ?
+                    """, [user_id, content_hash])
+                    unreferenced.append(blob[1])
+
+            upload_ids = [row[0] for row in rows]
+            placeholders = ", ".join("?" for _ in upload_ids)
+            conn.execute(f"DELETE FROM upload_column_stats WHERE upload_id IN ({placeholders})", upload_ids)
+
+            # Last, so nothing fails between the moves and the commit
+            _collect(unreferenced, moved)
+    except BaseException:
+        _restore(moved)
+        raise
+
+    gc_stats["purged_uploads"] += len(rows)
+    gc_stats["trashed_files"] += len(moved)
+    gc_stats["removed_files"] += _delete_collected(unreferenced)
+    return len(rows)
+
+
+def _owner_path(entry) -> str:
+    # The Parquet location a file in a user's directory belongs to, if any
+    entry = str(entry)
+    if entry.endswith(_PREVIEW_SUFFIX):
+        return entry[:-len(_PREVIEW_SUFFIX)] + ".parquet"
+    if entry.endswith(".parquet"):
+        return entry
+    return None
+
+
+def _referenced(conn) -> set:
+    # Locations referred to by any upload or blob, however they were stored
+    storage = get_storage()
+    rows = conn.execute("""
+        SELECT parquet_path FROM uploads
+        UNION
+        SELECT parquet_path FROM upload_blobs
+    """).fetchall()
+    return {str(storage.resolve(row[0])) for row in rows}
+
+
+def reconcile_storage(orphan_grace: float) -> dict:
+    """
+    Trash files in the uploads directory that nothing refers to and that
+    are older than orphan_grace seconds, and count live uploads whose file
+    is missing. Blocking.
+
+    Returns:
+        dict with orphan_files (trashed) and missing_files
+    """
+    with get_connection_manager().read() as conn:
+        referenced = _referenced(conn)
+        live = [row[0] for row in conn.execute("""
+            SELECT DISTINCT parquet_path FROM uploads WHERE deleted_at IS NULL
+        """).fetchall()]
+
+    storage = get_storage()
+    cutoff = time.time() - orphan_grace
+    candidates = set()
+    for user_dir, info in storage.listdir(storage.uri()):
+        if info.type != FileType.Directory:
+            continue
+        for entry, info in storage.listdir(user_dir):
+            owner = _owner_path(entry)
+            if owner is None or owner in referenced:
+                continue
+            try:
+                # Young files may belong to a conversion not yet recorded
+                if storage.modified(entry, info) < cutoff:
+                    candidates.add(owner)
+            except FileNotFoundError:
+                continue
+
+    moved = []
+    orphans = []
+    if candidates:
+        try:
+            with get_connection_manager().write() as conn:
+                # An upload may have claimed one since the listing
+                orphans = sorted(candidates - _referenced(conn))
+                _collect(orphans, moved)
+        except BaseException:
+            _restore(moved)
+            raise
+        gc_stats["removed_files"] += _delete_collected(orphans)
+
+    missing = [path for path in live if not storage.exists(path)]
+    for path in missing[:10]:
+        print(f"⚠ Upload file missing: {path}")
+
+    gc_stats["orphan_files"] += len(orphans)
+    gc_stats["trashed_files"] += len(moved)
+    gc_stats["missing_files"] = len(missing)
+    return {"orphan_files": len(orphans), "missing_files": len(missing)}
+
+
+async def empty_trash(delete_rate: float) -> int:
+    """
+    Remove everything in the trash, at most delete_rate entries per
+    second, each on the storage threads.
+
+    Returns:
+        Number of entries removed
+    """
+    storage = get_storage()
+    entries = await storage.alistdir(get_trash_directory())
+    for entry, _ in entries:
+        await storage.aremove(entry)
+        gc_stats["removed_files"] += 1
+        await asyncio.sleep(1 / delete_rate)
+    return len(entries)
+
+
+async def run_storage_gc(
+    interval: float,
+    grace: float,
+    batch_size: int,
+    delete_rate: float,
+    reconcile_interval: float,
+    orphan_grace: float,
+):
+    """
+    Purge deleted uploads and empty the trash every interval seconds, and
+    reconcile storage every reconcile_interval seconds, until cancelled.
+
+    Args:
+        interval: Seconds between runs
+        grace: Seconds a deleted upload is kept before purging, so reads
+            already streaming its file can finish
+        batch_size: Uploads purged per write transaction
+        delete_rate: Trashed files or directories removed per second
+        reconcile_interval: Seconds between storage reconciliations
+        orphan_grace: Age in seconds before an unreferenced file is an orphan
+    """
+    last_reconcile = 0.0
+    while True:
+        try:
+            older_than = datetime.now() - timedelta(seconds=grace)
+            purged = 0
+            while True:
+                batch = await asyncio.to_thread(purge_deleted_uploads, older_than, batch_size)
+                purged += batch
+                if batch < batch_size:
+                    break
+
+            if time.monotonic() - last_reconcile >= reconcile_interval:
+                result = await asyncio.to_thread(reconcile_storage, orphan_grace)
+                last_reconcile = time.monotonic()
+                gc_stats["last_reconcile"] = datetime.now().isoformat()
+                if result["orphan_files"] or result["missing_files"]:
+                    print(f"Storage reconcile: {result['orphan_files']} orphan file(s) trashed, "
+                          f"{result['missing_files']} upload file(s) missing")
+
+            removed = await empty_trash(delete_rate)
+            if purged or removed:
+                print(f"Purged {purged} deleted upload(s), removed {removed} file(s)")
+            gc_stats["last_run"] = datetime.now().isoformat()
+        except Exception as e:
+            print(f"Storage garbage collection failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,194 @@
+"""
+Query building for reads over uploaded Parquet files.
+Turns column selections, filters and sorting from the API into a single
+parameterized DuckDB query over read_parquet(), so projection and
+predicates are pushed into the Parquet scan and only the needed columns
+and row groups are read (over S3, only those byte ranges are fetched).
+Uploads stored as partitioned datasets (see datasets.py) are scanned with
+Hive partitioning, so filters on the partition column also skip whole
+files.
+"""
+
+import pyarrow as pa
+from datasets import dataset_glob, dataset_schema, is_dataset
+from storage import get_storage
+
+# filter=<column>:<op>:<value>
+FILTER_OPERATORS = {
+    "eq": "{col} = CAST(? AS {type})",
+    "ne": "{col} <> CAST(? AS {type})",
+    "lt": "{col} < CAST(? AS {type})",
+    "le": "{col} <= CAST(? AS {type})",
+    "gt": "{col} > CAST(? AS {type})",
+    "ge": "{col} >= CAST(? AS {type})",
+    "contains": "contains(CAST({col} AS VARCHAR), ?)",
+    "startswith": "starts_with(CAST({col} AS VARCHAR), ?)",
+    "isnull": "{col} IS NULL",
+    "notnull": "{col} IS NOT NULL",
+}
+# Operators that take no value (filter=<column>:isnull)
+UNARY_OPERATORS = ("isnull", "notnull")
+
+
+class QueryError(ValueError):
+    """Raised for an invalid column, filter or sort in a data query."""
+
+
+def resolve_parquet_path(parquet_path: str):
+    """
+    Location of an upload's Parquet file: an absolute Path on local disk,
+    or the URI of an object (see storage.Storage.resolve).
+    """
+    return get_storage().resolve(parquet_path)
+
+
+def _dataset_schema(path):
+    # (schema, partition columns) of a dataset, or None for a single file
+    filesystem, native_path = get_storage().locate(path)
+    if not is_dataset(native_path, filesystem):
+        return None
+    return dataset_schema(native_path, filesystem)
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def duckdb_type(data_type: pa.DataType) -> str:
+    """DuckDB type name for an Arrow type (VARCHAR for anything unusual)."""
+    if pa.types.is_dictionary(data_type) or pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return "VARCHAR"
+    if pa.types.is_timestamp(data_type):
+        return "TIMESTAMP"
+    if pa.types.is_date(data_type):
+        return "DATE"
+    return {
+        pa.bool_(): "BOOLEAN",
+        pa.int8(): "TINYINT",
+        pa.int16(): "SMALLINT",
+        pa.int32(): "INTEGER",
+        pa.int64(): "BIGINT",
+        pa.uint8(): "UTINYINT",
+        pa.uint16(): "USMALLINT",
+        pa.uint32(): "UINTEGER",
+        pa.uint64(): "UBIGINT",
+        pa.float32(): "FLOAT",
+        pa.float64(): "DOUBLE",
+    }.get(data_type, "VARCHAR")
+
+
+def parquet_source(path):
+    """
+    read_parquet() call for an upload's Parquet file or dataset directory
+    (a path or URI).
+
+    Returns:
+        (SQL table function, its parameters)
+    """
+    dataset = _dataset_schema(path)
+    if dataset is None:
+        return "read_parquet(?)", [str(path)]
+
+    schema, partition_by = dataset
+    source = "read_parquet(?, hive_partitioning = true"
+    if partition_by:
+        # Partition values keep their column's type instead of being guessed
+        hive_types = ", ".join(
+            "'{}': '{}'".format(name.replace("'", "''"), duckdb_type(schema.field(name).type))
+            for name in partition_by
+        )
+        source += f", hive_types = {{{hive_types}}}"
+    return source + ")", [dataset_glob(path)]
+
+
+def describe_parquet(conn, path) -> dict:
+    """
+    Column names and DuckDB types of a Parquet file or dataset, read from
+    its footer(s).
+
+    Returns:
+        dict of column name -> DuckDB type name, in file order
+    """
+    source, params = parquet_source(path)
+    rows = conn.execute(f"DESCRIBE SELECT * FROM {source}", params).fetchall()
+    column_types = {row[0]: row[1] for row in rows}
+    dataset = _dataset_schema(path)
+    if dataset is not None:
+        # DuckDB puts partition columns last; restore the upload's order
+        column_types = {name: column_types[name] for name in dataset[0].names}
+    return column_types
+
+
+def build_rows_query(
+    path,
+    column_types: dict,
+    columns: list = None,
+    filters: list = None,
+    sort: list = None,
+    limit: int = 100,
+    offset: int = 0,
+):
+    """
+    Build a parameterized SELECT over one upload's Parquet file or dataset.
+
+    Args:
+        path: Parquet file or dataset directory (passed as a parameter,
+            never interpolated)
+        column_types: Result of describe_parquet() for the file
+        columns: Columns to return (default: all)
+        filters: "<column>:<op>:<value>" strings, combined with AND
+        sort: Column names, prefixed with "-" for descending
+        limit: Maximum rows
+        offset: Rows to skip
+
+    Returns:
+        (sql, params, selected column names)
+
+    Raises:
+        QueryError: If a column, operator or sort key is invalid
+    """
+    def column(name):
+        if name not in column_types:
+            raise QueryError(f"Unknown column: {name}")
+        return quote_identifier(name)
+
+    selected = columns or list(column_types)
+    select_list = ", ".join(column(name) for name in selected)
+
+    source, params = parquet_source(path)
+    conditions = []
+    for spec in filters or []:
+        name, _, rest = spec.partition(":")
+        op, _, value = rest.partition(":")
+        if op not in FILTER_OPERATORS:
+            raise QueryError(
+                f"Invalid filter '{spec}': expected <column>:<op>[:<value>] with op one of "
+                + ", ".join(FILTER_OPERATORS)
+            )
+        conditions.append(FILTER_OPERATORS[op].format(col=column(name), type=column_types[name]))
+        if op not in UNARY_OPERATORS:
+            params.append(value)
+
+    order_by = []
+    for key in sort or []:
+        descending = key.startswith("-")
+        name = key[1:] if descending else key
+        order_by.append(f"{column(name)} {'DESC' if descending else 'ASC'}")
+
+    sql = f"SELECT {select_list} FROM {source}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if order_by:
+        sql += " ORDER BY " + ", ".join(order_by)
+    sql += " LIMIT ? OFFSET ?"
+    params.extend([limit, offset])
+
+    return sql, params, selected
+
+
+def record_batch_reader(result, batch_size: int):
+    """Arrow RecordBatchReader over an executed DuckDB query."""
+    # to_arrow_reader replaces fetch_record_batch in newer DuckDB releases
+    if hasattr(result, "to_arrow_reader"):
+        return result.to_arrow_reader(batch_size)
+    return result.fetch_record_batch(batch_size)
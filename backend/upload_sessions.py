@@ -0,0 +1,262 @@
+"""
+Resumable upload sessions.
+A client creates a session for a file of known size, then sends it in
+fixed-size chunks, each at the offset the server has committed so far.
+Chunks are written into a spool file at their offset, so a chunk that is
+retried after a dropped connection simply overwrites itself. Once every
+byte has arrived the session is committed and the spool file goes through
+the normal CSV → Parquet ingest.
+
+Session state lives in the upload_sessions table; a background task
+removes sessions (and their spool files) that stop receiving chunks.
+Spool files are on local disk, so with several API nodes the spool
+directory must be shared, or a session's requests sent to one node. Any
+node may expire a session, so each node also sweeps its own spool
+directory for files whose session is gone.
+"""
+
+import asyncio
+import base64
+import hashlib
+import threading
+import uuid
+from datetime import datetime, timedelta
+from database import get_connection_manager, get_spool_directory
+
+# Upload-Checksum algorithms accepted for chunks
+CHECKSUM_ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "sha1": hashlib.sha1,
+    "md5": hashlib.md5,
+}
+
+# Serializes chunk writes per session (striped by session ID)
+_CHUNK_LOCKS = [threading.Lock() for _ in range(64)]
+
+SESSION_COLUMNS = "session_id, user_id, filename, total_bytes, committed_bytes, status, created_at, updated_at"
+
+
+class ChunkError(ValueError):
+    """Raised for a chunk that cannot be accepted (offset, size or checksum)."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def spool_path_for(session_id: str):
+    """Spool file receiving a session's chunks."""
+    return get_spool_directory() / f"session-{session_id}.csv"
+
+
+def _session_dict(row) -> dict:
+    return dict(zip(SESSION_COLUMNS.split(", "), row))
+
+
+def create_session(user_id: str, filename: str, total_bytes: int) -> dict:
+    """Start a session and create its empty spool file."""
+    session_id = str(uuid.uuid4())
+    now = datetime.now()
+    spool_path_for(session_id).touch()
+    with get_connection_manager().write() as conn:
+        row = conn.execute(f"""
+            INSERT INTO upload_sessions (
+                session_id, user_id, filename, total_bytes,
+                committed_bytes, status, created_at, updated_at
+            ) VALUES (?, ?, ?, ?, 0, 'open', ?, ?)
+            RETURNING {SESSION_COLUMNS}
+        """, [session_id, user_id, filename, total_bytes, now, now]).fetchone()
+    return _session_dict(row)
+
+
+def get_session(session_id: str, user_id: str):
+    """Return the user's session, or None."""
+    with get_connection_manager().read() as conn:
+        row = conn.execute(f"""
+            SELECT {SESSION_COLUMNS}
+            FROM upload_sessions
+            WHERE session_id = ? AND user_id = ?
+        """, [session_id, user_id]).fetchone()
+    return _session_dict(row) if row else None
+
+
+def verify_checksum(header: str, chunk: bytes):
+    """
+    Check a chunk against an Upload-Checksum header ("<algorithm> <base64 digest>").
+
+    Raises:
+        ChunkError: If the header is malformed or the digest doesn't match
+    """
+    algorithm, _, encoded = header.strip().partition(" ")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ChunkError(
+            f"Unsupported checksum algorithm '{algorithm}', expected one of "
+            + ", ".join(CHECKSUM_ALGORITHMS)
+        )
+    try:
+        expected = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise ChunkError("Upload-Checksum digest must be base64")
+    if CHECKSUM_ALGORITHMS[algorithm](chunk).digest() != expected:
+        raise ChunkError("Checksum mismatch", status_code=460)
+
+
+def write_chunk(session_id: str, offset: int, chunk: bytes, chunk_size: int) -> int:
+    """
+    Write a chunk at its offset and commit the new offset.
+    Blocking; call from a worker thread.
+
+    Returns:
+        The session's committed offset after the chunk
+
+    Raises:
+        ChunkError: 409 if offset is not the committed offset or the
+            session is being committed, 400 for a chunk of the wrong size,
+            404 if the session no longer exists
+    """
+    # Concurrent writers of one session take turns, so a losing request
+    # never overwrites bytes that were already committed
+    with _CHUNK_LOCKS[hash(session_id) % len(_CHUNK_LOCKS)]:
+        with get_connection_manager().read() as conn:
+            row = conn.execute("""
+                SELECT total_bytes, committed_bytes, status
+                FROM upload_sessions
+                WHERE session_id = ?
+            """, [session_id]).fetchone()
+
+        if not row:
+            raise ChunkError("Upload session not found", status_code=404)
+        total_bytes, committed_bytes, status = row
+        remaining = total_bytes - committed_bytes
+        if status != "open":
+            raise ChunkError("Upload session is being committed", status_code=409)
+        if offset != committed_bytes:
+            raise ChunkError(
+                f"Chunk offset {offset} does not match the committed offset {committed_bytes}",
+                status_code=409
+            )
+        if len(chunk) != min(chunk_size, remaining):
+            raise ChunkError(
+                f"Chunk must be exactly {min(chunk_size, remaining)} bytes"
+                + (" (the final chunk)" if remaining < chunk_size else "")
+            )
+
+        with open(spool_path_for(session_id), "r+b") as spool:
+            spool.seek(offset)
+            spool.write(chunk)
+            spool.truncate()
+
+        # Only from the offset read above: the lock doesn't cover other
+        # workers
+        with get_connection_manager().write() as conn:
+            row = conn.execute("""
+                UPDATE upload_sessions
+                SET committed_bytes = ?, updated_at = ?
+                WHERE session_id = ? AND committed_bytes = ? AND status = 'open'
+                RETURNING session_id
+            """, [offset + len(chunk), datetime.now(), session_id, offset]).fetchone()
+        if row is None:
+            raise ChunkError(f"Chunk offset {offset} was committed concurrently", status_code=409)
+
+    return offset + len(chunk)
+
+
+def claim_for_commit(session_id: str, user_id: str) -> bool:
+    """Mark a complete session as committing; False if it isn't complete and open."""
+    with get_connection_manager().write() as conn:
+        row = conn.execute("""
+            UPDATE upload_sessions
+            SET status = 'committing', updated_at = ?
+            WHERE session_id = ? AND user_id = ?
+                AND status = 'open' AND committed_bytes = total_bytes
+            RETURNING session_id
+        """, [datetime.now(), session_id, user_id]).fetchone()
+    return row is not None
+
+
+def reopen_session(session_id: str):
+    """Return a session claimed for commit to open, so the commit can be retried."""
+    with get_connection_manager().write() as conn:
+        conn.execute("""
+            UPDATE upload_sessions
+            SET status = 'open', updated_at = ?
+            WHERE session_id = ?
+        """, [datetime.now(), session_id])
+
+
+def delete_session(session_id: str, keep_spool: bool = False):
+    """
+    Remove a session, and its spool file unless keep_spool. A kept spool
+    file is touched, so the spool sweep leaves it to its new owner for
+    another ttl.
+    """
+    with get_connection_manager().write() as conn:
+        conn.execute("DELETE FROM upload_sessions WHERE session_id = ?", [session_id])
+    if keep_spool:
+        spool_path_for(session_id).touch()
+    else:
+        spool_path_for(session_id).unlink(missing_ok=True)
+
+
+def collect_stale_sessions(ttl: float) -> int:
+    """
+    Delete sessions that have not changed for ttl seconds, with their
+    spool files, then sweep the spool directory for files of sessions
+    that another node expired.
+
+    Returns:
+        Number of sessions removed
+    """
+    cutoff = datetime.now() - timedelta(seconds=ttl)
+    with get_connection_manager().write() as conn:
+        rows = conn.execute("""
+            DELETE FROM upload_sessions
+            WHERE updated_at < ?
+            RETURNING session_id
+        """, [cutoff]).fetchall()
+    for (session_id,) in rows:
+        spool_path_for(session_id).unlink(missing_ok=True)
+    _sweep_spool_directory(cutoff)
+    return len(rows)
+
+
+def _sweep_spool_directory(cutoff: datetime):
+    """
+    Remove session spool files last written before cutoff whose session
+    no longer exists. Newer files are left alone: a session's file is
+    created before its row, and a committed session's file outlives its
+    row while the background job converts it.
+    """
+    candidates = {}
+    for path in get_spool_directory().glob("session-*.csv"):
+        try:
+            if datetime.fromtimestamp(path.stat().st_mtime) < cutoff:
+                candidates[path.stem[len("session-"):]] = path
+        except FileNotFoundError:
+            continue
+    if not candidates:
+        return
+
+    placeholders = ", ".join("?" for _ in candidates)
+    with get_connection_manager().read() as conn:
+        live = {
+            row[0] for row in conn.execute(f"""
+                SELECT session_id FROM upload_sessions
+                WHERE session_id IN ({placeholders})
+            """, list(candidates)).fetchall()
+        }
+    for session_id, path in candidates.items():
+        if session_id not in live:
+            path.unlink(missing_ok=True)
+
+
+async def run_session_gc(interval: float, ttl: float):
+    """Collect stale sessions every interval seconds until cancelled."""
+    while True:
+        try:
+            removed = await asyncio.to_thread(collect_stale_sessions, ttl)
+            if removed:
+                print(f"Removed {removed} stale upload session(s)")
+        except Exception as e:
+            print(f"Upload session cleanup failed: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,247 @@
+"""
+Materialized upload statistics.
+user_upload_stats holds, per user, the running count of uploads, the sum
+of their rows and the first and last upload time; global_upload_stats
+holds the same over everyone, in a single row. Upload and delete keep them
+current inside their own write transaction, so reading stats is a primary
+key lookup rather than a scan of uploads.
+
+Counts and sums are adjusted by the rows written or deleted. A minimum or
+maximum only changes on delete when the deleted upload was the extreme,
+and only then is it recomputed from the uploads not marked deleted.
+rebuild_summaries() recomputes everything in bulk, e.g. after uploads
+were edited by hand.
+
+user_upload_stats also holds each user's listing_version, bumped by every
+change to their uploads in the same transaction; it is the version behind
+the upload listing's ETag in every worker (see upload_cache).
+"""
+
+# Key of the single global_upload_stats row
+_GLOBAL_ID = 1
+
+SUMMARY_COLUMNS = ["total_uploads", "total_rows", "first_upload", "last_upload"]
+
+
+def create_summary_tables(conn):
+    """Create the summary tables if they don't exist."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_upload_stats (
+            user_id VARCHAR PRIMARY KEY,
+            total_uploads BIGINT NOT NULL,
+            total_rows BIGINT NOT NULL,
+            first_upload TIMESTAMP,
+            last_upload TIMESTAMP
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS global_upload_stats (
+            id INTEGER PRIMARY KEY,
+            total_uploads BIGINT NOT NULL,
+            total_rows BIGINT NOT NULL,
+            first_upload TIMESTAMP,
+            last_upload TIMESTAMP
+        )
+    """)
+
+
+def add_listing_versions(conn):
+    """Add listing_version to user_upload_stats if it doesn't have it."""
+    conn.execute("ALTER TABLE user_upload_stats ADD COLUMN IF NOT EXISTS listing_version BIGINT DEFAULT 0")
+
+
+def _has_listing_versions(conn) -> bool:
+    # Migration 6 rebuilds the summaries before migration 7 adds the column
+    return conn.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = current_schema()
+            AND table_name = 'user_upload_stats' AND column_name = 'listing_version'
+    """).fetchone()[0] > 0
+
+
+def _totals(uploads):
+    # uploads: (row_count, uploaded_at) pairs
+    times = [uploaded_at for _, uploaded_at in uploads]
+    return len(uploads), sum(row_count or 0 for row_count, _ in uploads), min(times), max(times)
+
+
+def record_uploads(conn, user_id: str, uploads: list):
+    """
+    Add new uploads to the summaries.
+    Call inside the write transaction that inserted them.
+
+    Args:
+        conn: Cursor from get_connection_manager().write()
+        user_id: Owner of the uploads
+        uploads: (row_count, uploaded_at) of each new upload
+    """
+    if not uploads:
+        return
+    totals = _totals(uploads)
+    conn.execute("""
+        INSERT INTO user_upload_stats (user_id, total_uploads, total_rows, first_upload, last_upload, listing_version)
+        VALUES (?, ?, ?, ?, ?, 1)
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_uploads = user_upload_stats.total_uploads + excluded.total_uploads,
+            total_rows = user_upload_stats.total_rows + excluded.total_rows,
+            first_upload = least(user_upload_stats.first_upload, excluded.first_upload),
+            last_upload = greatest(user_upload_stats.last_upload, excluded.last_upload),
+            listing_version = user_upload_stats.listing_version + 1
+    """, [user_id, *totals])
+    conn.execute("""
+        INSERT INTO global_upload_stats (id, total_uploads, total_rows, first_upload, last_upload)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            total_uploads = global_upload_stats.total_uploads + excluded.total_uploads,
+            total_rows = global_upload_stats.total_rows + excluded.total_rows,
+            first_upload = least(global_upload_stats.first_upload, excluded.first_upload),
+            last_upload = greatest(global_upload_stats.last_upload, excluded.last_upload)
+    """, [_GLOBAL_ID, *totals])
+
+
+def record_deletes(conn, user_id: str, uploads: list):
+    """
+    Remove deleted uploads from the summaries.
+    Call inside the write transaction, after their uploads rows are marked
+    deleted.
+
+    Args:
+        conn: Cursor from get_connection_manager().write()
+        user_id: Owner of the uploads
+        uploads: (row_count, uploaded_at) of each deleted upload
+    """
+    if not uploads:
+        return
+    count, rows, first, last = _totals(uploads)
+    for table, key_column, key, scope, bump in [
+        ("user_upload_stats", "user_id", user_id, "AND user_id = ?", ", listing_version = listing_version + 1"),
+        ("global_upload_stats", "id", _GLOBAL_ID, "", ""),
+    ]:
+        extremes = conn.execute(f"""
+            UPDATE {table}
+            SET total_uploads = total_uploads - ?,
+                total_rows = total_rows - ?{bump}
+            WHERE {key_column} = ?
+            RETURNING first_upload, last_upload
+        """, [count, rows, key]).fetchone()
+        if extremes is None:
+            continue
+
+        # Only a deleted extreme needs a scan of what is left
+        recompute = []
+        if extremes[0] is None or first <= extremes[0]:
+            recompute.append(f"first_upload = (SELECT MIN(uploaded_at) FROM uploads WHERE deleted_at IS NULL {scope})")
+        if extremes[1] is None or last >= extremes[1]:
+            recompute.append(f"last_upload = (SELECT MAX(uploaded_at) FROM uploads WHERE deleted_at IS NULL {scope})")
+        if recompute:
+            params = [user_id] * len(recompute) if scope else []
+            conn.execute(f"""
+                UPDATE {table}
+                SET {", ".join(recompute)}
+                WHERE {key_column} = ?
+            """, [*params, key])
+
+
+def rebuild_summaries(conn) -> dict:
+    """
+    Recompute both summary tables from the uploads not marked deleted.
+    Call inside a write transaction.
+
+    Returns:
+        dict with users (users with uploads) and drifted (users, plus the
+        global row, whose stored stats were wrong)
+    """
+    drifted = conn.execute("""
+        WITH actual AS (
+            SELECT user_id, COUNT(*) AS total_uploads, COALESCE(SUM(row_count), 0) AS total_rows,
+                   MIN(uploaded_at) AS first_upload, MAX(uploaded_at) AS last_upload
+            FROM uploads
+            WHERE deleted_at IS NULL
+            GROUP BY user_id
+        )
+        SELECT COUNT(*)
+        FROM actual
+        FULL OUTER JOIN user_upload_stats stored USING (user_id)
+        -- A stored row of zeros stands for a user with no uploads left
+        WHERE COALESCE(stored.total_uploads, 0) <> COALESCE(actual.total_uploads, 0)
+           OR COALESCE(stored.total_rows, 0) <> COALESCE(actual.total_rows, 0)
+           OR stored.first_upload IS DISTINCT FROM actual.first_upload
+           OR stored.last_upload IS DISTINCT FROM actual.last_upload
+    """).fetchone()[0]
+    global_drifted = conn.execute("""
+        SELECT COUNT(*)
+        FROM (
+            SELECT COUNT(*) AS total_uploads, COALESCE(SUM(row_count), 0) AS total_rows,
+                   MIN(uploaded_at) AS first_upload, MAX(uploaded_at) AS last_upload
+            FROM uploads
+            WHERE deleted_at IS NULL
+        ) actual
+        LEFT JOIN global_upload_stats stored ON stored.id = ?
+        WHERE COALESCE(stored.total_uploads, 0) <> actual.total_uploads
+           OR COALESCE(stored.total_rows, 0) <> actual.total_rows
+           OR stored.first_upload IS DISTINCT FROM actual.first_upload
+           OR stored.last_upload IS DISTINCT FROM actual.last_upload
+    """, [_GLOBAL_ID]).fetchone()[0]
+
+    # Rows are updated in place so listing versions only ever go up;
+    # they are bumped too, in case uploads were edited by hand
+    versioned = _has_listing_versions(conn)
+    conn.execute(f"""
+        UPDATE user_upload_stats
+        SET total_uploads = 0, total_rows = 0, first_upload = NULL, last_upload = NULL
+            {", listing_version = listing_version + 1" if versioned else ""}
+    """)
+    conn.execute(f"""
+        INSERT INTO user_upload_stats (
+            user_id, total_uploads, total_rows, first_upload, last_upload
+            {", listing_version" if versioned else ""}
+        )
+        SELECT user_id, COUNT(*), COALESCE(SUM(row_count), 0), MIN(uploaded_at), MAX(uploaded_at)
+            {", 1" if versioned else ""}
+        FROM uploads
+        WHERE deleted_at IS NULL
+        GROUP BY user_id
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_uploads = excluded.total_uploads,
+            total_rows = excluded.total_rows,
+            first_upload = excluded.first_upload,
+            last_upload = excluded.last_upload
+    """)
+    conn.execute("DELETE FROM global_upload_stats")
+    conn.execute("""
+        INSERT INTO global_upload_stats
+        SELECT ?, COUNT(*), COALESCE(SUM(row_count), 0), MIN(uploaded_at), MAX(uploaded_at)
+        FROM uploads
+        WHERE deleted_at IS NULL
+    """, [_GLOBAL_ID])
+
+    users = conn.execute("SELECT COUNT(*) FROM user_upload_stats WHERE total_uploads > 0").fetchone()[0]
+    return {"users": users, "drifted": drifted + global_drifted}
+
+
+def read_summary(conn, user_id: str = None) -> dict:
+    """
+    Stats for one user, or everyone if user_id is None.
+
+    Returns:
+        dict with total_uploads, total_rows, avg_rows_per_file, first_upload
+        and last_upload (zero and None when there are no uploads)
+    """
+    if user_id:
+        row = conn.execute("""
+            SELECT total_uploads, total_rows, first_upload, last_upload
+            FROM user_upload_stats
+            WHERE user_id = ?
+        """, [user_id]).fetchone()
+    else:
+        row = conn.execute("""
+            SELECT total_uploads, total_rows, first_upload, last_upload
+            FROM global_upload_stats
+            WHERE id = ?
+        """, [_GLOBAL_ID]).fetchone()
+
+    stats = dict(zip(SUMMARY_COLUMNS, row or (0, 0, None, None)))
+    stats["avg_rows_per_file"] = (
+        stats["total_rows"] / stats["total_uploads"] if stats["total_uploads"] else None
+    )
+    return stats
@@ -8,7 +8,7 @@ import { QueueStatus } from '@/components/upload/queue-status'
 import { UploadsList } from '@/components/upload/uploads-list'
 
 export function FileUpload() {
-  const { uploads, isLoading, error: fetchError, refetch } = useUploads()
+  const { uploads, isLoading, error: fetchError, hasMore, loadMore, refetch } = useUploads()
 
   const {
     currentUpload,
@@ -63,6 +63,8 @@ export function FileUpload() {
         isLoading={isLoading}
         error={fetchError}
         onDelete={refetch}
+        hasMore={hasMore}
+        onLoadMore={loadMore}
       />
     </div>
   )
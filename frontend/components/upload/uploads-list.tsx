@@ -5,15 +5,18 @@ import { Upload } from '@/hooks/use-uploads'
 import { formatTimestamp } from '@/lib/format-utils'
 import { GenerateUI } from '@/components/upload/generate-ui'
 import { DeleteUpload } from '@/components/upload/delete-upload'
+import { Button } from '@/components/ui/button'
 
 interface UploadsListProps {
   uploads: Upload[]
   isLoading: boolean
   error: string | null
   onDelete: () => void
+  hasMore?: boolean
+  onLoadMore?: () => void
 }
 
-export function UploadsList({ uploads, isLoading, error, onDelete }: UploadsListProps) {
+export function UploadsList({ uploads, isLoading, error, onDelete, hasMore, onLoadMore }: UploadsListProps) {
   return (
     <div className="space-y-3">
       <div className="flex items-center justify-between">
@@ -62,6 +65,18 @@ export function UploadsList({ uploads, isLoading, error, onDelete }: UploadsList
               </div>
             </div>
           ))}
+
+          {hasMore && onLoadMore && (
+            <Button
+              variant="ghost"
+              size="sm"
+              className="w-full"
+              onClick={onLoadMore}
+              disabled={isLoading}
+            >
+              Load more
+            </Button>
+          )}
         </div>
       )}
     </div>
@@ -1,5 +1,5 @@
 import { useState } from 'react'
-import { uploadFile } from '@/lib/upload-service'
+import { uploadFile, uploadFiles } from '@/lib/upload-service'
 
 export interface FailedUpload {
   file: File
@@ -28,6 +28,41 @@ export function useUploadQueue({ onSuccess }: UseUploadQueueProps = {}) {
     setFailedUploads([])
     setUploadQueue(filesToUpload)
 
+    // Several files go up in one batch request and are converted in parallel
+    if (filesToUpload.length > 1) {
+      onFileStart(filesToUpload[0])
+      setUploadQueue([])
+
+      try {
+        const results = await uploadFiles(filesToUpload, (progress) => {
+          onFileProgress(progress.percentage)
+        })
+
+        results.forEach((result, index) => {
+          const file = filesToUpload[index]
+          if (result.status_code === 201) {
+            setCompletedUploads(prev => [...prev, file.name])
+            onFileComplete(file)
+          } else {
+            const errorMessage = result.detail || 'Upload failed'
+            setFailedUploads(prev => [...prev, { file, error: errorMessage }])
+            onFileError(file, errorMessage)
+          }
+        })
+
+        if (onSuccess && results.some(result => result.status_code === 201)) {
+          onSuccess()
+        }
+      } catch (err) {
+        const errorMessage = err instanceof Error ? err.message : 'Upload failed'
+        setFailedUploads(filesToUpload.map(file => ({ file, error: errorMessage })))
+        filesToUpload.forEach(file => onFileError(file, errorMessage))
+      }
+
+      setIsProcessing(false)
+      return
+    }
+
     for (const file of filesToUpload) {
       onFileStart(file)
       
@@ -6,34 +6,57 @@ export interface Upload {
   uploaded_at: string
   row_count: number
   column_count: number
-  columns: string[]
+  columns?: string[]
+}
+
+interface UploadsPage {
+  uploads: Upload[]
+  next_cursor: string | null
+}
+
+const PAGE_SIZE = 50
+
+async function fetchUploadsPage(cursor: string | null): Promise<UploadsPage | null> {
+  const params = new URLSearchParams({ limit: String(PAGE_SIZE) })
+  if (cursor) {
+    params.set('cursor', cursor)
+  }
+
+  const response = await fetch(`http://localhost:8000/api/uploads?${params}`, {
+    credentials: 'include',
+  })
+
+  if (!response.ok) {
+    if (response.status === 401) {
+      // Session expired - redirect to login
+      window.location.href = 'http://localhost:8000/signin'
+      return null
+    }
+    throw new Error('Failed to fetch uploads')
+  }
+
+  return response.json()
 }
 
 export function useUploads() {
   const [uploads, setUploads] = useState<Upload[]>([])
+  const [nextCursor, setNextCursor] = useState<string | null>(null)
   const [isLoading, setIsLoading] = useState(true)
   const [error, setError] = useState<string | null>(null)
 
-  const fetchUploads = useCallback(async () => {
+  const loadPage = useCallback(async (cursor: string | null) => {
     setIsLoading(true)
     setError(null)
 
     try {
-      const response = await fetch('http://localhost:8000/api/uploads', {
-        credentials: 'include',
-      })
-
-      if (!response.ok) {
-        if (response.status === 401) {
-          // Session expired - redirect to login
-          window.location.href = 'http://localhost:8000/signin'
-          return
-        }
-        throw new Error('Failed to fetch uploads')
+      const data = await fetchUploadsPage(cursor)
+      if (!data) {
+        return
       }
 
-      const data = await response.json()
-      setUploads(data.uploads)
+      // First page replaces the list, later pages extend it
+      setUploads(prev => (cursor ? [...prev, ...data.uploads] : data.uploads))
+      setNextCursor(data.next_cursor)
     } catch (err) {
       const errorMessage = err instanceof Error ? err.message : 'Failed to fetch uploads'
       setError(errorMessage)
@@ -42,6 +65,14 @@ export function useUploads() {
     }
   }, [])
 
+  const fetchUploads = useCallback(() => loadPage(null), [loadPage])
+
+  const loadMore = useCallback(() => {
+    if (nextCursor) {
+      loadPage(nextCursor)
+    }
+  }, [loadPage, nextCursor])
+
   useEffect(() => {
     fetchUploads()
   }, [fetchUploads])
@@ -50,6 +81,8 @@ export function useUploads() {
     uploads,
     isLoading,
     error,
+    hasMore: nextCursor !== null,
+    loadMore,
     refetch: fetchUploads,
   }
-}
\ No newline at end of file
+}
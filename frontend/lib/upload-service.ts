@@ -60,6 +60,59 @@ export async function uploadFile(
   })
 }
 
+export interface BatchUploadResult {
+  filename: string
+  status_code: number
+  detail?: string
+}
+
+export async function uploadFiles(
+  files: File[],
+  onProgress?: (progress: UploadProgress) => void
+): Promise<BatchUploadResult[]> {
+  return new Promise<BatchUploadResult[]>((resolve, reject) => {
+    const formData = new FormData()
+    files.forEach(file => formData.append('files', file))
+
+    const xhr = new XMLHttpRequest()
+
+    xhr.upload.onprogress = (event) => {
+      if (event.lengthComputable && onProgress) {
+        const percentage = Math.round((event.loaded / event.total) * 100)
+        onProgress({
+          loaded: event.loaded,
+          total: event.total,
+          percentage,
+        })
+      }
+    }
+
+    xhr.onload = () => {
+      try {
+        const result = JSON.parse(xhr.responseText)
+
+        // 201: all stored, 207: per-file results with some failures
+        if (xhr.status === 201 || xhr.status === 207) {
+          resolve(result.data.results)
+        } else {
+          reject(new Error(result.detail || 'Upload failed'))
+        }
+      } catch (err) {
+        const errorMessage = err instanceof Error ? err.message : 'Upload failed'
+        reject(new Error(errorMessage))
+      }
+    }
+
+    xhr.onerror = () => {
+      reject(new Error('Network error occurred'))
+    }
+
+    xhr.open('POST', 'http://localhost:8000/api/upload/batch')
+    xhr.withCredentials = true
+    xhr.send(formData)
+  })
+}
+
 export async function deleteUpload(uploadId: string): Promise<void> {
   const response = await fetch(`http://localhost:8000/api/upload/${uploadId}`, {
     method: 'DELETE',